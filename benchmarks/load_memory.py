@@ -0,0 +1,66 @@
+"""
+Compare peak memory and load time of parsing a `commands.json` in full versus streaming it.
+
+Each mode runs in a fresh process so that peak RSS isn't shared between them.
+
+    python benchmarks/load_memory.py path/to/generated/reports/commands.json
+"""
+
+import argparse
+import json
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+
+from mccq.data_parser.v1_data_parser import V1DataParser
+
+MODES = ('json', 'stream')
+
+
+def run(mode: str, path: str) -> dict:
+    parser = V1DataParser()
+
+    tracemalloc.start()
+    start = time.perf_counter()
+
+    if mode == 'json':
+        with open(path, 'rb') as fp:
+            root = parser.parse(json.load(fp))
+    else:
+        with open(path, 'rb') as fp:
+            root = parser.parse_stream(fp)
+
+    elapsed = time.perf_counter() - start
+    final, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    # max rss is reported in kibibytes on linux
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+    assert root.children
+    return {'mode': mode, 'seconds': elapsed, 'final_bytes': final, 'peak_bytes': peak, 'peak_rss_bytes': rss}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('path', help='path to a commands.json file')
+    parser.add_argument('--mode', choices=MODES, help='run a single mode in this process and print its result as json')
+    args = parser.parse_args()
+
+    if args.mode:
+        print(json.dumps(run(args.mode, args.path)))
+        return
+
+    print(f'{"mode":<8} {"time (s)":>9} {"tree (MiB)":>11} {"peak (MiB)":>11} {"peak rss (MiB)":>15}')
+    for mode in MODES:
+        output = subprocess.check_output([sys.executable, __file__, '--mode', mode, args.path])
+        result = json.loads(output)
+        print(
+            f'{mode:<8} {result["seconds"]:>9.3f} {result["final_bytes"] / 2 ** 20:>11.1f} '
+            f'{result["peak_bytes"] / 2 ** 20:>11.1f} {result["peak_rss_bytes"] / 2 ** 20:>15.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+"""
+Compare the memory used by compact data nodes against eagerly rendered ones for a real `commands.json`.
+
+    python benchmarks/node_memory.py path/to/generated/reports/commands.json
+"""
+
+import argparse
+import gc
+import json
+import tracemalloc
+
+from mccq.data_parser.v1_data_parser import V1DataParser
+from mccq.node.data_node import DataNode
+
+
+class LegacyDataNode:
+    # the previous representation: a `__dict__` per node, with every string rendered up front
+    def __init__(self, node: DataNode, parent: 'LegacyDataNode' = None):
+        self.relevant = node.relevant
+        self.population = node.population
+        self.key = node.key
+        self.command = node.extend_command(parent.command if parent else '', showtypes=False)
+        self.command_t = node.extend_command(parent.command_t if parent else '', showtypes=True)
+        self.argument = node.argument
+        self.argument_t = node.argument_t
+        self._children = tuple(LegacyDataNode(child, self) for child in node.children)
+        self.collapsed = node.get_collapsed(showtypes=False, command=self.command)
+        self.collapsed_t = node.get_collapsed(showtypes=True, command=self.command_t)
+
+
+def count_nodes(node) -> int:
+    return 1 + sum(count_nodes(child) for child in node._children)
+
+
+def measure(build) -> tuple:
+    gc.collect()
+    tracemalloc.start()
+    result = build()
+    gc.collect()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('path', help='path to a commands.json file')
+    args = parser.parse_args()
+
+    with open(args.path) as fp:
+        raw = json.load(fp)
+
+    compact, compact_size = measure(lambda: V1DataParser().parse(raw))
+    legacy, legacy_size = measure(lambda: LegacyDataNode(compact))
+
+    nodes = count_nodes(compact)
+    print(f'nodes:   {nodes}')
+    print(f'legacy:  {legacy_size / 1024:10.1f} KiB ({legacy_size / nodes:6.1f} B/node)')
+    print(f'compact: {compact_size / 1024:10.1f} KiB ({compact_size / nodes:6.1f} B/node)')
+    print(f'ratio:   {legacy_size / compact_size:10.2f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""
+Measure per-query latency of `QueryManager` against a real database.
+
+Compares the current token matcher against the legacy approach of calling `re.search` for every child at every level.
+
+    python benchmarks/query_latency.py -d "https://raw.githubusercontent.com/Arcensoth/mcdata" -s 18w01a
+"""
+
+import argparse
+import re
+import timeit
+import typing
+
+from mccq.node.data_node import DataNode
+from mccq.node.query_node import QueryNode
+from mccq.query_arguments import QueryArguments
+from mccq.query_manager import QueryManager
+from mccq.version_database import VersionDatabase
+
+QUERIES = (
+    'execute',
+    '.',
+    '-e sc.* p.*r.* .*',
+    '-e ^execute$ . . . .',
+)
+
+
+class LegacyQueryManager(QueryManager):
+    def _query_tree_recursive(
+            self, arguments: QueryArguments, node: DataNode, index: int, matchers, graph, memo, redirects: int = 0) \
+            -> typing.Union[QueryNode, None]:
+        # the legacy approach never followed redirects, so the graph, memo and redirect count go unused
+        token = arguments.command[index] if len(arguments.command) > index else None
+
+        search_children = None if not token else node.children if token in ('.', '*') else tuple(
+            child for child in node.children
+            if re.search(token, child.key, re.IGNORECASE)
+        )
+
+        if search_children:
+            query_children = tuple(item for item in (
+                self._query_tree_recursive(arguments, child, index + 1, matchers, graph, memo)
+                for child in search_children
+            ) if item is not None)
+
+            if query_children:
+                return QueryNode(data_node=node, children=query_children)
+
+        elif not token:
+            return QueryNode(data_node=node)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('-d', '--database_uri', required=True, help='the uri from where versions will be loaded')
+    parser.add_argument('-s', '--show_version', required=True, help='which version to query')
+    parser.add_argument('-n', '--number', type=int, default=200, help='how many times to run each query')
+    args = parser.parse_args()
+
+    db = VersionDatabase(uri=args.database_uri)
+    db.get(args.show_version)  # load up front so it doesn't count towards query time
+
+    managers = (
+        ('legacy', LegacyQueryManager(database=db, show_versions=[args.show_version])),
+        ('current', QueryManager(database=db, show_versions=[args.show_version])),
+    )
+
+    print(f'{"query":<24} {"legacy (ms)":>12} {"current (ms)":>12} {"speedup":>8}')
+    for query in QUERIES:
+        timings = []
+        for name, qm in managers:
+            seconds = timeit.timeit(lambda: qm.results(query), number=args.number)
+            timings.append(seconds * 1000 / args.number)
+        legacy, current = timings
+        print(f'{query:<24} {legacy:>12.3f} {current:>12.3f} {legacy / current:>7.2f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""
+Measure how long it takes to match queries through long `execute` chains, with and without memoized redirects.
+
+Every `execute` subcommand redirects back to `execute`, so a query like
+`execute [a-z].* targets [a-z].* targets run say` can reach the same node along exponentially many paths; memoizing on
+(node, token index) keeps matching linear in the chain length. (Wildcards like `.` or `.*` stop at redirects, so each
+step uses a pattern that happens to match every subcommand instead.)
+
+    python benchmarks/redirect_chains.py --subcommands 12 --chains 1 2 4 8 16
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import timeit
+
+import synthetic_tree
+
+from mccq.query_manager import QueryManager
+from mccq.version_database import VersionDatabase
+
+VERSION = 'chains'
+
+SUBCOMMANDS = ('align', 'anchored', 'as', 'at', 'facing', 'if', 'in', 'positioned', 'rotated', 'store', 'unless')
+
+
+class ForgetfulMemo(dict):
+    # remembers nothing, so every path through a redirect is matched all over again
+    def __setitem__(self, key, value):
+        pass
+
+
+class UnmemoizedQueryManager(QueryManager):
+    def _query_tree_recursive(self, arguments, node, index, matchers, graph, memo, redirects=0):
+        return super()._query_tree_recursive(arguments, node, index, matchers, graph, ForgetfulMemo(), redirects)
+
+
+def generate(subcommands: int) -> dict:
+    # like the real `execute`: each subcommand takes an argument and then carries on from `execute` again
+    names = [SUBCOMMANDS[i % len(SUBCOMMANDS)] + str(i // len(SUBCOMMANDS) or '') for i in range(subcommands)]
+    execute = {name: {'type': 'literal', 'children': {'targets': {
+        'type': 'argument', 'parser': 'minecraft:entity', 'redirect': ['execute']}}} for name in names}
+    execute['run'] = {'type': 'literal', 'redirect': []}
+    say = {'message': {'type': 'argument', 'parser': 'minecraft:message', 'executable': True}}
+    return {'type': 'root', 'children': {
+        'execute': {'type': 'literal', 'children': execute},
+        'say': {'type': 'literal', 'children': say},
+    }}
+
+
+def chain_query(length: int) -> str:
+    return ' '.join(('execute',) + ('[a-z].*', 'targets') * length + ('run', 'say'))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--subcommands', type=int, default=len(SUBCOMMANDS), help='number of `execute` subcommands')
+    parser.add_argument('--chains', type=int, nargs='+', default=(1, 2, 3, 4, 8, 16, 31), help='chain lengths')
+    parser.add_argument('--unmemoized_limit', type=int, default=4, help='longest chain to match without memoizing')
+    parser.add_argument('-n', '--number', type=int, default=20, help='how many times to match each query')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, VERSION, *synthetic_tree.DATA_FILE_TAIL)
+        os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as fp:
+            json.dump(generate(args.subcommands), fp)
+
+        db = VersionDatabase(uri=directory)
+        db.get(VERSION)  # load up front so it doesn't count towards query time
+
+        managers = (
+            ('unmemoized', UnmemoizedQueryManager(database=db, show_versions=[VERSION])),
+            ('memoized', QueryManager(database=db, show_versions=[VERSION])),
+        )
+
+        print(f'{"chain":>5} {"paths":>12} {"unmemoized (ms)":>16} {"memoized (ms)":>14}')
+        for length in args.chains:
+            arguments = QueryManager.parse_query_arguments(chain_query(length))
+            timings = []
+            for name, qm in managers:
+                if name == 'unmemoized' and length > args.unmemoized_limit:
+                    timings.append(None)
+                    continue
+                seconds = timeit.timeit(lambda: qm.query_tree_for_version(VERSION, arguments), number=args.number)
+                timings.append(seconds * 1000 / args.number)
+            unmemoized, memoized = timings
+            paths = f'{args.subcommands}^{length}'
+            unmemoized = f'{unmemoized:.3f}' if unmemoized is not None else '-'
+            print(f'{length:>5} {paths:>12} {unmemoized:>16} {memoized:>14.3f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""
+Measure throughput and latency of a running `python -m mccq serve` instance under concurrent clients.
+
+Each client keeps one connection open and sends queries back to back.
+
+    python -m mccq serve -d "https://raw.githubusercontent.com/Arcensoth/mcdata" -s 18w01a --port 8080
+    python benchmarks/server_load.py --url http://127.0.0.1:8080 --clients 8 --requests 500
+    python benchmarks/server_load.py --socket /tmp/mccq.sock --clients 8 --requests 500
+"""
+
+import argparse
+import http.client
+import json
+import socket
+import threading
+import time
+import typing
+import urllib.parse
+
+QUERIES = (
+    'execute',
+    '.',
+    '-e sc.* p.*r.* .*',
+    '-t tag targets add',
+    'gamerule .*mob.*',
+)
+
+
+def http_client(url: str) -> typing.Callable[[str], dict]:
+    parts = urllib.parse.urlsplit(url)
+    connection = http.client.HTTPConnection(parts.netloc)
+
+    def send(command: str) -> dict:
+        body = json.dumps({'command': command}).encode()
+        connection.request('POST', '/query', body, {'Content-Type': 'application/json'})
+        return json.loads(connection.getresponse().read())
+
+    return send
+
+
+def socket_client(path: str) -> typing.Callable[[str], dict]:
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.connect(path)
+    reader = sock.makefile('rb')
+
+    def send(command: str) -> dict:
+        sock.sendall(json.dumps({'command': command}).encode() + b'\n')
+        return json.loads(reader.readline())
+
+    return send
+
+
+def percentile(values: typing.List[float], fraction: float) -> float:
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--url', help='base url of the http endpoint')
+    parser.add_argument('--socket', help='path of the unix socket')
+    parser.add_argument('--clients', type=int, default=8, help='number of concurrent clients')
+    parser.add_argument('--requests', type=int, default=200, help='number of requests per client')
+    parser.add_argument('-q', '--query', action='append', help='query to send (repeatable, defaults to a mix)')
+    args = parser.parse_args()
+
+    if not (args.url or args.socket):
+        parser.error('one of --url or --socket is required')
+
+    queries = tuple(args.query or QUERIES)
+    latencies: typing.List[float] = []
+    failures = []
+    lock = threading.Lock()
+
+    def run_client(offset: int):
+        send = socket_client(args.socket) if args.socket else http_client(args.url)
+        mine = []
+        for index in range(args.requests):
+            start = time.perf_counter()
+            response = send(queries[(offset + index) % len(queries)])
+            mine.append(time.perf_counter() - start)
+            if 'error' in response:
+                failures.append(response['error'])
+        with lock:
+            latencies.extend(mine)
+
+    threads = [threading.Thread(target=run_client, args=(offset,)) for offset in range(args.clients)]
+
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    print(f'{len(latencies)} requests from {args.clients} clients in {elapsed:.3f}s ({len(failures)} errors)')
+    print(f'{len(latencies) / elapsed:.1f} queries/s')
+    print(
+        f'latency p50 {percentile(latencies, 0.5) * 1000:.2f}ms, p90 {percentile(latencies, 0.9) * 1000:.2f}ms, '
+        f'p99 {percentile(latencies, 0.99) * 1000:.2f}ms, max {latencies[-1] * 1000:.2f}ms')
+
+
+if __name__ == '__main__':
+    main()
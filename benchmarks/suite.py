@@ -0,0 +1,217 @@
+"""
+Run the benchmark suite (parse time, tree memory, query latency and completion latency) and write the results as json.
+
+Runs against a freshly generated synthetic tree by default, or against real versions with `-d` and `-v`:
+
+    python benchmarks/suite.py -o results.json
+    python benchmarks/suite.py --width 200 --depth 8 --redirect_density 0.1 -o big.json
+    python benchmarks/suite.py -d path/to/mcdata -v 1.13 -v 1.14 -o real.json
+    python benchmarks/suite.py -o after.json --compare before.json
+"""
+
+import argparse
+import gc
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+import typing
+
+import synthetic_tree
+
+from mccq.data_parser.v1_data_parser import V1DataParser
+from mccq.node.data_node import DataNode
+from mccq.query_manager import QueryManager
+from mccq.version_database import DATA_FILE_TAIL, VersionDatabase
+
+# a query per shape, built from the first root command with children; `{0}` is its key and `{1}` the first two letters
+QUERY_SHAPES = {
+    'literal': '{0}',
+    'literal_deep': '{0} . .',
+    'regex': '^{1}.* .*',
+    'dot': '. .',
+    'explode': '-e {0}',
+    'showtypes': '-t {0} .',
+}
+
+
+def timings(function: typing.Callable[[], typing.Any], repeat: int) -> dict:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        samples.append(time.perf_counter() - start)
+    return {'min': min(samples), 'median': statistics.median(samples), 'max': max(samples), 'repeat': repeat}
+
+
+def count_nodes(node: DataNode) -> int:
+    return 1 + sum(count_nodes(child) for child in node.children)
+
+
+def bench_parse(path: str, repeat: int) -> dict:
+    def parse():
+        with open(path, 'rb') as fp:
+            return V1DataParser().parse(json.load(fp))
+
+    def parse_stream():
+        with open(path, 'rb') as fp:
+            return V1DataParser().parse_stream(fp)
+
+    return {
+        'bytes': os.path.getsize(path),
+        'json': timings(parse, repeat),
+        'stream': timings(parse_stream, repeat),
+    }
+
+
+def bench_memory(path: str) -> dict:
+    with open(path, 'rb') as fp:
+        raw = json.load(fp)
+
+    gc.collect()
+    tracemalloc.start()
+    root = V1DataParser().parse(raw)
+    gc.collect()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    nodes = count_nodes(root)
+    return {'nodes': nodes, 'bytes': size, 'bytes_per_node': size / nodes}
+
+
+def representative_command(root: DataNode) -> DataNode:
+    for child in root.children:
+        if child.children:
+            return child
+    return root.children[0]
+
+
+def bench_queries(qm: QueryManager, version: str, repeat: int) -> dict:
+    command = representative_command(qm.database.get(version))
+    results = {}
+    for shape, template in QUERY_SHAPES.items():
+        query = f'-v {version} ' + template.format(command.key, command.key[:2])
+        lines = sum(len(commands) for commands in qm.results(query).values())
+        results[shape] = {'query': query, 'lines': lines, **timings(lambda: qm.results(query), repeat)}
+    return results
+
+
+def completion_lines(root: DataNode) -> typing.List[str]:
+    # every prefix typed on the way to a deep command, like someone pressing tab as they go
+    lines = ['']
+    node = representative_command(root)
+    line = ''
+    while True:
+        for index in range(1, len(node.key) + 1):
+            lines.append(line + node.key[:index])
+        line += node.key + ' '
+        lines.append(line)
+        if not node.children:
+            return lines
+        node = node.children[0]
+
+
+def bench_completion(qm: QueryManager, version: str, repeat: int) -> typing.Union[dict, None]:
+    try:
+        from mccq.cli.completer import CLICompleter
+    except ImportError:
+        # completion needs readline, which isn't available everywhere
+        return None
+
+    lines = completion_lines(qm.database.get(version))
+
+    def complete_all(completer: CLICompleter):
+        for line in lines:
+            set(completer.make_completions(line))
+
+    return {
+        'lines': len(lines),
+        'cold': timings(lambda: complete_all(CLICompleter(qm)), repeat),
+        'warm': timings(lambda completer=CLICompleter(qm): complete_all(completer), repeat),
+    }
+
+
+def run(database_uri: str, versions: typing.List[str], repeat: int) -> dict:
+    qm = QueryManager(VersionDatabase(database_uri), show_versions=versions)
+    results = {}
+    for version in versions:
+        path = os.path.join(database_uri, version, *DATA_FILE_TAIL)
+        results[version] = {
+            'parse': bench_parse(path, repeat),
+            'memory': bench_memory(path),
+            'query': bench_queries(qm, version, repeat),
+            'completion': bench_completion(qm, version, repeat),
+        }
+    qm.close()
+    return results
+
+
+def flatten(results: dict, prefix: str = '') -> typing.Dict[str, float]:
+    # pick out the numbers worth comparing between runs: medians and sizes
+    flat = {}
+    for key, value in results.items():
+        name = f'{prefix}.{key}' if prefix else key
+        if isinstance(value, dict):
+            flat.update(flatten(value, name))
+        elif key in ('median', 'bytes') and isinstance(value, (int, float)):
+            flat[name] = value
+    return flat
+
+
+def compare(baseline: dict, current: dict):
+    before = flatten(baseline['results'])
+    after = flatten(current['results'])
+    for name in sorted(set(before) & set(after)):
+        ratio = after[name] / before[name] if before[name] else float('nan')
+        print(f'{name:<60} {before[name]:>14.6g} {after[name]:>14.6g} {ratio:>8.2f}x', file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('-d', '--database_uri', help='a local database to benchmark instead of a synthetic one')
+    parser.add_argument('-v', '--version', action='append', default=[], help='version(s) to benchmark (repeatable)')
+    parser.add_argument('-r', '--repeat', type=int, default=5, help='how many times to repeat each measurement')
+    parser.add_argument('-o', '--output', help='file to write results to (default standard output)')
+    parser.add_argument('--compare', help='results of a previous run to compare against')
+    synthetic_tree.add_shape_arguments(parser)
+    args = parser.parse_args()
+
+    meta = {
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+    }
+
+    if args.database_uri:
+        if not args.version:
+            parser.error('at least one -v VERSION is required with -d')
+        meta['database_uri'] = args.database_uri
+        results = run(args.database_uri, args.version, args.repeat)
+
+    else:
+        shape = synthetic_tree.shape_from_arguments(args)
+        meta['synthetic'] = {**shape.as_dict(), 'seed': args.seed}
+        with tempfile.TemporaryDirectory() as directory:
+            versions = synthetic_tree.write_database(directory, 1, shape, args.seed)
+            results = run(directory, versions, args.repeat)
+
+    output = {'meta': meta, 'results': results}
+
+    if args.output:
+        with open(args.output, 'w') as fp:
+            json.dump(output, fp, indent=2)
+    else:
+        print(json.dumps(output, indent=2))
+
+    if args.compare:
+        with open(args.compare) as fp:
+            compare(json.load(fp), output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,169 @@
+"""
+Generate synthetic brigadier command trees shaped like `commands.json`, and write them out as a database.
+
+Each version is derived from the one before it by changing a fraction of its commands, like snapshots do.
+
+    python benchmarks/synthetic_tree.py /tmp/synthetic --versions 3 --width 80 --depth 8 --redirect_density 0.05
+"""
+
+import argparse
+import copy
+import json
+import os
+import random
+import typing
+
+ARGUMENT_PARSERS = (
+    'brigadier:bool',
+    'brigadier:double',
+    'brigadier:float',
+    'brigadier:integer',
+    'brigadier:string',
+    'minecraft:block_pos',
+    'minecraft:block_state',
+    'minecraft:component',
+    'minecraft:entity',
+    'minecraft:item_stack',
+    'minecraft:message',
+    'minecraft:objective',
+    'minecraft:resource_location',
+    'minecraft:score_holder',
+    'minecraft:vec3',
+)
+
+SYLLABLES = ('ab', 'ble', 'co', 'da', 'en', 'fi', 'ga', 'hu', 'in', 'jo', 'ka', 'lo', 'mi', 'no', 'or', 'pe', 'qu',
+             'ra', 'se', 'ti', 'un', 've', 'wo', 'xa', 'ye', 'ze')
+
+# the first command is the one redirects lead back to, like `execute`
+REDIRECT_TARGET = 'execute'
+
+DATA_FILE_TAIL = ('generated', 'reports', 'commands.json')
+
+
+class TreeShape:
+    def __init__(
+            self, width: int = 80, depth: int = 8, branching: float = 3.5, argument_ratio: float = 0.4,
+            executable_ratio: float = 0.5, redirect_density: float = 0.05):
+        # number of root commands
+        self.width = width
+        # maximum depth below each root command
+        self.depth = depth
+        # average number of children per node, shrinking with depth
+        self.branching = branching
+        # fraction of nodes that are arguments rather than literals
+        self.argument_ratio = argument_ratio
+        # fraction of nodes that are executable
+        self.executable_ratio = executable_ratio
+        # fraction of leaf nodes that redirect back to the redirect target
+        self.redirect_density = redirect_density
+
+    def as_dict(self) -> dict:
+        return dict(vars(self))
+
+
+def _name(rng: random.Random, taken: typing.Set[str]) -> str:
+    while True:
+        name = ''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(1, 4)))
+        if name not in taken:
+            taken.add(name)
+            return name
+
+
+def _node(rng: random.Random, shape: TreeShape, depth: int) -> dict:
+    node = {'type': 'argument' if rng.random() < shape.argument_ratio else 'literal'}
+    if node['type'] == 'argument':
+        node['parser'] = rng.choice(ARGUMENT_PARSERS)
+
+    # fewer children the deeper we go, so trees stay finite and bushy near the top like real ones
+    expected = shape.branching * (1 - depth / (shape.depth + 1))
+    count = int(expected) + (rng.random() < expected - int(expected)) if depth < shape.depth else 0
+
+    if count:
+        taken = set()
+        node['children'] = {_name(rng, taken): _node(rng, shape, depth + 1) for _ in range(count)}
+
+    if not count or rng.random() < shape.executable_ratio:
+        node['executable'] = True
+
+    if not count and rng.random() < shape.redirect_density:
+        node['redirect'] = [REDIRECT_TARGET]
+
+    return node
+
+
+def generate(shape: TreeShape, seed: int = 0) -> dict:
+    rng = random.Random(seed)
+    taken = {REDIRECT_TARGET}
+    children = {REDIRECT_TARGET: _node(rng, shape, 1)}
+    # an `execute run`-like node that leads anywhere
+    children[REDIRECT_TARGET].setdefault('children', {})['run'] = {'type': 'literal'}
+    for _ in range(shape.width - 1):
+        children[_name(rng, taken)] = _node(rng, shape, 1)
+    return {'type': 'root', 'children': children}
+
+
+def mutate(root: dict, shape: TreeShape, seed: int, change_ratio: float = 0.1) -> dict:
+    # regenerate some root commands and add a new one, leaving the rest untouched
+    rng = random.Random(seed)
+    root = copy.deepcopy(root)
+    children = root['children']
+    for name in list(children):
+        if name != REDIRECT_TARGET and rng.random() < change_ratio:
+            children[name] = _node(rng, shape, 1)
+    children[_name(rng, set(children))] = _node(rng, shape, 1)
+    return root
+
+
+def count_nodes(node: dict) -> int:
+    return 1 + sum(count_nodes(child) for child in node.get('children', {}).values())
+
+
+def write_database(directory: str, versions: int, shape: TreeShape, seed: int = 0) -> typing.List[str]:
+    names = []
+    root = generate(shape, seed)
+    for index in range(versions):
+        if index:
+            root = mutate(root, shape, seed + index)
+        name = f'synthetic{index + 1}'
+        path = os.path.join(directory, name, *DATA_FILE_TAIL)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as fp:
+            json.dump(root, fp, indent=2)
+        names.append(name)
+    return names
+
+
+def add_shape_arguments(parser: argparse.ArgumentParser):
+    defaults = TreeShape()
+    parser.add_argument('--width', type=int, default=defaults.width, help='number of root commands')
+    parser.add_argument('--depth', type=int, default=defaults.depth, help='maximum depth of each command')
+    parser.add_argument('--branching', type=float, default=defaults.branching, help='average children per node')
+    parser.add_argument('--argument_ratio', type=float, default=defaults.argument_ratio, help='fraction of arguments')
+    parser.add_argument(
+        '--executable_ratio', type=float, default=defaults.executable_ratio, help='fraction of executable nodes')
+    parser.add_argument(
+        '--redirect_density', type=float, default=defaults.redirect_density, help='fraction of leaves that redirect')
+    parser.add_argument('--seed', type=int, default=0, help='random seed')
+
+
+def shape_from_arguments(args: argparse.Namespace) -> TreeShape:
+    return TreeShape(
+        width=args.width, depth=args.depth, branching=args.branching, argument_ratio=args.argument_ratio,
+        executable_ratio=args.executable_ratio, redirect_density=args.redirect_density)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('directory', help='database directory to write versions into')
+    parser.add_argument('--versions', type=int, default=1, help='number of versions to generate')
+    add_shape_arguments(parser)
+    args = parser.parse_args()
+
+    names = write_database(args.directory, args.versions, shape_from_arguments(args), args.seed)
+    for name in names:
+        with open(os.path.join(args.directory, name, *DATA_FILE_TAIL)) as fp:
+            print(f'{name}: {count_nodes(json.load(fp))} nodes')
+
+
+if __name__ == '__main__':
+    main()
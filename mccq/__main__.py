@@ -1 +1,10 @@
-from mccq.cli import cli
+import sys
+
+# `python -m mccq serve ...` runs the server, `python -m mccq batch ...` runs a file of queries, anything else runs the
+# interactive cli
+if sys.argv[1:2] == ['serve']:
+    from mccq.cli import serve
+elif sys.argv[1:2] == ['batch']:
+    from mccq.cli import batch
+else:
+    from mccq.cli import cli
@@ -0,0 +1,183 @@
+import concurrent.futures
+import typing
+
+from mccq.node.data_node import DataNode
+from mccq.node.redirect_graph import RedirectGraph, follows_redirect
+from mccq.query_arguments import QueryArguments
+from mccq.query_manager import QueryManager
+from mccq.token_matcher import get_token_matcher
+from mccq.typedefs import IterableOfStrings, TupleOfStrings
+from mccq.version_database import VersionDatabase
+
+# one json-serializable result per query and version, for example:
+# `{'query': 'tag targets', 'version': '18w01a', 'commands': ['tag <targets> add <name>', ...]}`
+BatchResult = typing.Dict[str, typing.Any]
+
+# the position of a query in the batch along with its parsed arguments
+IndexedArguments = typing.Tuple[int, QueryArguments]
+
+# a node reached by a query, the command it extends, and how many redirects were followed to get there
+Reached = typing.Tuple[DataNode, str, int]
+
+# reached nodes for each sequence of tokens (and whether types are shown, since that changes redirected commands)
+ReachedMemo = typing.Dict[typing.Tuple[TupleOfStrings, bool], typing.Tuple[Reached, ...]]
+
+# the position of a query in the batch along with either its commands or what went wrong
+VersionResult = typing.Tuple[int, typing.Union[TupleOfStrings, None], typing.Union[str, None]]
+
+
+class BatchQuery:
+    def __init__(self, index: int, command: str, arguments: QueryArguments = None, versions: TupleOfStrings = ()):
+        self.index = index
+        self.command = command
+        self.arguments = arguments
+        self.versions = versions
+        self.error: str = None
+
+
+def _effective_tokens(command: TupleOfStrings) -> TupleOfStrings:
+    # an empty token ends a query early, treating the node before it as a leaf
+    for index, token in enumerate(command):
+        if not token:
+            return command[:index]
+    return command
+
+
+def _command_for_children(node: DataNode, parent_command: str, showtypes: bool) -> str:
+    # like `QueryNode.command_for_children`: children reached through a redirect continue the command without it
+    return node.extend_command(parent_command, showtypes, show_redirect=not follows_redirect(node))
+
+
+def _reached(
+        graph: RedirectGraph, tokens: TupleOfStrings, showtypes: bool, max_redirects: int,
+        memo: ReachedMemo) -> typing.Tuple[Reached, ...]:
+    # nodes reached by following the tokens from the root, in the same order a query tree would list its leaves
+    # shared prefixes are only walked once per version
+    key = (tokens, showtypes)
+    reached = memo.get(key)
+    if reached is None:
+        if tokens:
+            matcher = get_token_matcher(tokens[-1])
+            reached = []
+            for parent, parent_command, redirects in _reached(graph, tokens[:-1], showtypes, max_redirects, memo):
+                search_nodes, child_redirects = graph.continuations(parent, redirects, max_redirects, matcher)
+                if search_nodes:
+                    child_command = _command_for_children(parent, parent_command, showtypes)
+                    reached.extend(
+                        (child, child_command, child_redirects)
+                        for search_node in search_nodes for child in matcher.select(search_node))
+            reached = tuple(reached)
+        else:
+            reached = ((graph.root, '', 0),)
+        memo[key] = reached
+    return reached
+
+
+def results_for_version(
+        query_manager: QueryManager, version: str, queries: typing.Iterable[IndexedArguments]) \
+        -> typing.List[VersionResult]:
+    try:
+        root = query_manager.database.get(version)
+    except Exception as ex:
+        return [(index, None, str(ex)) for index, _ in queries]
+
+    graph = RedirectGraph.for_root(root)
+    memo = {}
+    results = []
+
+    for index, arguments in queries:
+        try:
+            if arguments.lookups():
+                # lookups go straight to the index rather than walking from the root, so there's nothing to share
+                commands = query_manager.commands_for_version(version, arguments)
+            else:
+                showtypes = bool(arguments.showtypes)
+                reached = _reached(
+                    graph, _effective_tokens(arguments.command), showtypes, query_manager.max_redirects, memo)
+                commands = query_manager.commands_for_leaves(
+                    arguments,
+                    ((leaf, leaf.extend_command(parent_command, showtypes)) for leaf, parent_command, _ in reached))
+
+            results.append((index, tuple(commands), None))
+
+        except Exception as ex:
+            results.append((index, None, str(ex)))
+
+    return results
+
+
+def _results_for_version_in_process(
+        database_options: dict, version: str, queries: typing.List[IndexedArguments]) -> typing.List[VersionResult]:
+    # each process has its own database, so it loads the version itself
+    query_manager = QueryManager(VersionDatabase(**database_options), show_versions=())
+    return results_for_version(query_manager, version, queries)
+
+
+class QueryBatch:
+    def __init__(self, query_manager: QueryManager, commands: IterableOfStrings):
+        self.query_manager = query_manager
+        self.queries: typing.List[BatchQuery] = []
+
+        for index, command in enumerate(commands):
+            query = BatchQuery(index, command)
+            try:
+                query.arguments = query_manager.parse_query_arguments(command)
+                query.versions = tuple(query_manager.filter_versions(query.arguments))
+            except Exception as ex:
+                query.error = str(ex)
+            self.queries.append(query)
+
+    def by_version(self) -> typing.Dict[str, typing.List[IndexedArguments]]:
+        # group queries by version so that each version is loaded once and walked once per shared prefix
+        groups: typing.Dict[str, typing.List[IndexedArguments]] = {}
+        for query in self.queries:
+            for version in query.versions:
+                groups.setdefault(version, []).append((query.index, query.arguments))
+        return groups
+
+    def _database_options(self) -> dict:
+        database = self.query_manager.database
+        return {
+            'uri': database.uri,
+            'version_file': database.version_file,
+            'whitelist': tuple(database.whitelist),
+            'tree_cache': database.tree_cache,
+            'streaming': database.streaming,
+            'loader_options': database.loader_options,
+        }
+
+    def _results_by_version(self, processes: int = None) \
+            -> typing.Iterable[typing.Tuple[str, typing.List[VersionResult]]]:
+        groups = self.by_version()
+
+        if processes and processes > 1 and len(groups) > 1:
+            options = self._database_options()
+            with concurrent.futures.ProcessPoolExecutor(max_workers=processes) as executor:
+                futures = [
+                    (version, executor.submit(_results_for_version_in_process, options, version, queries))
+                    for version, queries in groups.items()]
+                for version, future in futures:
+                    yield version, future.result()
+
+        else:
+            for version, queries in groups.items():
+                yield version, results_for_version(self.query_manager, version, queries)
+
+    def results(self, processes: int = None) -> typing.Iterable[BatchResult]:
+        # queries that couldn't even be parsed go first
+        for query in self.queries:
+            if query.error is not None:
+                yield {'query': query.command, 'error': query.error}
+
+        for version, version_results in self._results_by_version(processes):
+            for index, commands, error in version_results:
+                query = self.queries[index]
+
+                # like regular queries, errors only matter when a single version is requested
+                if error is not None:
+                    if len(query.versions) == 1:
+                        yield {'query': query.command, 'version': version, 'error': error}
+
+                # don't include versions with no results
+                elif commands:
+                    yield {'query': query.command, 'version': version, 'commands': list(commands)}
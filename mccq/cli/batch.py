@@ -0,0 +1,59 @@
+import json
+import logging
+import shlex
+import sys
+
+from mccq.argument_parser import ArgumentParser
+from mccq.batch import QueryBatch
+from mccq.cli.startup import add_startup_arguments, create_query_manager
+
+startup_parser = ArgumentParser(
+    'mccq batch',
+    description='Minecraft command query batch mode. Runs every query in a file (one per line) and writes the results '
+                'as json lines.')
+
+startup_parser.add_argument(
+    'queries', help='file with one query per line, or - for standard input')
+
+add_startup_arguments(startup_parser)
+
+startup_parser.add_argument(
+    '-o', '--output', default=None, help='file to write results to (default standard output)')
+
+startup_parser.add_argument(
+    '-p', '--processes', type=int, default=None, help='how many processes to spread versions across')
+
+try:
+    startup_args = startup_parser.parse_args(shlex.split(' '.join(sys.argv[2:])))
+except:
+    sys.exit()
+
+logging.basicConfig(level=startup_args.log)
+
+log = logging.getLogger(__name__)
+
+qm = create_query_manager(startup_args)
+
+if startup_args.queries == '-':
+    lines = sys.stdin.read().splitlines()
+else:
+    with open(startup_args.queries) as fp:
+        lines = fp.read().splitlines()
+
+# skip blank lines and comments
+commands = [line.strip() for line in lines if line.strip() and not line.lstrip().startswith('#')]
+
+batch = QueryBatch(qm, commands)
+
+output = open(startup_args.output, 'w') if startup_args.output else sys.stdout
+
+try:
+    for result in batch.results(processes=startup_args.processes):
+        output.write(json.dumps(result) + '\n')
+        output.flush()
+
+finally:
+    if output is not sys.stdout:
+        output.close()
+
+qm.close()
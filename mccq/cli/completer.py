@@ -2,6 +2,7 @@ import typing
 
 import readline
 
+from mccq.cli.completion_index import CompletionIndex
 from mccq.cli.meta import META_COMMANDS
 from mccq.query_arguments import QueryArguments
 from mccq.query_manager import QueryManager
@@ -11,6 +12,7 @@ from mccq.typedefs import IterableOfStrings
 class CLICompleter:
     def __init__(self, query_manager: QueryManager):
         self.query_manager = query_manager
+        self.completion_index = CompletionIndex(query_manager)
         self.completions: typing.List[str] = []
         self.num_completions: int = 0
         self.reset_completions()
@@ -42,6 +44,15 @@ class CLICompleter:
         except:
             return None
 
+        # the index walks the same tokens, but remembers how far it got for the next keypress
+        # empty tokens end a query early though, which only a real query gets right
+        if all(arguments.command):
+            try:
+                yield from self.completion_index.candidates(tuple(versions), arguments.command)
+            except:
+                pass
+            return
+
         # spread across all versions applicable to the current command
         for v in versions:
             try:
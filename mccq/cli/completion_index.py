@@ -0,0 +1,149 @@
+import collections
+import threading
+import typing
+import weakref
+
+from mccq.node.data_node import DataNode
+from mccq.node.redirect_graph import RedirectGraph
+from mccq.query_manager import QueryManager
+from mccq.token_matcher import TokenMatcher, get_token_matcher
+from mccq.typedefs import TupleOfStrings
+
+# maximum number of (version, preceding tokens) walks to remember
+COMPLETION_INDEX_CACHE_SIZE = 256
+
+# nodes reached by the tokens typed so far, along with how many redirects were followed to get to each of them
+NodeSet = typing.Tuple[typing.Tuple[DataNode, int], ...]
+
+
+class CompletionIndex:
+    def __init__(self, query_manager: QueryManager, cache_size: int = COMPLETION_INDEX_CACHE_SIZE):
+        self.query_manager = query_manager
+        self.cache_size = cache_size
+
+        # nodes reached by each sequence of preceding tokens, per version
+        self._reached: typing.MutableMapping[typing.Tuple[str, TupleOfStrings], NodeSet] = collections.OrderedDict()
+
+        # sorted child keys of every node reached by each sequence of preceding tokens, merged across versions
+        self._merged: typing.MutableMapping[typing.Tuple[TupleOfStrings, TupleOfStrings], TupleOfStrings] = \
+            collections.OrderedDict()
+
+        # sorted child keys of each node, computed once per node (and therefore shared between versions)
+        self._child_keys: typing.MutableMapping[DataNode, TupleOfStrings] = weakref.WeakKeyDictionary()
+
+        # the previous request and its candidates, so that typing more of the same token only narrows them down
+        self._previous: typing.Tuple[TupleOfStrings, TupleOfStrings, TokenMatcher, TupleOfStrings] = None
+
+        self._lock = threading.RLock()
+
+        # forget everything derived from a version whenever its tree is replaced
+        query_manager.database.add_invalidation_listener(self.invalidate)
+
+    def _remember(self, entries: typing.MutableMapping, key, value):
+        entries[key] = value
+        entries.move_to_end(key)
+        while len(entries) > self.cache_size:
+            entries.popitem(last=False)
+
+    def child_keys(self, node: DataNode) -> TupleOfStrings:
+        keys = self._child_keys.get(node)
+        if keys is None:
+            keys = self._child_keys[node] = tuple(sorted({child.key for child in node.children}))
+        return keys
+
+    def reached(self, version: str, tokens: TupleOfStrings) -> NodeSet:
+        # walk one token at a time, reusing the walk for the tokens before it
+        key = (version, tokens)
+        nodes = self._reached.get(key)
+        if nodes is not None:
+            self._reached.move_to_end(key)
+            return nodes
+
+        if tokens:
+            parents = self.reached(version, tokens[:-1])
+            matcher = get_token_matcher(tokens[-1])
+            # the same node can be reached along several paths through redirects, but it only needs completing once
+            nodes = tuple(dict.fromkeys(
+                (child, redirects)
+                for search_nodes, redirects in self._continuations(version, parents, matcher)
+                for search_node in search_nodes
+                for child in matcher.select(search_node)))
+        else:
+            nodes = ((self.query_manager.database.get(version), 0),)
+
+        self._remember(self._reached, key, nodes)
+        return nodes
+
+    def _continuations(self, version: str, nodes: NodeSet, matcher: TokenMatcher = None) \
+            -> typing.Iterable[typing.Tuple[typing.Tuple[DataNode, ...], int]]:
+        # whatever comes after each node, which for a redirect is whatever comes after its target
+        graph = RedirectGraph.for_root(self.query_manager.database.get(version))
+        max_redirects = self.query_manager.max_redirects
+        return (graph.continuations(node, redirects, max_redirects, matcher) for node, redirects in nodes)
+
+    def merged(self, versions: TupleOfStrings, tokens: TupleOfStrings) -> TupleOfStrings:
+        key = (versions, tokens)
+        keys = self._merged.get(key)
+        if keys is not None:
+            self._merged.move_to_end(key)
+            return keys
+
+        merged = set()
+        failed = False
+        for version in versions:
+            # like queries against several versions, skip the ones that fail
+            try:
+                for search_nodes, _ in self._continuations(version, self.reached(version, tokens)):
+                    for node in search_nodes:
+                        merged.update(self.child_keys(node))
+            except Exception:
+                failed = True
+
+        keys = tuple(sorted(merged))
+
+        # a version that failed (to load, for example) may work next time
+        if not failed:
+            self._remember(self._merged, key, keys)
+
+        return keys
+
+    def candidates(self, versions: TupleOfStrings, tokens: TupleOfStrings) -> TupleOfStrings:
+        # the last token is the one being completed, everything before it has to match the path leading to it
+        preceding, matcher = tokens[:-1], get_token_matcher(tokens[-1])
+
+        with self._lock:
+            previous = self._previous
+            if previous and previous[:2] == (versions, preceding) and self.narrows(previous[2], matcher):
+                keys = previous[3]
+            else:
+                keys = self.merged(versions, preceding)
+
+            keys = tuple(key for key in keys if matcher.matches(key))
+            self._previous = (versions, preceding, matcher, keys)
+
+        return keys
+
+    @staticmethod
+    def narrows(previous: TokenMatcher, matcher: TokenMatcher) -> bool:
+        # whether everything matched by the new token was also matched by the previous one
+        if previous.match_all:
+            return True
+        if previous.literal is None or matcher.literal is None or previous.ignorecase != matcher.ignorecase:
+            return False
+        if previous.anchored_start and not (matcher.anchored_start and matcher.literal.startswith(previous.literal)):
+            return False
+        if previous.anchored_end and not (matcher.anchored_end and matcher.literal.endswith(previous.literal)):
+            return False
+        return previous.literal in matcher.literal
+
+    def invalidate(self, version: str = None):
+        with self._lock:
+            self._merged.clear()
+            self._previous = None
+
+            # no version means everything is stale
+            if version is None:
+                self._reached.clear()
+            else:
+                for key in [key for key in self._reached if key[0] == version]:
+                    del self._reached[key]
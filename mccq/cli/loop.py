@@ -3,11 +3,48 @@ import shlex
 
 from mccq import errors
 from mccq.cli.meta import META_MAP
+from mccq.instrumentation import METRICS, MemorySink
+from mccq.profiler import profile_query
+from mccq.query_arguments import QueryArguments
 from mccq.query_manager import QueryManager
+from mccq.typedefs import TupleOfStrings
 
 log = logging.getLogger(__name__)
 
 
+def print_stats(qm: QueryManager):
+    sink = METRICS.find_sink(MemorySink)
+    if sink:
+        print(sink.render())
+    else:
+        print('Metrics are disabled, start with --metrics to enable them.')
+
+    if qm.result_cache is not None:
+        print(f'result cache: {qm.result_cache.stats()}')
+
+    print(f'nodes: {qm.database.node_stats()}')
+    print(f'versions: {qm.database.cache_stats()}')
+
+
+def format_versions(versions: TupleOfStrings) -> str:
+    return versions[0] if len(versions) == 1 else f'{versions[0]}..{versions[-1]}'
+
+
+def print_diffs(qm: QueryManager, arguments: QueryArguments):
+    # only print what changed, and skip pairs of versions that didn't change at all
+    for diff in qm.diffs_from_arguments(arguments, include_unchanged=False):
+        changes = diff.changes
+        if changes:
+            print(f'# {diff.old_version} -> {diff.new_version}')
+            for status, command in changes:
+                print(f'{status} {command}')
+
+
+def print_profile(qm: QueryManager, command: str, pstats_path: str = None):
+    # run the query without printing its results, and report where the time went instead
+    print(profile_query(qm, command, pstats_path).render())
+
+
 def cli_loop(qm: QueryManager):
     while True:
         try:
@@ -27,10 +64,26 @@ def cli_loop(qm: QueryManager):
                     return
 
                 elif meta_root in META_MAP['reload']:
-                    qm.database.reload()
+                    # `\reload full` throws everything away, otherwise only versions that changed at their source
+                    print(qm.reload(full=meta_args[1:] == ['full']))
 
                 elif meta_root in META_MAP['show']:
                     qm.show_versions = tuple(meta_args[1:])
+                    # keep the new defaults loaded instead of the old ones
+                    qm.database.pinned = set(qm.show_versions)
+
+                elif meta_root in META_MAP['stats']:
+                    print_stats(qm)
+
+                elif meta_root in META_MAP['profile']:
+                    # `\profile -o FILE QUERY` also writes a pstats file for a closer look
+                    profile_args = meta_args[1:]
+                    pstats_path = None
+                    if profile_args[:1] == ['-o']:
+                        pstats_path, profile_args = profile_args[1], profile_args[2:]
+                    if not profile_args:
+                        raise ValueError('Missing query', command)
+                    print_profile(qm, ' '.join(shlex.quote(arg) for arg in profile_args), pstats_path)
 
                 else:
                     raise ValueError('Invalid command', command)
@@ -42,9 +95,22 @@ def cli_loop(qm: QueryManager):
 
         elif command:
             try:
-                for version, commands in qm.results(command).items():
-                    print(f'# {version}')
-                    for command in commands:
+                arguments = qm.parse_query_arguments(command)
+
+                if arguments.profile:
+                    print_profile(qm, command)
+
+                elif arguments.diff:
+                    print_diffs(qm, arguments)
+
+                else:
+                    # print each command as soon as it's rendered, with a header whenever the versions change
+                    # consecutive versions with identical results are printed once, like `# 18w01a..18w05a`
+                    current_versions = None
+                    for versions, command in qm.stream_grouped_results_from_arguments(arguments):
+                        if versions != current_versions:
+                            print(f'# {format_versions(versions)}')
+                            current_versions = versions
                         print(command)
 
             except errors.NoVersionRequested:
@@ -2,6 +2,8 @@ META_MAP = {
     'exit': {'exit', 'x'},
     'reload': {'reload', 'r'},
     'show': {'show', 's'},
+    'stats': {'stats'},
+    'profile': {'profile', 'p'},
 }
 
 META_COMMANDS = set(META_MAP)
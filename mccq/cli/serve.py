@@ -0,0 +1,93 @@
+import logging
+import os
+import shlex
+import signal
+import sys
+import threading
+
+from mccq.argument_parser import ArgumentParser
+from mccq.cli.startup import add_startup_arguments, create_query_manager
+from mccq.server import QueryHTTPServer, QueryService
+
+startup_parser = ArgumentParser(
+    'mccq serve',
+    description='Minecraft command query server. Keeps versions loaded and answers queries over http and/or a unix '
+                'socket using json.')
+
+add_startup_arguments(startup_parser)
+
+startup_parser.add_argument(
+    '--host', default='127.0.0.1', help='the address to serve http on')
+
+startup_parser.add_argument(
+    '--port', type=int, default=None, help='the port to serve http on (default 8080 unless a socket is given)')
+
+startup_parser.add_argument(
+    '--socket', default=None, help='the path of a unix socket to serve json lines on')
+
+try:
+    startup_args = startup_parser.parse_args(shlex.split(' '.join(sys.argv[2:])))
+except:
+    sys.exit()
+
+logging.basicConfig(level=startup_args.log)
+
+log = logging.getLogger(__name__)
+
+port = startup_args.port
+if port is None and not startup_args.socket:
+    port = 8080
+
+qm = create_query_manager(startup_args)
+service = QueryService(qm)
+
+print('[::] Minecraft Command Query Server [::]')
+
+service.warm()
+
+servers = []
+
+if port is not None:
+    servers.append(QueryHTTPServer((startup_args.host, port), service))
+    print(f'Serving http on {startup_args.host}:{port}')
+
+if startup_args.socket:
+    from mccq.server import QuerySocketServer
+
+    # clear out a socket left behind by a previous run
+    if os.path.exists(startup_args.socket):
+        os.unlink(startup_args.socket)
+
+    servers.append(QuerySocketServer(startup_args.socket, service))
+    print(f'Serving json lines on {startup_args.socket}')
+
+threads = [threading.Thread(target=server.serve_forever, daemon=True) for server in servers]
+for thread in threads:
+    thread.start()
+
+stopping = threading.Event()
+
+# reload on hangup, without interrupting queries that are already running
+if hasattr(signal, 'SIGHUP'):
+    signal.signal(signal.SIGHUP, lambda signum, frame: threading.Thread(target=service.reload).start())
+
+signal.signal(signal.SIGTERM, lambda signum, frame: stopping.set())
+
+try:
+    # wait in short intervals so that keyboard interrupts get through
+    while not stopping.wait(1.0):
+        pass
+
+except KeyboardInterrupt:
+    pass
+
+for server in servers:
+    server.shutdown()
+    server.server_close()
+
+if startup_args.socket and os.path.exists(startup_args.socket):
+    os.unlink(startup_args.socket)
+
+qm.close()
+
+print('Goodbye!')
@@ -0,0 +1,101 @@
+import argparse
+import logging
+import os
+
+from mccq.instrumentation import METRICS, METRICS_SINKS
+from mccq.query_manager import QueryManager
+from mccq.result_cache import ResultCache
+from mccq.tree_cache import TreeCache
+from mccq.version_database import VersionDatabase
+
+# TODO other os, edge cases
+local_database = os.path.join(os.path.expanduser('~'), 'AppData', 'Roaming', '.minecraft', 'versions')
+
+
+def add_startup_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument(
+        '-s', '--show_versions', action='append', default=[], help='which version(s) to render by default (repeatable)')
+
+    parser.add_argument(
+        '-d', '--database_uri', default=local_database, help='the uri from where versions will be loaded')
+
+    parser.add_argument(
+        '-c', '--cache_size', type=int, default=0, help='how many query results to cache (0 to disable)')
+
+    parser.add_argument(
+        '--cache_ttl', type=float, default=None, help='how many seconds to keep cached query results')
+
+    parser.add_argument(
+        '--tree_cache', default=None, help='directory in which to keep pre-parsed versions between runs')
+
+    parser.add_argument(
+        '--timeout', type=float, default=None, help='how many seconds to wait on the internet before giving up')
+
+    parser.add_argument(
+        '--retries', type=int, default=None, help='how many times to retry failed internet requests')
+
+    parser.add_argument(
+        '--backoff', type=float, default=None, help='how many seconds to wait before the first retry (doubling after)')
+
+    parser.add_argument(
+        '--stream', action='store_true', help='parse versions as they are read instead of loading them whole')
+
+    parser.add_argument(
+        '-j', '--workers', type=int, default=None, help='how many versions to load and query at the same time')
+
+    parser.add_argument(
+        '--max_versions', type=int, default=None, help='how many versions to keep loaded (-s versions stay)')
+
+    parser.add_argument(
+        '--max_memory', type=float, default=None, help='roughly how many megabytes of versions to keep loaded')
+
+    parser.add_argument(
+        '-w', '--warm', action='store_true', help='start loading the default versions in the background right away')
+
+    parser.add_argument(
+        '--warm_manifest', default=None, help='file listing more versions to load in the background (one per line)')
+
+    parser.add_argument(
+        '--metrics', nargs='?', const='memory', default=None, choices=sorted(METRICS_SINKS),
+        help='collect timings and counters (memory by default, or logging or prometheus)')
+
+    parser.add_argument(
+        '-l', '--log', default=logging.WARNING, help='log level')
+
+
+def loader_options(startup_args: argparse.Namespace) -> dict:
+    # only what was actually given, so that loaders without these options (like the filesystem) still work by default
+    options = dict(timeout=startup_args.timeout, retries=startup_args.retries, backoff=startup_args.backoff)
+    return {name: value for name, value in options.items() if value is not None}
+
+
+def create_query_manager(startup_args: argparse.Namespace) -> QueryManager:
+    if startup_args.metrics:
+        METRICS.add_sink(METRICS_SINKS[startup_args.metrics]())
+
+    db = VersionDatabase(
+        uri=startup_args.database_uri,
+        tree_cache=TreeCache(startup_args.tree_cache) if startup_args.tree_cache else None,
+        streaming=startup_args.stream,
+        max_versions=startup_args.max_versions,
+        max_bytes=int(startup_args.max_memory * 2 ** 20) if startup_args.max_memory is not None else None,
+        pinned=startup_args.show_versions,
+        loader_options=loader_options(startup_args))
+
+    qm = QueryManager(
+        database=db,
+        show_versions=startup_args.show_versions,
+        result_cache=ResultCache(max_size=startup_args.cache_size, ttl=startup_args.cache_ttl)
+        if startup_args.cache_size > 0 else None,
+        max_workers=startup_args.workers)
+
+    warm_versions = list(startup_args.show_versions) if startup_args.warm else []
+
+    if startup_args.warm_manifest:
+        with open(startup_args.warm_manifest) as fp:
+            warm_versions.extend(line.strip() for line in fp if line.strip())
+
+    if warm_versions:
+        db.prefetch(warm_versions, max_workers=startup_args.workers)
+
+    return qm
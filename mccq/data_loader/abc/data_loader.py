@@ -1,4 +1,7 @@
 import abc
+import io
+import json
+import typing
 
 from mccq.typedefs import TupleOfStrings
 
@@ -9,3 +12,21 @@ class DataLoader(abc.ABC):
 
     @abc.abstractmethod
     def load_version(self, components: TupleOfStrings) -> str: ...
+
+    def open(self, components: TupleOfStrings) -> typing.BinaryIO:
+        # a stream of the raw data for parsers that can build from it directly
+        # loaders that can stream should override this
+        return io.BytesIO(json.dumps(self.load(components)).encode('utf8'))
+
+    def fingerprint(self, components: TupleOfStrings) -> typing.Union[str, None]:
+        # something that changes whenever the data at the given location does, or `None` if it can't be determined
+        return None
+
+    def loaded_fingerprint(self, components: TupleOfStrings) -> typing.Union[str, None]:
+        # the fingerprint of what was last loaded (or streamed in full) from the given location, if loading it revealed
+        # one along the way, so that it doesn't have to be taken separately
+        return None
+
+    def close(self):
+        # release anything held on to between loads, like open connections
+        pass
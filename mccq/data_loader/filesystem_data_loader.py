@@ -1,20 +1,85 @@
+import hashlib
+import io
 import json
 import logging
 import os
+import threading
+import typing
 
 from mccq.data_loader.abc.data_loader import DataLoader
+from mccq.instrumentation import METRICS
 from mccq.typedefs import TupleOfStrings
 
 log = logging.getLogger(__name__)
 
+# size in bytes of the digests used as fingerprints
+DIGEST_SIZE = 16
+
+
+class DigestingReader(io.RawIOBase):
+    # hashes a file as it's read, and hands the digest over once all of it has been
+    def __init__(self, fp: typing.BinaryIO, on_digest: typing.Callable[[str], None]):
+        super().__init__()
+        self.fp = fp
+        self.on_digest = on_digest
+        self.digest = hashlib.blake2b(digest_size=DIGEST_SIZE)
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        count = self.fp.readinto(buffer)
+        if count:
+            self.digest.update(memoryview(buffer)[:count])
+        elif self.on_digest is not None:
+            self.on_digest(self.digest.hexdigest())
+            self.on_digest = None
+        return count
+
+    def close(self):
+        if not self.closed:
+            try:
+                self.fp.close()
+            finally:
+                super().close()
+
 
 class FilesystemDataLoader(DataLoader):
+    def __init__(self):
+        # the last digest of each file along with its modification time and size, so unchanged files aren't hashed again
+        self._digests: typing.Dict[str, typing.Tuple[int, int, str]] = {}
+        self._digests_lock = threading.Lock()
+
+    def _remember_digest(self, path: str, stat: os.stat_result, hexdigest: str):
+        with self._digests_lock:
+            self._digests[path] = (stat.st_mtime_ns, stat.st_size, hexdigest)
+
+    def _remembered_digest(self, path: str, stat: os.stat_result) -> typing.Union[str, None]:
+        with self._digests_lock:
+            cached = self._digests.get(path)
+        if cached and cached[:2] == (stat.st_mtime_ns, stat.st_size):
+            return cached[2]
+
     def load(self, components: TupleOfStrings) -> dict:
         path = os.path.join(*components)
         log.info(f'Loading commands from filesystem: {path}')
-        with open(path) as fp:
-            raw = json.load(fp)
-        return raw
+        # taken before reading, so that if the file changes in the meantime it no longer matches and is hashed again
+        stat = os.stat(path)
+        with open(path, 'rb') as fp:
+            data = fp.read()
+        # the bytes are at hand anyway, so hash them now rather than reading them again to fingerprint them later
+        self._remember_digest(path, stat, hashlib.blake2b(data, digest_size=DIGEST_SIZE).hexdigest())
+        if METRICS.enabled:
+            METRICS.count('loader.bytes', len(data))
+        return json.loads(data)
+
+    def open(self, components: TupleOfStrings) -> typing.BinaryIO:
+        path = os.path.join(*components)
+        log.info(f'Streaming commands from filesystem: {path}')
+        stat = os.stat(path)
+        if METRICS.enabled:
+            METRICS.count('loader.bytes', stat.st_size)
+        return DigestingReader(open(path, 'rb'), lambda hexdigest: self._remember_digest(path, stat, hexdigest))
 
     def load_version(self, components: TupleOfStrings) -> str:
         path = os.path.join(*components)
@@ -22,3 +87,27 @@ class FilesystemDataLoader(DataLoader):
         with open(path) as fp:
             raw = str(fp.readline()).strip()
         return raw
+
+    def fingerprint(self, components: TupleOfStrings) -> str:
+        path = os.path.join(*components)
+        stat = os.stat(path)
+        hexdigest = self._remembered_digest(path, stat)
+        if hexdigest is not None:
+            return hexdigest
+
+        digest = hashlib.blake2b(digest_size=DIGEST_SIZE)
+        with open(path, 'rb') as fp:
+            for chunk in iter(lambda: fp.read(1 << 16), b''):
+                digest.update(chunk)
+        hexdigest = digest.hexdigest()
+
+        self._remember_digest(path, stat, hexdigest)
+        return hexdigest
+
+    def loaded_fingerprint(self, components: TupleOfStrings) -> typing.Union[str, None]:
+        # only if the file hasn't changed since, which costs a stat rather than reading it all again
+        path = os.path.join(*components)
+        try:
+            return self._remembered_digest(path, os.stat(path))
+        except OSError:
+            return None
@@ -1,26 +1,288 @@
+import collections
+import gzip
+import http.client
+import io
 import json
 import logging
-import urllib.request
+import threading
+import time
+import typing
+import urllib.error
+import urllib.parse
+import weakref
 
 from mccq.data_loader.abc.data_loader import DataLoader
+from mccq.instrumentation import METRICS
 from mccq.typedefs import TupleOfStrings
 
 log = logging.getLogger(__name__)
 
+# how many redirects to follow before giving up
+MAX_REDIRECTS = 5
+
+REDIRECT_STATUSES = frozenset((301, 302, 303, 307, 308))
+
+# how many bytes of (still encoded) bodies to hold on to for conditional requests, across all urls
+DEFAULT_MAX_CACHED_BYTES = 16 * 2 ** 20
+
+
+def validators_fingerprint(etag: typing.Union[str, None], last_modified: typing.Union[str, None]) \
+        -> typing.Union[str, None]:
+    if etag or last_modified:
+        return f'{etag}|{last_modified}'
+
+
+class CachedResponse:
+    def __init__(self, etag: str, last_modified: str, encoding: str, body: bytes):
+        self.etag = etag
+        self.last_modified = last_modified
+        self.encoding = encoding
+        self.body = body
+
+
+class StreamedResponse(io.RawIOBase):
+    # a response body read as it arrives, on a connection of its own that's closed along with it
+    def __init__(self, connection: http.client.HTTPConnection, response: http.client.HTTPResponse):
+        super().__init__()
+        self.connection = connection
+        self.response = response
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        return self.response.readinto(buffer)
+
+    def close(self):
+        if not self.closed:
+            try:
+                self.response.close()
+                self.connection.close()
+            finally:
+                super().close()
+
+
+class GzipStream(gzip.GzipFile):
+    # decompresses a stream as it's read, and closes it along with itself (which plain gzip files don't)
+    def __init__(self, stream: typing.BinaryIO):
+        super().__init__(fileobj=stream, mode='rb')
+        self.stream = stream
+
+    def close(self):
+        try:
+            super().close()
+        finally:
+            self.stream.close()
+
 
 class InternetDataLoader(DataLoader):
+    def __init__(
+            self, timeout: float = 30.0, retries: int = 2, backoff: float = 0.5, user_agent: str = 'mccq',
+            max_cached_bytes: int = DEFAULT_MAX_CACHED_BYTES):
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.user_agent = user_agent
+        self.max_cached_bytes = max_cached_bytes
+
+        # connections aren't thread-safe, so each thread keeps its own per host
+        self._local = threading.local()
+        # every pooled connection across all threads, so they can all be closed when done
+        self._pooled: typing.MutableSet[http.client.HTTPConnection] = weakref.WeakSet()
+        self._pooled_lock = threading.Lock()
+
+        # last known validators and (still encoded) body for the most recently fetched urls, so unchanged files can
+        # come back as 304; only urls whose body is still here are requested conditionally, since a 304 is no use
+        # without it, and the least recently fetched are dropped once the bodies add up to more than allowed
+        self._responses: typing.MutableMapping[str, CachedResponse] = collections.OrderedDict()
+        self._cached_bytes = 0
+        self._responses_lock = threading.Lock()
+
+        # validators of the most recent response for each url, so that whatever was loaded can be fingerprinted
+        # without asking again
+        self._fingerprints: typing.Dict[str, str] = {}
+
+    def _connections(self) -> typing.Dict[typing.Tuple[str, str], http.client.HTTPConnection]:
+        connections = getattr(self._local, 'connections', None)
+        if connections is None:
+            connections = self._local.connections = {}
+        return connections
+
+    def _new_connection(self, scheme: str, netloc: str) -> http.client.HTTPConnection:
+        connection_class = http.client.HTTPSConnection if scheme == 'https' else http.client.HTTPConnection
+        return connection_class(netloc, timeout=self.timeout)
+
+    def _connection(self, scheme: str, netloc: str) -> http.client.HTTPConnection:
+        connections = self._connections()
+        connection = connections.get((scheme, netloc))
+        if connection is None:
+            connection = connections[(scheme, netloc)] = self._new_connection(scheme, netloc)
+            with self._pooled_lock:
+                self._pooled.add(connection)
+        return connection
+
+    def _discard_connection(self, scheme: str, netloc: str):
+        connection = self._connections().pop((scheme, netloc), None)
+        if connection is not None:
+            connection.close()
+
+    def _request_once(self, method: str, url: str, headers: typing.Dict[str, str], stream: bool = False) \
+            -> typing.Tuple[int, http.client.HTTPMessage, typing.Union[bytes, StreamedResponse]]:
+        parts = urllib.parse.urlsplit(url)
+        target = urllib.parse.urlunsplit(('', '', parts.path or '/', parts.query, ''))
+
+        # streamed responses are read by someone else, possibly from another thread, so they get a connection of
+        # their own rather than one from the pool
+        if stream:
+            connection = self._new_connection(parts.scheme, parts.netloc)
+            try:
+                connection.request(method, target, headers=headers)
+                response = connection.getresponse()
+                if 200 <= response.status < 300:
+                    return response.status, response.headers, StreamedResponse(connection, response)
+                body = response.read()
+            except:
+                connection.close()
+                raise
+            connection.close()
+            return response.status, response.headers, body
+
+        connection = self._connection(parts.scheme, parts.netloc)
+        try:
+            connection.request(method, target, headers=headers)
+            response = connection.getresponse()
+            # always read the full body, otherwise the connection can't be reused
+            body = response.read()
+        except:
+            self._discard_connection(parts.scheme, parts.netloc)
+            raise
+        if response.will_close:
+            self._discard_connection(parts.scheme, parts.netloc)
+        return response.status, response.headers, body
+
+    def _request(self, method: str, url: str, headers: typing.Dict[str, str] = None, stream: bool = False) \
+            -> typing.Tuple[int, http.client.HTTPMessage, typing.Union[bytes, StreamedResponse]]:
+        # successful responses are returned unread when streaming, and are then up to the caller to close
+        headers = dict(headers or {})
+        headers.setdefault('User-Agent', self.user_agent)
+
+        for redirect in range(MAX_REDIRECTS + 1):
+            for attempt in range(self.retries + 1):
+                try:
+                    status, response_headers, body = self._request_once(method, url, headers, stream)
+                    # server errors are worth retrying, anything else is final
+                    if status < 500 or attempt == self.retries:
+                        break
+                    log.info(f'Retrying {method} {url} after status {status}')
+                except (OSError, http.client.HTTPException) as ex:
+                    if attempt == self.retries:
+                        raise
+                    log.info(f'Retrying {method} {url} after error: {ex}')
+                time.sleep(self.backoff * (2 ** attempt))
+
+            if status in REDIRECT_STATUSES and response_headers.get('Location'):
+                url = urllib.parse.urljoin(url, response_headers['Location'])
+                continue
+
+            if status >= 400:
+                raise urllib.error.HTTPError(url, status, http.client.responses.get(status, ''), response_headers, None)
+
+            return status, response_headers, body
+
+        raise urllib.error.URLError(f'Too many redirects: {url}')
+
+    def _cache_response(self, url: str, response: typing.Union[CachedResponse, None]):
+        with self._responses_lock:
+            previous = self._responses.pop(url, None)
+            if previous is not None:
+                self._cached_bytes -= len(previous.body)
+            if response is None or len(response.body) > self.max_cached_bytes:
+                return
+            self._responses[url] = response
+            self._cached_bytes += len(response.body)
+            while self._cached_bytes > self.max_cached_bytes:
+                _, evicted = self._responses.popitem(last=False)
+                self._cached_bytes -= len(evicted.body)
+
+    def _fetch_encoded(self, url: str) -> typing.Tuple[typing.Union[str, None], bytes]:
+        with self._responses_lock:
+            cached = self._responses.get(url)
+            if cached is not None:
+                self._responses.move_to_end(url)
+
+        headers = {'Accept-Encoding': 'gzip'}
+        if cached:
+            if cached.etag:
+                headers['If-None-Match'] = cached.etag
+            if cached.last_modified:
+                headers['If-Modified-Since'] = cached.last_modified
+
+        status, response_headers, body = self._request('GET', url, headers)
+
+        # count what actually came over the wire
+        if METRICS.enabled:
+            METRICS.count('loader.bytes', len(body))
+
+        if status == 304 and cached:
+            log.info(f'Not modified since last request: {url}')
+            encoding, body = cached.encoding, cached.body
+            etag, last_modified = cached.etag, cached.last_modified
+
+        else:
+            encoding = response_headers.get('Content-Encoding')
+            etag = response_headers.get('ETag')
+            last_modified = response_headers.get('Last-Modified')
+            self._cache_response(
+                url, CachedResponse(etag, last_modified, encoding, body) if etag or last_modified else None)
+
+        self._remember_fingerprint(url, validators_fingerprint(etag, last_modified))
+        return encoding, body
+
+    def _remember_fingerprint(self, url: str, fingerprint: typing.Union[str, None]):
+        if fingerprint is None:
+            self._fingerprints.pop(url, None)
+        else:
+            self._fingerprints[url] = fingerprint
+
+    def fetch(self, url: str) -> bytes:
+        encoding, body = self._fetch_encoded(url)
+        return gzip.decompress(body) if encoding == 'gzip' else body
+
     def load(self, components: TupleOfStrings) -> dict:
         path = '/'.join(components)
         log.info(f'Loading commands from internet: {path}')
-        response = urllib.request.urlopen(path)
-        content = response.read().decode('utf8')
-        raw = json.loads(content)
+        content = self.fetch(path)
+        raw = json.loads(content.decode('utf8'))
         return raw
 
+    def open(self, components: TupleOfStrings) -> typing.BinaryIO:
+        path = '/'.join(components)
+        log.info(f'Streaming commands from internet: {path}')
+        # hand the response over as it arrives (decompressing on the fly) rather than holding any of it in memory,
+        # which means it can't be kept around for conditional requests either
+        _, headers, response = self._request('GET', path, {'Accept-Encoding': 'gzip'}, stream=True)
+        self._remember_fingerprint(path, validators_fingerprint(headers.get('ETag'), headers.get('Last-Modified')))
+        return GzipStream(response) if headers.get('Content-Encoding') == 'gzip' else response
+
     def load_version(self, components: TupleOfStrings) -> str:
         path = '/'.join(components)
         log.info(f'Loading version from internet: {path}')
-        response = urllib.request.urlopen(path)
-        content = response.readline().decode('utf8')
+        content = self.fetch(path).split(b'\n', 1)[0].decode('utf8')
         raw = str(content).strip()
         return raw
+
+    def fingerprint(self, components: TupleOfStrings) -> typing.Union[str, None]:
+        path = '/'.join(components)
+        log.info(f'Fetching fingerprint from internet: {path}')
+        _, headers, _ = self._request('HEAD', path)
+        return validators_fingerprint(headers.get('ETag'), headers.get('Last-Modified'))
+
+    def loaded_fingerprint(self, components: TupleOfStrings) -> typing.Union[str, None]:
+        return self._fingerprints.get('/'.join(components))
+
+    def close(self):
+        # connections are reopened as needed, so the loader can still be used afterwards
+        with self._pooled_lock:
+            connections = tuple(self._pooled)
+        for connection in connections:
+            connection.close()
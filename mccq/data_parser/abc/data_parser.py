@@ -1,4 +1,6 @@
 import abc
+import json
+import typing
 
 from mccq.node.data_node import DataNode
 
@@ -6,3 +8,12 @@ from mccq.node.data_node import DataNode
 class DataParser(abc.ABC):
     @abc.abstractmethod
     def parse(self, raw: dict) -> DataNode: ...
+
+    def parse_stream(self, stream: typing.BinaryIO) -> DataNode:
+        # parsers that can build straight from a stream should override this
+        return self.parse(json.load(stream))
+
+    def index(self, root: DataNode) -> DataNode:
+        # get a freshly built tree ready for queries, whether it was parsed here or came from elsewhere (such as the
+        # tree cache); parsers that do any such work after parsing should override this
+        return root
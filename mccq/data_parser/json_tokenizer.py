@@ -0,0 +1,155 @@
+import codecs
+import json
+import json.decoder
+import re
+import typing
+
+# read this much of the stream at a time
+CHUNK_SIZE = 1 << 16
+
+# refill the buffer whenever fewer than this many characters are left, so that no token is cut in half
+REFILL_THRESHOLD = 256
+
+# optional whitespace followed by punctuation, the start of a string, a number, or a literal
+TOKEN = re.compile(
+    r'[ \t\n\r]*(?:([{}\[\]:,])|(")|(-?(?:0|[1-9]\d*)(?:\.\d+)?(?:[eE][-+]?\d+)?)|(true|false|null))')
+
+LITERALS = {'true': True, 'false': False, 'null': None}
+
+# characters that could still extend a number, if it happens to end where the buffer does
+NUMBER_CHARACTERS = frozenset('0123456789.eE+-')
+
+# token kinds, besides the punctuation characters themselves
+STRING = 'string'
+VALUE = 'value'
+
+Token = typing.Tuple[str, typing.Any]
+
+
+class JSONTokenizer:
+    def __init__(self, stream: typing.BinaryIO, chunk_size: int = CHUNK_SIZE):
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self._decoder = codecs.getincrementaldecoder('utf-8-sig')()
+        self._buffer = ''
+        self._position = 0
+        self._eof = False
+        self._peeked: Token = None
+
+    def _refill(self) -> bool:
+        if self._eof:
+            return False
+        chunk = self.stream.read(self.chunk_size)
+        self._eof = not chunk
+        # drop whatever has already been consumed
+        self._buffer = self._buffer[self._position:] + self._decoder.decode(chunk, final=self._eof)
+        self._position = 0
+        return True
+
+    def _error(self, message: str) -> json.JSONDecodeError:
+        return json.JSONDecodeError(message, self._buffer, self._position)
+
+    def _may_continue(self, match: typing.Match) -> bool:
+        end = match.end()
+        if end >= len(self._buffer):
+            return True
+        return bool(match.group(3)) and self._buffer[end] in NUMBER_CHARACTERS
+
+    def _next(self) -> Token:
+        if len(self._buffer) - self._position < REFILL_THRESHOLD:
+            self._refill()
+
+        while True:
+            match = TOKEN.match(self._buffer, self._position)
+            # a token that runs into the end of the buffer may have been cut short
+            if not self._eof and (match is None or self._may_continue(match)):
+                self._refill()
+                continue
+            break
+
+        if match is None:
+            at_end = not self._buffer[self._position:].strip(' \t\n\r')
+            raise self._error('Unexpected end of data' if at_end else 'Unexpected character')
+
+        punctuation, quote, number, literal = match.groups()
+
+        if punctuation:
+            self._position = match.end()
+            return punctuation, None
+
+        if quote:
+            # strings may be longer than what's left in the buffer, in which case read more and try again
+            while True:
+                try:
+                    value, self._position = json.decoder.scanstring(self._buffer, match.end())
+                    return STRING, value
+                except json.JSONDecodeError:
+                    if not self._refill():
+                        raise
+                    match = TOKEN.match(self._buffer, self._position)
+
+        self._position = match.end()
+
+        if number:
+            return VALUE, float(number) if any(c in number for c in '.eE') else int(number)
+
+        return VALUE, LITERALS[literal]
+
+    def next(self) -> Token:
+        if self._peeked is not None:
+            token, self._peeked = self._peeked, None
+            return token
+        return self._next()
+
+    def peek(self) -> Token:
+        if self._peeked is None:
+            self._peeked = self._next()
+        return self._peeked
+
+    def expect(self, kind: str) -> typing.Any:
+        token_kind, value = self.next()
+        if token_kind != kind:
+            raise self._error(f'Expected {kind} but got {token_kind}')
+        return value
+
+    def members(self) -> typing.Iterable[str]:
+        # yield the name of each member of an object, leaving the tokenizer at its value
+        self.expect('{')
+        if self.peek()[0] == '}':
+            self.next()
+            return
+        while True:
+            name = self.expect(STRING)
+            self.expect(':')
+            yield name
+            kind, _ = self.next()
+            if kind == '}':
+                return
+            if kind != ',':
+                raise self._error(f'Expected , or }} but got {kind}')
+
+    def elements(self) -> typing.Iterable[None]:
+        # yield once per element of an array, leaving the tokenizer at the element
+        self.expect('[')
+        if self.peek()[0] == ']':
+            self.next()
+            return
+        while True:
+            yield None
+            kind, _ = self.next()
+            if kind == ']':
+                return
+            if kind != ',':
+                raise self._error(f'Expected , or ] but got {kind}')
+
+    def value(self) -> typing.Any:
+        # read a whole value, however deeply nested
+        kind, value = self.peek()
+        if kind == '{':
+            return {name: self.value() for name in self.members()}
+        if kind == '[':
+            return [self.value() for _ in self.elements()]
+        if kind in (STRING, VALUE):
+            self.next()
+            return value
+        raise self._error(f'Unexpected {kind}')
@@ -1,77 +1,91 @@
-from mccq.node.data_node import DataNode
+import sys
+import typing
+
+from mccq.data_parser.json_tokenizer import JSONTokenizer, STRING
+from mccq.node.data_node import DataNode, REDIRECT_ANYWHERE
+from mccq.node.node_pool import NodePool
+from mccq.node.redirect_graph import RedirectGraph
 from mccq.data_parser.abc.data_parser import DataParser
 
 
 class V1DataParser(DataParser):
-    def _build(self, key: str, node: dict, command: str, command_t: str):
-        type_ = node['type']
-        executable = node.get('executable')
-        redirect = node.get('redirect')
-        children = node.get('children', {})
+    def __init__(self, node_pool: NodePool = None):
+        # identical subtrees are shared between every tree this parser builds, which is usually one per version
+        self.node_pool = node_pool if node_pool is not None else NodePool()
 
+    @staticmethod
+    def _link(
+            key: str, type_: str, executable: bool, redirect: typing.Union[typing.List[str], None],
+            parser: typing.Union[str, None], my_children: typing.Tuple[DataNode, ...]) -> DataNode:
         # whether my command is relevant enough to be rendered
-        relevant = executable
-
-        # build my argument string
-        if type_ == 'root':
-            args = args_t = ()
-        elif type_ == 'literal':
-            args = args_t = (key,)
-        elif type_ == 'argument':
-            parser = node['parser'].split(sep=':', maxsplit=1)[1]  # get the `string` from `brigadier:string`
-            args = ('<{}>'.format(key),)
-            args_t = ('<{}: {}>'.format(key, parser),)
-        else:
-            args = args_t = ('{}*'.format(key),)
+        relevant = bool(executable)
+
+        # the same few keys and parser names are repeated all over the tree, so share a single copy of each
+        key = sys.intern(key)
+        type_ = sys.intern(type_)
 
-        # argument to provide for parents when collapsing
-        argument = args[0] if args else None
-        argument_t = args_t[0] if args_t else None
+        if type_ == 'argument':
+            parser = sys.intern(parser)
+            parser.split(sep=':', maxsplit=1)[1]  # make sure there's a `string` to get from `brigadier:string`
+        else:
+            parser = None
 
         if redirect:
             # redirect is a list and there may be multiple
-            args += ('->', '|'.join(redirect))
+            redirect = tuple(sys.intern(target) for target in redirect)
             relevant = True
 
         # special case for `execute run`
-        if not (executable or redirect or children):
-            args += ('->', '*')
+        elif not (executable or my_children):
+            redirect = (REDIRECT_ANYWHERE,)
             relevant = True
 
-        # build command
-        my_command = ' '.join(arg for arg in ((command or None,) + args) if arg is not None)
-        my_command_t = ' '.join(arg_t for arg_t in ((command_t or None,) + args_t) if arg_t is not None)
-
-        # build children, if any
-        my_children = tuple(self._build(k, v, my_command, my_command_t) for k, v in children.items())
-
-        # count population
-        population = sum(child.population for child in my_children)
-        if relevant:
-            population += 1
-
-        # build collapsed form
-        collapsed = collapsed_t = None
-        if my_children:
-            collapsed = ' '.join((my_command, '|'.join((child.argument for child in my_children))))
-            collapsed_t = ' '.join((my_command_t, '|'.join((child.argument_t for child in my_children))))
-            # look for at least one grandchild before appending `...`
-            if next((True for child in my_children if child.children), False):
-                collapsed += ' ...'
-                collapsed_t += ' ...'
-
-        return DataNode(
-            relevant=relevant,
-            population=population,
-            key=key,
-            command=my_command,
-            command_t=my_command_t,
-            argument=argument,
-            argument_t=argument_t,
-            collapsed=collapsed,
-            collapsed_t=collapsed_t,
-            children=my_children,
-        )
+        else:
+            redirect = None
+
+        return DataNode.link(key, type_, parser, redirect, relevant, my_children)
+
+    def _build(self, key: str, node: dict) -> DataNode:
+        children = node.get('children', {})
+        my_children = tuple(self._build(k, v) for k, v in children.items())
+        return self._link(
+            key, node['type'], node.get('executable'), node.get('redirect'), node.get('parser'), my_children)
+
+    def _build_streamed(self, key: str, tokens: JSONTokenizer) -> DataNode:
+        # build straight from the stream without ever holding the raw node
+        # fields may come in any order, so collect them all before linking
+        type_ = executable = redirect = parser = None
+        my_children = ()
+
+        for name in tokens.members():
+            if name == 'children':
+                my_children = tuple(self._build_streamed(k, tokens) for k in tokens.members())
+            elif name == 'type':
+                type_ = tokens.expect(STRING)
+            elif name == 'parser':
+                parser = tokens.expect(STRING)
+            elif name == 'executable':
+                executable = tokens.value()
+            elif name == 'redirect':
+                redirect = tokens.value()
+            else:
+                tokens.value()
+
+        if type_ is None:
+            raise KeyError('type')
+
+        return self._link(key, type_, executable, redirect, parser, my_children)
+
+    def index(self, root: DataNode) -> DataNode:
+        # link every redirect to the node it leads to in this tree, so queries can follow them straight away
+        RedirectGraph.for_root(root).resolve_all()
+        # and render every command the way a plain query would, so the common case doesn't have to
+        for child in root.children:
+            child.get_rendered()
+        return root
 
     def parse(self, raw) -> DataNode:
-        return self._build('root', raw, '', '')
+        return self.index(self.node_pool.intern_tree(self._build('root', raw)))
+
+    def parse_stream(self, stream: typing.BinaryIO) -> DataNode:
+        return self.index(self.node_pool.intern_tree(self._build_streamed('root', JSONTokenizer(stream))))
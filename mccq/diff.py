@@ -0,0 +1,231 @@
+import typing
+
+from mccq.instrumentation import METRICS
+from mccq.node.data_node import DataNode
+from mccq.node.query_node import QueryNode
+from mccq.query_arguments import QueryArguments
+from mccq.typedefs import TupleOfStrings
+
+ADDED = '+'
+REMOVED = '-'
+UNCHANGED = ' '
+
+# a status and a rendered command, like `('+', 'tag <targets> list')`
+DiffEntry = typing.Tuple[str, str]
+
+# renders every command of a data node, given the command it derives from
+Renderer = typing.Callable[[DataNode, str], typing.Iterable[str]]
+
+
+class CommandDiff:
+    # entries are in the order they would be rendered, and leave out unchanged commands if asked to
+    def __init__(self, old_version: str, new_version: str, entries: typing.Tuple[DiffEntry, ...]):
+        self.old_version = old_version
+        self.new_version = new_version
+        self.entries = entries
+
+    def _with_status(self, status: str) -> TupleOfStrings:
+        return tuple(command for entry_status, command in self.entries if entry_status == status)
+
+    @property
+    def added(self) -> TupleOfStrings:
+        return self._with_status(ADDED)
+
+    @property
+    def removed(self) -> TupleOfStrings:
+        return self._with_status(REMOVED)
+
+    @property
+    def unchanged(self) -> TupleOfStrings:
+        return self._with_status(UNCHANGED)
+
+    @property
+    def changes(self) -> typing.Tuple[DiffEntry, ...]:
+        return tuple(entry for entry in self.entries if entry[0] != UNCHANGED)
+
+    def as_dict(self) -> dict:
+        return {
+            'old_version': self.old_version,
+            'new_version': self.new_version,
+            'added': list(self.added),
+            'removed': list(self.removed),
+            'unchanged': list(self.unchanged),
+        }
+
+
+def expands(arguments: QueryArguments, node: DataNode) -> bool:
+    # the same decision `QueryManager._commands_recursives` makes between rendering children and collapsing them
+    return bool(node.children) and bool(arguments.explode) or node.expands(arguments.capacity)
+
+
+def same_commands(
+        old: DataNode, new: DataNode, old_command: str, new_command: str, arguments: QueryArguments,
+        render: Renderer) -> bool:
+    # subtrees are only shared between versions when they render the same way, so only the parts that aren't shared
+    # need to be looked at, and only rendered where they don't line up
+    if old_command != new_command:
+        return False
+    if old is new:
+        return True
+    if old.relevant != new.relevant:
+        return False
+    if not (expands(arguments, old) and expands(arguments, new)):
+        return tuple(render(old, old_command)) == tuple(render(new, new_command))
+    if len(old.children) != len(new.children) or any(o.key != n.key for o, n in zip(old.children, new.children)):
+        return False
+    return all(
+        same_commands(
+            old_child, new_child, old_child.extend_command(old_command, arguments.showtypes),
+            new_child.extend_command(new_command, arguments.showtypes), arguments, render)
+        for old_child, new_child in zip(old.children, new.children))
+
+
+def render_query_node(
+        query_node: QueryNode, parent_command: str, showtypes: bool, render: Renderer) -> TupleOfStrings:
+    # every line a query node renders, for when there's nothing to line it up against
+    return tuple(
+        line for leaf, command in query_node.leaves_with_commands(showtypes, parent_command)
+        for line in render(leaf.data_node, command))
+
+
+def same_results(
+        old: typing.Union[QueryNode, None], new: typing.Union[QueryNode, None], arguments: QueryArguments,
+        render: Renderer, old_parent_command: str = '', new_parent_command: str = '') -> bool:
+    # whether two query trees render exactly the same commands in the same order, stopping at the first difference
+    # query trees can't be skipped over like data nodes, since the same node can redirect somewhere else in each version
+    if old is None or new is None:
+        return old is new
+    showtypes = arguments.showtypes
+    # looked up nodes become leaves wherever they're found, so the same node can be a leaf in one version only
+    if bool(old.children) != bool(new.children):
+        return render_query_node(old, old_parent_command, showtypes, render) \
+            == render_query_node(new, new_parent_command, showtypes, render)
+    if not old.children:
+        return same_commands(
+            old.data_node, new.data_node, old.data_node.extend_command(old_parent_command, showtypes),
+            new.data_node.extend_command(new_parent_command, showtypes), arguments, render)
+    if len(old.children) != len(new.children) \
+            or any(o.data_node.key != n.data_node.key for o, n in zip(old.children, new.children)):
+        return False
+    old_command = old.command_for_children(old_parent_command, showtypes)
+    new_command = new.command_for_children(new_parent_command, showtypes)
+    return all(
+        same_results(old_child, new_child, arguments, render, old_command, new_command)
+        for old_child, new_child in zip(old.children, new.children))
+
+
+class TreeDiffer:
+    def __init__(self, arguments: QueryArguments, render: Renderer, include_unchanged: bool = True):
+        self.arguments = arguments
+        self.render = render
+        # leaving out unchanged commands means shared subtrees don't have to be rendered at all
+        self.include_unchanged = include_unchanged
+        self.entries: typing.List[DiffEntry] = []
+        # how many subtrees were skipped over because both versions share them
+        self.shared: int = 0
+
+    def _append(self, status: str, command: str):
+        if status != UNCHANGED or self.include_unchanged:
+            self.entries.append((status, command))
+
+    def _extend(self, status: str, node: DataNode, command: str):
+        if status != UNCHANGED or self.include_unchanged:
+            self.entries.extend((status, line) for line in self.render(node, command))
+
+    def _extend_query(self, status: str, query_node: QueryNode, parent_command: str):
+        if status == UNCHANGED and not self.include_unchanged:
+            return
+        for leaf, command in query_node.leaves_with_commands(self.arguments.showtypes, parent_command):
+            self._extend(status, leaf.data_node, command)
+
+    def _diff_lines(self, old_lines: TupleOfStrings, new_lines: TupleOfStrings):
+        # compare rendered lines when the two sides don't render the same way, like when only one of them collapses
+        old_set = set(old_lines)
+        new_set = set(new_lines)
+        for line in old_lines:
+            self._append(UNCHANGED if line in new_set else REMOVED, line)
+        for line in new_lines:
+            if line not in old_set:
+                self._append(ADDED, line)
+
+    def diff_data_nodes(self, old: DataNode, new: DataNode, old_command: str, new_command: str):
+        # shared subtrees render identically, so render them once and don't bother comparing
+        if old is new and old_command == new_command:
+            self.shared += 1
+            self._extend(UNCHANGED, old, old_command)
+            return
+
+        if not (expands(self.arguments, old) and expands(self.arguments, new)):
+            self._diff_lines(tuple(self.render(old, old_command)), tuple(self.render(new, new_command)))
+            return
+
+        if old.relevant and new.relevant and old_command == new_command:
+            self._append(UNCHANGED, old_command)
+        else:
+            if old.relevant:
+                self._append(REMOVED, old_command)
+            if new.relevant:
+                self._append(ADDED, new_command)
+
+        # keys are unique among siblings, so they line children up between versions
+        showtypes = self.arguments.showtypes
+        new_children = {child.key: child for child in new.children}
+        for child in old.children:
+            child_command = child.extend_command(old_command, showtypes)
+            new_child = new_children.pop(child.key, None)
+            if new_child is None:
+                self._extend(REMOVED, child, child_command)
+            else:
+                self.diff_data_nodes(child, new_child, child_command, new_child.extend_command(new_command, showtypes))
+        for child in new_children.values():
+            self._extend(ADDED, child, child.extend_command(new_command, showtypes))
+
+    def diff_query_nodes(self, old: QueryNode, new: QueryNode, old_parent_command: str, new_parent_command: str):
+        showtypes = self.arguments.showtypes
+
+        # looked up nodes become leaves wherever they're found, so the same node can be a leaf in one version only
+        if bool(old.children) != bool(new.children):
+            self._diff_lines(
+                render_query_node(old, old_parent_command, showtypes, self.render),
+                render_query_node(new, new_parent_command, showtypes, self.render))
+            return
+
+        if not old.children:
+            old_node, new_node = old.data_node, new.data_node
+            self.diff_data_nodes(
+                old_node, new_node, old_node.extend_command(old_parent_command, showtypes),
+                new_node.extend_command(new_parent_command, showtypes))
+            return
+
+        old_command = old.command_for_children(old_parent_command, showtypes)
+        new_command = new.command_for_children(new_parent_command, showtypes)
+        new_children = {child.data_node.key: child for child in new.children}
+        for child in old.children:
+            new_child = new_children.pop(child.data_node.key, None)
+            if new_child is None:
+                self._extend_query(REMOVED, child, old_command)
+            else:
+                self.diff_query_nodes(child, new_child, old_command, new_command)
+        for child in new_children.values():
+            self._extend_query(ADDED, child, new_command)
+
+    def diff_query_trees(self, old: typing.Union[QueryNode, None], new: typing.Union[QueryNode, None]):
+        if old is not None and new is not None:
+            self.diff_query_nodes(old, new, '', '')
+        elif old is not None:
+            self._extend_query(REMOVED, old, '')
+        elif new is not None:
+            self._extend_query(ADDED, new, '')
+
+        if METRICS.enabled:
+            METRICS.count('diff.shared_subtrees', self.shared)
+
+
+def diff_query_trees(
+        old_version: str, new_version: str, old_tree: typing.Union[QueryNode, None],
+        new_tree: typing.Union[QueryNode, None], arguments: QueryArguments, render: Renderer,
+        include_unchanged: bool = True) -> CommandDiff:
+    # walk both trees at once, only rendering both sides where they actually differ
+    differ = TreeDiffer(arguments, render, include_unchanged)
+    differ.diff_query_trees(old_tree, new_tree)
+    return CommandDiff(old_version, new_version, tuple(differ.entries))
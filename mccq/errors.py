@@ -69,6 +69,18 @@ class NoSuchCommand(MCCQError):
         return f'Command does not exist: {self.command}'
 
 
+class NotEnoughVersions(MCCQError):
+    """ Raised when comparing versions but fewer than two of them are available. """
+
+    def __init__(self, versions: tuple, *args):
+        super().__init__(*args)
+        self.versions = versions
+
+    def __str__(self):
+        versions_str = ', '.join(self.versions) or 'none'
+        return f'At least two versions are needed to compare, got: {versions_str}'
+
+
 class InvalidLoader(MCCQError):
     """ Raised when an invalid data parser is provided. """
 
@@ -110,4 +122,16 @@ class ParserFailure(MCCQError):
         self.version = version
 
     def __str__(self):
-        return f'Failed to parse commands for version {self.version}'
\ No newline at end of file
+        return f'Failed to parse commands for version {self.version}'
+
+
+class InvalidTreeCache(MCCQError):
+    """ Raised when a cached tree on disk cannot be used. """
+
+    def __init__(self, version: str, reason: str, *args):
+        super().__init__(*args)
+        self.version = version
+        self.reason = reason
+
+    def __str__(self):
+        return f'Invalid tree cache for version {self.version}: {self.reason}'
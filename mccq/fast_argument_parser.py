@@ -0,0 +1,162 @@
+import argparse
+import functools
+import re
+import shlex
+import typing
+
+from mccq.typedefs import TupleOfStrings
+
+# command strings without any of these characters are split by shlex on whitespace alone
+SHLEX_SPECIAL_CHARACTERS = frozenset('\'"\\')
+
+# the whitespace characters shlex splits on
+SHLEX_TOKEN_PATTERN = re.compile('[^ \t\r\n]+')
+
+# maximum number of distinct command strings to remember parsed arguments for
+PARSED_ARGUMENTS_CACHE_SIZE = 1024
+
+
+class FastPathUnavailable(Exception):
+    pass
+
+
+class FastArgumentParser:
+    def __init__(self, parser: argparse.ArgumentParser, cache_size: int = PARSED_ARGUMENTS_CACHE_SIZE):
+        self.parser = parser
+
+        # build option tables from the actions of the real parser, so that the two can never disagree on the grammar
+        # anything other than flags, single-value options, appended options and one greedy (or optional greedy)
+        # positional is left to the real parser
+        self.flags: typing.Dict[str, argparse.Action] = {}
+        self.options: typing.Dict[str, argparse.Action] = {}
+        self.positional: argparse.Action = None
+        self.defaults: typing.Dict[str, typing.Any] = {}
+
+        for action in parser._actions:
+            if not action.option_strings:
+                if action.nargs in ('+', '*') and self.positional is None:
+                    self.positional = action
+                continue
+
+            if isinstance(action, argparse._StoreTrueAction):
+                table = self.flags
+            elif isinstance(action, (argparse._StoreAction, argparse._AppendAction)) and action.nargs is None:
+                table = self.options
+            else:
+                continue
+
+            for option_string in action.option_strings:
+                table[option_string] = action
+
+            self.defaults[action.dest] = action.default
+
+        # remember results for repeated command strings
+        self.parse_args = functools.lru_cache(maxsize=cache_size)(self._parse_args)
+
+    @staticmethod
+    def split(command: str) -> TupleOfStrings:
+        # only hand off to shlex when there is quoting or escaping to process
+        if SHLEX_SPECIAL_CHARACTERS.intersection(command):
+            return tuple(shlex.split(command))
+        return tuple(SHLEX_TOKEN_PATTERN.findall(command))
+
+    def _store(self, namespace: argparse.Namespace, action: argparse.Action, value: str):
+        if action.type is not None:
+            try:
+                value = action.type(value)
+            except (TypeError, ValueError) as ex:
+                raise FastPathUnavailable() from ex
+
+        if isinstance(action, argparse._AppendAction):
+            getattr(namespace, action.dest).append(value)
+        else:
+            setattr(namespace, action.dest, value)
+
+    def _parse_fast(self, tokens: TupleOfStrings) -> argparse.Namespace:
+        if self.positional is None:
+            raise FastPathUnavailable()
+
+        namespace = argparse.Namespace(**{
+            dest: list(default) if isinstance(default, list) else default for dest, default in self.defaults.items()})
+
+        positionals = []
+        positionals_closed = False
+
+        index = 0
+        while index < len(tokens):
+            token = tokens[index]
+            index += 1
+
+            # positional argument
+            if not token.startswith('-') or token == '-':
+                if token == '-' or positionals_closed:
+                    raise FastPathUnavailable()
+                positionals.append(token)
+                continue
+
+            # a single run of positionals is all that can be consumed
+            if positionals:
+                positionals_closed = True
+
+            # long option, with an optional `=value`
+            if token.startswith('--'):
+                option_string, equals, explicit_value = token.partition('=')
+
+                if option_string in self.flags and not equals:
+                    setattr(namespace, self.flags[option_string].dest, True)
+                    continue
+
+                action = self.options.get(option_string)
+                if action is None:
+                    raise FastPathUnavailable()
+
+                if not equals:
+                    if index >= len(tokens) or tokens[index].startswith('-'):
+                        raise FastPathUnavailable()
+                    explicit_value = tokens[index]
+                    index += 1
+
+                self._store(namespace, action, explicit_value)
+                continue
+
+            # one or more combined short options, the last of which may take a value: `-t`, `-te`, `-tc5`, `-c 5`
+            if '=' in token:
+                raise FastPathUnavailable()
+
+            for position in range(1, len(token)):
+                option_string = '-' + token[position]
+
+                if option_string in self.flags:
+                    setattr(namespace, self.flags[option_string].dest, True)
+                    continue
+
+                action = self.options.get(option_string)
+                if action is None:
+                    raise FastPathUnavailable()
+
+                explicit_value = token[position + 1:]
+                if not explicit_value:
+                    if index >= len(tokens) or tokens[index].startswith('-'):
+                        raise FastPathUnavailable()
+                    explicit_value = tokens[index]
+                    index += 1
+
+                self._store(namespace, action, explicit_value)
+                break
+
+        if not positionals and self.positional.nargs == '+':
+            raise FastPathUnavailable()
+
+        setattr(namespace, self.positional.dest, positionals)
+
+        return namespace
+
+    def _parse_args(self, command: str) -> argparse.Namespace:
+        tokens = self.split(command)
+
+        try:
+            return self._parse_fast(tokens)
+
+        # fall back to the real parser for anything unusual, including errors and help
+        except FastPathUnavailable:
+            return self.parser.parse_args(tokens)
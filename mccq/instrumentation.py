@@ -0,0 +1,160 @@
+import abc
+import contextlib
+import logging
+import threading
+import time
+import typing
+
+log = logging.getLogger(__name__)
+
+# count, total seconds, max seconds
+TimerStats = typing.Tuple[int, float, float]
+
+
+class MetricsSink(abc.ABC):
+    @abc.abstractmethod
+    def timing(self, name: str, seconds: float): ...
+
+    @abc.abstractmethod
+    def count(self, name: str, amount: int): ...
+
+
+class MemorySink(MetricsSink):
+    def __init__(self):
+        self.counters: typing.Dict[str, int] = {}
+        self.timers: typing.Dict[str, TimerStats] = {}
+        self._lock = threading.Lock()
+
+    def timing(self, name: str, seconds: float):
+        with self._lock:
+            count, total, maximum = self.timers.get(name, (0, 0.0, 0.0))
+            self.timers[name] = (count + 1, total + seconds, max(maximum, seconds))
+
+    def count(self, name: str, amount: int):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def reset(self):
+        with self._lock:
+            self.counters = {}
+            self.timers = {}
+
+    def render(self) -> str:
+        lines = []
+        for name, (count, total, maximum) in sorted(self.timers.items()):
+            lines.append(
+                f'{name:<32} {count:>8}x  total {total * 1000:>10.2f}ms  '
+                f'mean {total / count * 1000:>8.3f}ms  max {maximum * 1000:>8.3f}ms')
+        for name, value in sorted(self.counters.items()):
+            lines.append(f'{name:<32} {value:>8}')
+        return '\n'.join(lines)
+
+
+class PrometheusSink(MemorySink):
+    def __init__(self, prefix: str = 'mccq'):
+        super().__init__()
+        self.prefix = prefix
+
+    def _metric_name(self, name: str) -> str:
+        return f'{self.prefix}_' + ''.join(c if c.isalnum() else '_' for c in name)
+
+    def render(self) -> str:
+        # prometheus text exposition format: counters as totals, timers as summaries without quantiles
+        lines = []
+        for name, (count, total, _) in sorted(self.timers.items()):
+            metric = self._metric_name(name) + '_seconds'
+            lines.append(f'# TYPE {metric} summary')
+            lines.append(f'{metric}_count {count}')
+            lines.append(f'{metric}_sum {total}')
+        for name, value in sorted(self.counters.items()):
+            metric = self._metric_name(name) + '_total'
+            lines.append(f'# TYPE {metric} counter')
+            lines.append(f'{metric} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+class LoggingSink(MetricsSink):
+    def __init__(self, level: int = logging.INFO):
+        self.level = level
+
+    def timing(self, name: str, seconds: float):
+        log.log(self.level, f'{name} took {seconds * 1000:.3f}ms')
+
+    def count(self, name: str, amount: int):
+        log.log(self.level, f'{name} +{amount}')
+
+
+METRICS_SINKS = {
+    'memory': MemorySink,
+    'prometheus': PrometheusSink,
+    'logging': LoggingSink,
+}
+
+
+class Metrics:
+    def __init__(self):
+        # never modified in place, only replaced while holding the lock, so that recording from other threads can keep
+        # iterating over the sinks without locking anything
+        self.sinks: typing.List[MetricsSink] = []
+        self._sinks_lock = threading.Lock()
+
+        # checked by every instrumented call site before doing any work, so that disabled metrics cost next to nothing
+        self.enabled = False
+
+    def add_sink(self, sink: MetricsSink):
+        with self._sinks_lock:
+            self.sinks = [*self.sinks, sink]
+            self.enabled = True
+
+    def remove_sink(self, sink: MetricsSink):
+        with self._sinks_lock:
+            sinks = list(self.sinks)
+            sinks.remove(sink)
+            self.sinks = sinks
+            self.enabled = bool(sinks)
+
+    def find_sink(self, sink_type: typing.Type[MetricsSink]) -> typing.Union[MetricsSink, None]:
+        for sink in self.sinks:
+            if isinstance(sink, sink_type):
+                return sink
+
+    def timing(self, name: str, seconds: float):
+        for sink in self.sinks:
+            sink.timing(name, seconds)
+
+    def count(self, name: str, amount: int = 1):
+        for sink in self.sinks:
+            sink.count(name, amount)
+
+    @contextlib.contextmanager
+    def timer(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timing(name, time.perf_counter() - start)
+
+    def timed_iterable(self, name: str, iterable: typing.Iterable, counter: str = None) -> typing.Iterable:
+        # time only what's spent producing items, not what the consumer does with them in between
+        iterator = iter(iterable)
+        elapsed = 0.0
+        produced = 0
+        try:
+            while True:
+                start = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+                finally:
+                    elapsed += time.perf_counter() - start
+                produced += 1
+                yield item
+        finally:
+            self.timing(name, elapsed)
+            if counter:
+                self.count(counter, produced)
+
+
+# shared by everything in the process, and disabled until a sink is added
+METRICS = Metrics()
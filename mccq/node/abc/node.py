@@ -3,6 +3,8 @@ import typing
 
 
 class Node(abc.ABC):
+    __slots__ = ()
+
     def leaves(self) -> typing.Iterable['Node']:
         if self.children:
             for child in self.children:
@@ -10,6 +12,9 @@ class Node(abc.ABC):
         else:
             yield self
 
+    def size(self) -> int:
+        return 1 + sum(child.size() for child in self.children)
+
     @property
     @abc.abstractmethod
     def children(self) -> typing.Tuple['Node', ...]: ...
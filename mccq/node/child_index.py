@@ -0,0 +1,30 @@
+import bisect
+import typing
+
+from mccq.node.abc.node import Node
+
+# nodes with fewer children than this are cheaper to scan than to bisect
+CHILD_INDEX_THRESHOLD = 8
+
+
+class ChildIndex:
+    def __init__(self, children: typing.Sequence[Node]):
+        # sort lowercase child keys, remembering where each child was originally so results keep their order
+        pairs = sorted((child.key.lower(), position) for position, child in enumerate(children))
+        self.keys: typing.Tuple[str, ...] = tuple(key for key, _ in pairs)
+        self.positions: typing.Tuple[int, ...] = tuple(position for _, position in pairs)
+        self.children = tuple(children)
+
+    def _select(self, start: int, stop: int) -> typing.Tuple[Node, ...]:
+        children = self.children
+        return tuple(children[position] for position in sorted(self.positions[start:stop]))
+
+    def with_prefix(self, prefix: str) -> typing.Tuple[Node, ...]:
+        keys = self.keys
+        start = stop = bisect.bisect_left(keys, prefix)
+        while stop < len(keys) and keys[stop].startswith(prefix):
+            stop += 1
+        return self._select(start, stop)
+
+    def with_key(self, key: str) -> typing.Tuple[Node, ...]:
+        return self._select(bisect.bisect_left(self.keys, key), bisect.bisect_right(self.keys, key))
@@ -1,36 +1,154 @@
 import typing
 
 from mccq.node.abc.node import Node
+from mccq.node.child_index import CHILD_INDEX_THRESHOLD, ChildIndex
+from mccq.typedefs import TupleOfStrings
+
+# redirect target used for nodes that lead nowhere, like `execute run`
+REDIRECT_ANYWHERE = '*'
+
+# how many subcommands a command renders before collapsing them, unless told otherwise
+DEFAULT_CAPACITY = 12
+
+# what most leaves render as: their own command, and nothing else
+RENDERED_SELF = ('',)
 
 
 class DataNode(Node):
+    # data nodes are created in the tens of thousands per version, so keep them small: only the raw node data is
+    # stored, and rendered strings are derived on demand from the commands leading up to them
+    # nodes are shared between versions and so have no single parent; commands are passed down from the root instead
+    __slots__ = (
+        'relevant', 'population', 'key', 'type', 'parser', 'redirect', '_children', 'child_index', '_rendered', '_size',
+        '__weakref__')
+
     def __init__(
             self,
             relevant: bool = None,
             population: int = None,
             key: str = None,
-            command: str = None,
-            command_t: str = None,
-            argument: str = None,
-            argument_t: str = None,
-            collapsed: str = None,
-            collapsed_t: str = None,
+            type_: str = None,
+            parser: str = None,
+            redirect: TupleOfStrings = None,
             children: typing.Tuple['DataNode', ...] = None,
+            child_index: ChildIndex = None,
+            size: int = None,
     ):
         self.relevant = relevant
         self.population = population
         self.key = key
-        self.command = command
-        self.command_t = command_t
-        self.argument = argument
-        self.argument_t = argument_t
-        self.collapsed = collapsed
-        self.collapsed_t = collapsed_t
+        self.type = type_
+        self.parser = parser
+        self.redirect = redirect
         self._children = children
+        self.child_index = child_index
+        self._rendered: TupleOfStrings = None
+        self._size = size
+
+    @classmethod
+    def link(
+            cls, key: str, type_: str, parser: typing.Union[str, None], redirect: typing.Union[TupleOfStrings, None],
+            relevant: bool, children: typing.Tuple['DataNode', ...]) -> 'DataNode':
+        # count population
+        population = sum(child.population for child in children)
+        if relevant:
+            population += 1
+
+        # index children by key so that anchored lookups don't have to scan them all
+        child_index = ChildIndex(children) if len(children) >= CHILD_INDEX_THRESHOLD else None
+
+        return cls(
+            relevant=relevant,
+            population=population,
+            key=key,
+            type_=type_,
+            parser=parser,
+            redirect=redirect,
+            children=children,
+            child_index=child_index,
+            size=1 + sum(child.size() for child in children),
+        )
 
     def leaves(self) -> typing.Iterable['DataNode']:
         return super().leaves()
 
+    def size(self) -> int:
+        # counted once when linking, since the index relies on it to find its way back down to a node
+        if self._size is None:
+            self._size = super().size()
+        return self._size
+
     @property
     def children(self) -> typing.Tuple['DataNode', ...]:
         return self._children or ()
+
+    @property
+    def argument(self) -> typing.Union[str, None]:
+        # argument to provide for parents when collapsing
+        if self.type == 'literal':
+            return self.key
+        elif self.type == 'argument':
+            return f'<{self.key}>'
+        elif self.type == 'root':
+            return None
+        return f'{self.key}*'
+
+    @property
+    def argument_t(self) -> typing.Union[str, None]:
+        if self.type == 'argument':
+            parser = self.parser.split(sep=':', maxsplit=1)[1]  # get the `string` from `brigadier:string`
+            return f'<{self.key}: {parser}>'
+        return self.argument
+
+    def extend_command(self, command: str, showtypes: bool = False, show_redirect: bool = True) -> str:
+        # build my command by appending my argument (and redirect, if any) to my parent's command
+        # note that typed commands have never rendered redirects
+        argument = self.argument_t if showtypes else self.argument
+        args = (command or None, argument)
+        if self.redirect and show_redirect and not showtypes:
+            args += ('->', '|'.join(self.redirect))
+        return ' '.join(arg for arg in args if arg is not None)
+
+    def get_collapsed(self, showtypes: bool, command: str) -> typing.Union[str, None]:
+        children = self.children
+        if not children:
+            return None
+
+        arguments = (child.argument_t for child in children) if showtypes else (child.argument for child in children)
+        collapsed = ' '.join((command, '|'.join(arguments)))
+
+        # look for at least one grandchild before appending `...`
+        if next((True for child in children if child.children), False):
+            collapsed += ' ...'
+
+        return collapsed
+
+    def expands(self, capacity: int) -> bool:
+        # whether to render my children rather than a collapsed form of them, which is when either:
+        #   1. capacity has not been reached
+        #   2. there's only one child anyway
+        return bool(self.children) and (self.population <= capacity or len(self.children) == 1)
+
+    def _render(self) -> TupleOfStrings:
+        if not self.children:
+            return RENDERED_SELF if self.relevant else ()
+
+        rendered = [''] if self.relevant else []
+        if self.expands(DEFAULT_CAPACITY):
+            for child in self.children:
+                prefix = ' ' + child.extend_command('')
+                rendered.extend(prefix + line for line in child.get_rendered())
+        else:
+            # relative to an empty command, the collapsed form is just what gets appended to mine
+            rendered.append(self.get_collapsed(False, ''))
+        return tuple(rendered)
+
+    def get_rendered(self) -> TupleOfStrings:
+        # the lines I render as by default (without types, at the default capacity), each relative to my own command
+        # (which is rendered as `''`); they only depend on my subtree, so they're worked out once and shared by every
+        # version that shares me
+        # only the default is kept, so that the cache stays one entry per node no matter what gets queried
+        rendered = self._rendered
+        if rendered is None:
+            rendered = self._rendered = self._render()
+        return rendered
@@ -0,0 +1,130 @@
+import array
+import bisect
+import threading
+import typing
+import weakref
+
+from mccq.node.data_node import DataNode
+from mccq.node.query_node import QueryNode
+from mccq.token_matcher import TokenMatcher
+
+# positions of the nodes that contain a particular key (in lowercase, since tokens are case-insensitive), where a
+# position counts nodes in a depth-first walk of the tree starting with the root at 0
+# positions are kept instead of the nodes themselves so that an index doesn't keep its tree (or any tree sharing its
+# nodes) alive, and because they're far smaller than a reference per node would be
+# example: `{'targets': array('I', [1041, 1045, ...])}`
+PositionsByKey = typing.Dict[str, typing.Sequence[int]]
+
+# what can be looked up: argument types like `block_pos`, argument names like `targets` and literals like `add`
+TYPES = 'types'
+ARGUMENTS = 'arguments'
+LITERALS = 'literals'
+
+
+class NodeIndex:
+    # an inverted index of a single tree, so that questions like "which commands take a `block_pos`" don't require
+    # rendering and searching every command; like redirects, it belongs to one particular tree because subtrees are
+    # shared between versions
+    # indexes are built on the first lookup, since most trees never see one
+    _indexes: typing.MutableMapping[DataNode, 'NodeIndex'] = weakref.WeakKeyDictionary()
+    _indexes_lock = threading.Lock()
+
+    def __init__(self, root: DataNode):
+        self.keys: typing.Dict[str, PositionsByKey] = {}
+
+        # the same keys in order, so that anchored tokens can be looked up with a bisect rather than a scan
+        self.sorted_keys: typing.Dict[str, typing.Tuple[str, ...]] = {}
+
+        self._build(root)
+
+    @classmethod
+    def for_root(cls, root: DataNode) -> 'NodeIndex':
+        with cls._indexes_lock:
+            index = cls._indexes.get(root)
+            if index is None:
+                index = cls._indexes[root] = cls(root)
+            return index
+
+    def _build(self, root: DataNode):
+        types, arguments, literals = ({} for _ in range(3))
+
+        # walk the tree once, depth-first, so that every list of positions comes out in order
+        position = 0
+        pending = [root]
+        while pending:
+            node = pending.pop()
+
+            if node.type == 'argument':
+                # index the `block_pos` of `minecraft:block_pos`, the same way `-t` renders it
+                types.setdefault(node.parser.split(sep=':', maxsplit=1)[1].lower(), []).append(position)
+                arguments.setdefault(node.key.lower(), []).append(position)
+            elif node.type == 'literal':
+                literals.setdefault(node.key.lower(), []).append(position)
+
+            position += 1
+            pending.extend(reversed(node.children))
+
+        for kind, positions_by_key in ((TYPES, types), (ARGUMENTS, arguments), (LITERALS, literals)):
+            self.keys[kind] = {key: array.array('I', positions) for key, positions in positions_by_key.items()}
+            self.sorted_keys[kind] = tuple(sorted(positions_by_key))
+
+    def _matching_keys(self, kind: str, matcher: TokenMatcher) -> typing.Iterable[str]:
+        keys = self.keys[kind]
+        if matcher.matches_every_key:
+            return keys
+        if matcher.anchored_start and matcher.ignorecase:
+            if matcher.anchored_end:
+                return (matcher.literal,) if matcher.literal in keys else ()
+            sorted_keys = self.sorted_keys[kind]
+            start = stop = bisect.bisect_left(sorted_keys, matcher.literal)
+            while stop < len(sorted_keys) and sorted_keys[stop].startswith(matcher.literal):
+                stop += 1
+            return sorted_keys[start:stop]
+        # only the distinct keys need matching, and there are far fewer of those than there are nodes
+        return (key for key in keys if matcher.matches(key))
+
+    def lookup(self, kind: str, matcher: TokenMatcher) -> typing.Set[int]:
+        keys = self.keys[kind]
+        return {position for key in self._matching_keys(kind, matcher) for position in keys[key]}
+
+    def find(self, lookups: typing.Iterable[typing.Tuple[str, TokenMatcher]]) -> typing.List[int]:
+        # positions of the nodes matching every lookup, in order
+        found = None
+        for kind, matcher in lookups:
+            positions = self.lookup(kind, matcher)
+            found = positions if found is None else found & positions
+        return sorted(found or ())
+
+    @staticmethod
+    def query_tree(
+            root: DataNode, positions: typing.Sequence[int],
+            scopes: typing.Container[DataNode] = None) -> typing.Union[QueryNode, None]:
+        # arrange the found nodes into a query tree, so they render like any other query would have found them
+        # if scopes are given, only nodes that are, or are somewhere below, any of them are kept
+        # a found node becomes a leaf and is rendered along with anything found below it
+
+        def build(node: DataNode, position: int, start: int, stop: int, scoped: bool) -> typing.Union[QueryNode, None]:
+            # positions[start:stop] all fall somewhere within this node's subtree
+            scoped = scoped or node in scopes
+            if positions[start] == position:
+                if scoped:
+                    return QueryNode(data_node=node)
+                start += 1
+            children = []
+            child_position = position + 1
+            for child in node.children:
+                if start == stop:
+                    break
+                end = child_position + child.size()
+                child_stop = bisect.bisect_left(positions, end, start, stop)
+                if child_stop > start:
+                    query_child = build(child, child_position, start, child_stop, scoped)
+                    if query_child is not None:
+                        children.append(query_child)
+                    start = child_stop
+                child_position = end
+            return QueryNode(data_node=node, children=tuple(children)) if children else None
+
+        if not positions:
+            return None
+        return build(root, 0, 0, len(positions), scopes is None)
@@ -0,0 +1,83 @@
+import hashlib
+import threading
+import typing
+import weakref
+
+from mccq.node.data_node import DataNode
+from mccq.typedefs import TupleOfStrings
+
+# size of the content hashes used to identify identical subtrees
+DIGEST_SIZE = 16
+
+
+def _digest(*parts: bytes) -> bytes:
+    return hashlib.blake2b(b'\0'.join(parts), digest_size=DIGEST_SIZE).digest()
+
+
+def path_digest(
+        parent_path: bytes, key: str, type_: str, parser: typing.Union[str, None],
+        redirect: typing.Union[TupleOfStrings, None]) -> bytes:
+    # commands are derived from parents, so a subtree can only be shared with others in the same position
+    # hash everything that contributes to a node's command, including its parent's path
+    return _digest(
+        parent_path, key.encode(), type_.encode(), (parser or '').encode(), '|'.join(redirect or ()).encode())
+
+
+def subtree_digest(path: bytes, relevant: bool, child_digests: typing.Iterable[bytes]) -> bytes:
+    # identify a subtree by its path, its relevance, and the contents of its children
+    return _digest(path, b'1' if relevant else b'0', *child_digests)
+
+
+def tree_digests(node: DataNode, parent_path: bytes = b'') -> typing.Iterable[typing.Tuple[DataNode, bytes]]:
+    # yield every node in the tree along with its digest, in post-order
+    my_path = path_digest(parent_path, node.key, node.type, node.parser, node.redirect)
+    child_digests = []
+    for child in node.children:
+        for descendant, digest in tree_digests(child, my_path):
+            yield descendant, digest
+        child_digests.append(digest)
+    yield node, subtree_digest(my_path, node.relevant, child_digests)
+
+
+class NodePool:
+    def __init__(self):
+        # nodes are only kept alive by the trees that use them, so unused subtrees disappear along with their versions
+        self._nodes: typing.MutableMapping[bytes, DataNode] = weakref.WeakValueDictionary()
+        self.hits: int = 0
+        self.misses: int = 0
+
+        # several versions may be parsed at the same time
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._nodes)
+
+    def intern(self, digest: bytes, factory: typing.Callable[[], DataNode]) -> DataNode:
+        # reuse an identical subtree if there is one, otherwise create and remember it
+        with self._lock:
+            node = self._nodes.get(digest)
+            if node is None:
+                node = factory()
+                self._nodes[digest] = node
+                self.misses += 1
+            else:
+                self.hits += 1
+            return node
+
+    def _intern_subtree(self, node: DataNode, parent_path: bytes) -> typing.Tuple[DataNode, bytes]:
+        my_path = path_digest(parent_path, node.key, node.type, node.parser, node.redirect)
+        interned = tuple(self._intern_subtree(child, my_path) for child in node.children)
+        digest = subtree_digest(my_path, node.relevant, (child_digest for _, child_digest in interned))
+
+        def relink() -> DataNode:
+            children = tuple(child for child, _ in interned)
+            # keep the node as it is, unless some of its children were swapped for shared ones
+            if all(child is original for child, original in zip(children, node.children)):
+                return node
+            return DataNode.link(node.key, node.type, node.parser, node.redirect, node.relevant, children)
+
+        return self.intern(digest, relink), digest
+
+    def intern_tree(self, root: DataNode) -> DataNode:
+        # replace every subtree of a freshly built tree with an identical one that already exists, if any
+        return self._intern_subtree(root, b'')[0]
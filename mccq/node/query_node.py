@@ -2,9 +2,12 @@ import typing
 
 from mccq.node.abc.node import Node
 from mccq.node.data_node import DataNode
+from mccq.node.redirect_graph import follows_redirect
 
 
 class QueryNode(Node):
+    __slots__ = ('data_node', '_children')
+
     def __init__(self, data_node: DataNode, children: typing.Tuple['QueryNode', ...] = None):
         self.data_node = data_node
         self._children = children
@@ -12,6 +15,24 @@ class QueryNode(Node):
     def leaves(self) -> typing.Iterable['QueryNode']:
         return super().leaves()
 
+    def command_for_children(self, parent_command: str, showtypes: bool = False) -> str:
+        # children reached through a redirect continue my command, minus the redirect itself
+        return self.data_node.extend_command(
+            parent_command, showtypes, show_redirect=not follows_redirect(self.data_node))
+
+    def leaves_with_commands(self, showtypes: bool = False, parent_command: str = '') \
+            -> typing.Iterable[typing.Tuple['QueryNode', str]]:
+        # commands are derived on the way down, since data nodes are shared between versions and don't know their
+        # parents, and leaves reached through a redirect live somewhere else in the tree anyway
+        # the parent command is empty for the root of a query tree
+        if not self._children:
+            yield self, self.data_node.extend_command(parent_command, showtypes)
+            return
+
+        command = self.command_for_children(parent_command, showtypes)
+        for child in self._children:
+            yield from child.leaves_with_commands(showtypes, command)
+
     @property
     def children(self) -> typing.Tuple['QueryNode', ...]:
         return self._children or ()
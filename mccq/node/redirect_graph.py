@@ -0,0 +1,104 @@
+import logging
+import threading
+import typing
+import weakref
+
+from mccq.node.data_node import DataNode, REDIRECT_ANYWHERE
+from mccq.token_matcher import TokenMatcher
+from mccq.typedefs import TupleOfStrings
+
+log = logging.getLogger(__name__)
+
+# stands in for the root among resolved redirects, which can't hold on to it
+LEADS_TO_ROOT = (None,)
+
+
+class RedirectGraph:
+    # redirects are stored as paths from the root, like `('execute',)`, because subtrees are shared between versions
+    # and the same path can lead to a different node in each of them; this resolves them against one particular tree
+    # graphs are kept alongside their roots, so they must never refer back to them or the tree would live forever
+    _graphs: typing.MutableMapping[DataNode, 'RedirectGraph'] = weakref.WeakKeyDictionary()
+    _graphs_lock = threading.Lock()
+
+    def __init__(self, root: DataNode):
+        self._root = weakref.ref(root)
+        # redirects that lead back to the root are remembered as `LEADS_TO_ROOT` rather than the root itself
+        self._targets: typing.Dict[TupleOfStrings, typing.Tuple[DataNode, ...]] = {}
+
+    @property
+    def root(self) -> DataNode:
+        return self._root()
+
+    @classmethod
+    def for_root(cls, root: DataNode) -> 'RedirectGraph':
+        with cls._graphs_lock:
+            graph = cls._graphs.get(root)
+            if graph is None:
+                graph = cls._graphs[root] = cls(root)
+            return graph
+
+    @staticmethod
+    def _find(path: TupleOfStrings, root: DataNode) -> typing.Union[DataNode, None]:
+        # `execute run` leads back to the root, where any command can follow
+        if path == (REDIRECT_ANYWHERE,):
+            return root
+        node = root
+        for key in path:
+            node = next((child for child in node.children if child.key == key), None)
+            if node is None:
+                return None
+        return node
+
+    def _resolve(self, redirect: TupleOfStrings, root: DataNode) -> typing.Tuple[DataNode, ...]:
+        node = self._find(redirect, root)
+
+        # a redirect to another redirect leads wherever that one does, unless they go around in circles
+        seen = set()
+        while node is not None and not node.children and node.redirect and node.redirect not in seen:
+            seen.add(node.redirect)
+            node = self._find(node.redirect, root)
+
+        if node is None or not node.children:
+            log.debug(f'Redirect to {" ".join(redirect)} leads nowhere')
+            return ()
+
+        return LEADS_TO_ROOT if node is root else (node,)
+
+    def targets(self, node: DataNode) -> typing.Tuple[DataNode, ...]:
+        # the nodes whose children continue a command past the given redirect
+        root = self.root
+        targets = self._targets.get(node.redirect)
+        if targets is None:
+            targets = self._targets[node.redirect] = self._resolve(node.redirect, root)
+        return (root,) if targets is LEADS_TO_ROOT else targets
+
+    def continuations(self, node: DataNode, redirects: int, max_redirects: int, matcher: TokenMatcher = None) \
+            -> typing.Tuple[typing.Tuple[DataNode, ...], int]:
+        # the nodes whose children the next token can match after the given one, and how many redirects were followed
+        # to get there
+        if not follows_redirect(node):
+            return (node,), redirects
+        if not crosses_redirect(matcher, redirects, max_redirects):
+            return (), redirects
+        return self.targets(node), redirects + 1
+
+    def resolve_all(self) -> 'RedirectGraph':
+        # resolve every redirect up front rather than on the first query that runs into it
+        pending = [self.root]
+        while pending:
+            node = pending.pop()
+            if follows_redirect(node):
+                self.targets(node)
+            pending.extend(node.children)
+        return self
+
+
+def crosses_redirect(matcher: typing.Union[TokenMatcher, None], redirects: int, max_redirects: int) -> bool:
+    # wildcards (including `.*` and the like) stop at redirects, otherwise `execute . .` would go through `execute run`
+    # and list every command again
+    return redirects < max_redirects and not (matcher and matcher.matches_every_key)
+
+
+def follows_redirect(node: DataNode) -> bool:
+    # only childless nodes redirect; the rest of the command continues from wherever they lead
+    return bool(node.redirect) and not node.children
@@ -0,0 +1,93 @@
+import cProfile
+import time
+import typing
+
+from mccq.instrumentation import METRICS, MemorySink
+from mccq.query_arguments import QueryArguments
+from mccq.query_manager import QueryManager
+
+# counters for nodes visited while matching, one per token, like `query.visited.0`
+VISITED_PREFIX = 'query.visited.'
+
+
+class QueryProfile(MemorySink):
+    # everything the instrumented call sites report while a single query runs, plus its overall wall time
+    # note that metrics are shared by the whole process, so anything else running at the same time is included too
+    def __init__(self):
+        super().__init__()
+        self.wall: float = 0.0
+        self.pstats_path: typing.Union[str, None] = None
+
+    def seconds(self, *names: str) -> float:
+        return sum(self.timers.get(name, (0, 0.0, 0.0))[1] for name in names)
+
+    def visited(self) -> typing.List[typing.Tuple[int, int]]:
+        # (depth, nodes visited) pairs, shallowest first
+        return sorted(
+            (int(name[len(VISITED_PREFIX):]), count)
+            for name, count in self.counters.items() if name.startswith(VISITED_PREFIX))
+
+    def render(self) -> str:
+        counters = self.counters
+        lines = [
+            f'wall      {self.wall * 1000:>10.3f}ms',
+            f'  parse   {self.seconds("query.parse") * 1000:>10.3f}ms',
+            f'  load    {self.seconds("database.load", "database.parse") * 1000:>10.3f}ms',
+            f'  match   {self.seconds("query.match") * 1000:>10.3f}ms',
+            f'  render  {self.seconds("query.render") * 1000:>10.3f}ms',
+            f'lines rendered        {counters.get("query.lines", 0):>8}',
+            f'regex matches         {counters.get("query.regex_evaluations", 0):>8} attempted',
+            f'literal matches       {counters.get("query.literal_comparisons", 0):>8} attempted',
+            f'matches succeeded     {counters.get("query.matches", 0):>8}',
+            f'index lookups         {counters.get("query.index_lookups", 0):>8}',
+            'nodes visited per depth:',
+        ]
+        lines.extend(f'  {depth:>3}  {count:>8}' for depth, count in self.visited())
+        if self.pstats_path:
+            lines.append(f'profile written to {self.pstats_path}')
+        return '\n'.join(lines)
+
+
+def _run(query_manager: QueryManager, arguments: QueryArguments):
+    # run the query all the way through, skipping the result cache so there's something to see
+    if arguments.diff:
+        query_manager.diffs_from_arguments(arguments)
+        return
+
+    versions = query_manager.filter_versions(arguments)
+    for version in versions:
+        try:
+            for _ in query_manager.commands_for_version(version, arguments):
+                pass
+
+        # like any other query, only let errors propagate when a single version is requested
+        except Exception:
+            if len(versions) == 1:
+                raise
+
+
+def profile_query(query_manager: QueryManager, command: str, pstats_path: str = None) -> QueryProfile:
+    profile = QueryProfile()
+    profiler = cProfile.Profile() if pstats_path else None
+
+    METRICS.add_sink(profile)
+    start = time.perf_counter()
+    try:
+        if profiler:
+            profiler.enable()
+        try:
+            with METRICS.timer('query.parse'):
+                arguments = query_manager.parse_query_arguments(command)
+            _run(query_manager, arguments)
+        finally:
+            if profiler:
+                profiler.disable()
+    finally:
+        profile.wall = time.perf_counter() - start
+        METRICS.remove_sink(profile)
+
+    if profiler:
+        profiler.dump_stats(pstats_path)
+        profile.pstats_path = pstats_path
+
+    return profile
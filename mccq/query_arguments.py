@@ -1,3 +1,6 @@
+import typing
+
+from mccq.node.node_index import ARGUMENTS, LITERALS, TYPES
 from mccq.typedefs import TupleOfStrings
 
 
@@ -9,9 +12,37 @@ class QueryArguments:
             explode: bool = None,
             capacity: int = None,
             versions: TupleOfStrings = None,
+            limit: int = None,
+            diff: bool = None,
+            type_: str = None,
+            arg: str = None,
+            literal: str = None,
+            profile: bool = None,
     ):
         self.command = command
         self.showtypes = showtypes
         self.explode = explode
         self.capacity = capacity
         self.versions = versions
+        self.limit = limit
+        self.diff = diff
+        self.type = type_
+        self.arg = arg
+        self.literal = literal
+        self.profile = profile
+
+    def lookups(self) -> typing.Tuple[typing.Tuple[str, str], ...]:
+        # (index, token) pairs to look up nodes by, rather than searching for them from the root
+        lookups = ((TYPES, self.type), (ARGUMENTS, self.arg), (LITERALS, self.literal))
+        return tuple((kind, token) for kind, token in lookups if token is not None)
+
+    def normalized(self) -> tuple:
+        # capacity is meaningless when exploding, so leave it out to share results
+        return (
+            self.command,
+            bool(self.showtypes),
+            bool(self.explode),
+            None if self.explode else self.capacity,
+            self.limit,
+            self.lookups(),
+        )
@@ -1,19 +1,41 @@
-import re
-import shlex
+import concurrent.futures
+import itertools
+import threading
 import typing
 
 from mccq import errors
 from mccq.argument_parser import ArgumentParser
-from mccq.node.data_node import DataNode
+from mccq.diff import CommandDiff, Renderer, diff_query_trees, same_results
+from mccq.fast_argument_parser import FastArgumentParser
+from mccq.instrumentation import METRICS
+from mccq.node.data_node import DataNode, DEFAULT_CAPACITY
+from mccq.node.node_index import NodeIndex
 from mccq.node.query_node import QueryNode
+from mccq.node.redirect_graph import RedirectGraph, crosses_redirect, follows_redirect
 from mccq.query_arguments import QueryArguments
+from mccq.result_cache import ResultCache
+from mccq.token_matcher import TokenMatcher, get_token_matcher
 from mccq.typedefs import IterableOfStrings, TupleOfStrings
-from mccq.version_database import VersionDatabase
+from mccq.version_database import ReloadReport, VersionDatabase
 
 # map of version names to command results
 # example: `{'18w01a': ('tag <targets> add <tag>', 'tag <targets> remove <tag>')}`
 QueryResults = typing.Dict[str, TupleOfStrings]
 
+# the same results as (version name, command) pairs, in order, produced as they are rendered
+QueryResultStream = typing.Iterable[typing.Tuple[str, str]]
+
+# maximum number of redirects to follow along any one path through a query, like `execute as ... at ... run ...`
+# every redirect followed uses up a token, so cycles can't go on forever, but this keeps absurd queries in check
+MAX_REDIRECTS = 32
+
+# query nodes already worked out for a (data node, token index, redirects followed) state, or `None` for dead ends
+QueryMemo = typing.Dict[typing.Tuple[DataNode, int, int], typing.Union[QueryNode, None]]
+
+# the same again, but with consecutive versions that have identical results grouped together
+# example: `(('18w01a', '18w02a'), 'say <message>')`
+GroupedQueryResultStream = typing.Iterable[typing.Tuple[TupleOfStrings, str]]
+
 
 class QueryManager:
     ARGUMENT_PARSER = ArgumentParser(
@@ -29,73 +51,157 @@ class QueryManager:
         '-e', '--explode', action='store_true', help='whether to expand all subcommands, regardless of capacity')
 
     ARGUMENT_PARSER.add_argument(
-        '-c', '--capacity', type=int, default=12, help='maximum number of subcommands to render before collapsing')
+        '-c', '--capacity', type=int, default=DEFAULT_CAPACITY,
+        help='maximum number of subcommands to render before collapsing')
 
     ARGUMENT_PARSER.add_argument(
         '-v', '--version', action='append', default=[], help='which version(s) to use for the command (repeatable)')
 
     ARGUMENT_PARSER.add_argument(
-        'command', nargs='+', help='the command query')
+        '-l', '--limit', type=int, default=None, help='maximum number of commands to render per version')
+
+    ARGUMENT_PARSER.add_argument(
+        '-d', '--diff', action='store_true', help='whether to show what changed between each version and the next')
+
+    ARGUMENT_PARSER.add_argument(
+        '--type', help='only show commands with an argument of a matching type, like `block_pos`')
+
+    ARGUMENT_PARSER.add_argument(
+        '--arg', help='only show commands with an argument of a matching name, like `targets`')
+
+    ARGUMENT_PARSER.add_argument(
+        '--literal', help='only show commands with a matching subcommand, like `add`')
+
+    ARGUMENT_PARSER.add_argument(
+        '--profile', action='store_true', help='whether to report where the time went while running the query')
+
+    ARGUMENT_PARSER.add_argument(
+        'command', nargs='*', help='the command query (optional with --type, --arg or --literal)')
+
+    # hand-written parser for the common cases, falling back to the one above
+    FAST_ARGUMENT_PARSER = FastArgumentParser(ARGUMENT_PARSER)
 
     def __init__(
             self,
             database: VersionDatabase,
             show_versions: IterableOfStrings,
+            result_cache: ResultCache = None,
+            max_workers: int = None,
+            max_redirects: int = MAX_REDIRECTS,
     ):
         self.database = database
         self.show_versions: TupleOfStrings = tuple(show_versions)
+        self.result_cache = result_cache
+
+        # when set, multiple versions are loaded and queried concurrently using up to this many threads
+        self.max_workers = max_workers
+        self._executor: concurrent.futures.ThreadPoolExecutor = None
+        # guards creating, using and shutting down the executor, so concurrent queries share one and none of them
+        # submits to one that `close` just shut down
+        self._executor_lock = threading.Lock()
+
+        # redirects lead back up the tree and often around in circles, so only follow so many of them in a row
+        self.max_redirects = max_redirects
+
+        # drop cached results whenever a version's tree is replaced
+        if result_cache is not None:
+            database.add_invalidation_listener(result_cache.invalidate)
 
     @staticmethod
     def parse_query_arguments(command: str) -> QueryArguments:
         try:
             # split into tokens using shell-like syntax (preserve quoted substrings)
-            parsed_args = QueryManager.ARGUMENT_PARSER.parse_args(shlex.split(command))
+            parsed_args = QueryManager.FAST_ARGUMENT_PARSER.parse_args(command)
 
             # return an object representation
-            return QueryArguments(
+            arguments = QueryArguments(
                 command=tuple(parsed_args.command),  # immutable copy
                 showtypes=parsed_args.showtypes,
                 explode=parsed_args.explode,
                 capacity=parsed_args.capacity,
                 versions=tuple(parsed_args.version),  # duplicate versions are meaningless
+                limit=parsed_args.limit,
+                diff=parsed_args.diff,
+                type_=parsed_args.type,
+                arg=parsed_args.arg,
+                literal=parsed_args.literal,
+                profile=parsed_args.profile,
             )
 
         except Exception as ex:
             raise errors.ArgumentParserFailed(command) from ex
 
-    def _query_tree_recursive(self, arguments: QueryArguments, node: DataNode, index: int) \
-            -> typing.Union[QueryNode, None]:
+        # there has to be something to search for
+        if not (arguments.command or arguments.lookups()):
+            raise errors.ArgumentParserFailed(command)
+
+        return arguments
+
+    def _query_tree_recursive(
+            self, arguments: QueryArguments, node: DataNode, index: int, matchers: typing.Tuple[TokenMatcher, ...],
+            graph: RedirectGraph, memo: QueryMemo, redirects: int = 0) -> typing.Union[QueryNode, None]:
+        # past a redirect the same node can be reached at the same token along many paths, but what matches from there
+        # is always the same, so only work it out once (before any redirect, every node is only reached once anyway)
+        if redirects:
+            key = (node, index, redirects)
+            if key in memo:
+                return memo[key]
+
+        if METRICS.enabled:
+            METRICS.count(f'query.visited.{index}')
+
+        query_node = None
+
         # determine the current search term
         token = arguments.command[index] if len(arguments.command) > index else None
 
-        # use regex to search for the subcommand/argument name in the patternized token
+        # use the precompiled matcher to search for the subcommand/argument name in the patternized token
         # special case: dot matches all
-        search_children = None if not token else node.children if token in ('.', '*') else tuple(
-            child for child in node.children
-            if re.search(token, child.key, re.IGNORECASE)
-        )
+        search_children = None
+        if token:
+            # carry on from wherever a redirect leads, like `execute as <targets>` leading back to `execute`
+            if follows_redirect(node):
+                if crosses_redirect(matchers[index], redirects, self.max_redirects):
+                    search_children = tuple(
+                        child for target in graph.targets(node) for child in matchers[index].select(target))
+                    child_redirects = redirects + 1
+            else:
+                search_children = matchers[index].select(node)
+                child_redirects = redirects
 
         # branch: search all matching children recursively (depth-first) for subcommands
         if search_children:
             query_children = tuple(item for item in (
-                self._query_tree_recursive(arguments, child, index + 1) for child in search_children
+                self._query_tree_recursive(arguments, child, index + 1, matchers, graph, memo, child_redirects)
+                for child in search_children
             ) if item is not None)
 
             if query_children:
                 # return a query node with the calculated subset of children
-                return QueryNode(data_node=node, children=query_children)
+                query_node = QueryNode(data_node=node, children=query_children)
 
         # leaf: no children to search and tokens depleted; return a childless query node
         # note that even though this is a recursive leaf, the contained data node may itself have children
         elif not token:
-            return QueryNode(data_node=node)
+            query_node = QueryNode(data_node=node)
 
         # at this point 'else' means there are still tokens to search, so the query goes deeper than the current node
         # and we can just ignore it
 
-    def _commands_recursives(self, arguments: QueryArguments, node: DataNode) -> IterableOfStrings:
-        command = node.command_t if arguments.showtypes else node.command
-        collapsed = node.collapsed_t if arguments.showtypes else node.collapsed
+        if redirects:
+            memo[key] = query_node
+
+        return query_node
+
+    def _commands_recursives(self, arguments: QueryArguments, node: DataNode, command: str) -> IterableOfStrings:
+        # commands are derived from parent commands, so pass them down rather than rebuilding them for every node
+
+        # with default settings, what a node renders as is settled by the tree, so it's only worked out once per node
+        # and every query after that is just a matter of putting the command in front
+        if command and not (arguments.explode or arguments.showtypes) and arguments.capacity == DEFAULT_CAPACITY:
+            for line in node.get_rendered():
+                yield command + line
+            return
 
         # render relevant commands:
         #   - all executable commands: `scoreboard players list`, `scoreboard players list <target>`
@@ -105,21 +211,17 @@ class QueryManager:
             yield command
 
         # determine whether to continue searching any existing children for subcommands
-        # if any of the following are true, continue searching:
-        #   1. explode override flag is set
-        #   2. capacity has not been reached
-        #   3. only one child to search
-        if node.children and (
-                arguments.explode
-                or (node.population <= arguments.capacity)
-                or len(node.children) == 1
-        ):
+        # if the explode override flag is set, or the node itself would expand, continue searching
+        if node.children and (arguments.explode or node.expands(arguments.capacity)):
             for child in node.children:
-                yield from self._commands_recursives(arguments, child)
+                yield from self._commands_recursives(
+                    arguments, child, child.extend_command(command, arguments.showtypes))
 
         # otherwise render a collapsed form
-        elif collapsed:
-            yield collapsed
+        else:
+            collapsed = node.get_collapsed(arguments.showtypes, command)
+            if collapsed:
+                yield collapsed
 
     def filter_versions(self, arguments: QueryArguments) -> TupleOfStrings:
         requested_versions = arguments.versions or self.show_versions
@@ -143,12 +245,41 @@ class QueryManager:
         if not root_data_node:
             raise errors.NoSuchVersion(version)
 
+        # compile each token once per query rather than once per visited node
+        matchers = tuple(get_token_matcher(token) for token in arguments.command)
+
+        graph = RedirectGraph.for_root(root_data_node)
+
         # build a trimmed tree containing only the nodes that match the given arguments
-        query_tree = self._query_tree_recursive(arguments, root_data_node, index=0)
+        if METRICS.enabled:
+            with METRICS.timer('query.match'):
+                query_tree = self._query_tree(arguments, root_data_node, matchers, graph)
+            METRICS.count('query.matched_nodes', query_tree.size() if query_tree else 0)
+        else:
+            query_tree = self._query_tree(arguments, root_data_node, matchers, graph)
 
         return query_tree
 
-    def commands_for_version(self, version: str, arguments: QueryArguments) -> IterableOfStrings:
+    def _query_tree(
+            self, arguments: QueryArguments, root_data_node: DataNode, matchers: typing.Tuple[TokenMatcher, ...],
+            graph: RedirectGraph) -> typing.Union[QueryNode, None]:
+        lookups = arguments.lookups()
+        if not lookups:
+            return self._query_tree_recursive(arguments, root_data_node, 0, matchers, graph, {})
+
+        # look nodes up in the index rather than searching the whole tree for them
+        positions = NodeIndex.for_root(root_data_node).find(
+            (kind, get_token_matcher(token)) for kind, token in lookups)
+
+        # any command tokens narrow the lookup down to the commands they match
+        scopes = None
+        if arguments.command:
+            query_tree = self._query_tree_recursive(arguments, root_data_node, 0, matchers, graph, {})
+            scopes = {leaf.data_node for leaf in query_tree.leaves()} if query_tree else set()
+
+        return NodeIndex.query_tree(root_data_node, positions, scopes)
+
+    def _commands_for_version(self, version: str, arguments: QueryArguments) -> IterableOfStrings:
         # first build a result tree from the given arguments
         query_tree = self.query_tree_for_version(version, arguments)
 
@@ -156,16 +287,102 @@ class QueryManager:
         if query_tree:
             # then check every branch and leaf for relevant commands
             # get all leaves of the query tree, and then all of the leaves of their corresponding data nodes
-            for leaf in query_tree.leaves():
-                yield from self._commands_recursives(arguments, leaf.data_node)
+            commands = (
+                command
+                for leaf, leaf_command in query_tree.leaves_with_commands(arguments.showtypes)
+                for command in self._commands_recursives(arguments, leaf.data_node, leaf_command))
+
+            if METRICS.enabled:
+                commands = METRICS.timed_iterable('query.render', commands, counter='query.lines')
+
+            yield from commands
+
+    def commands_for_version(self, version: str, arguments: QueryArguments) -> IterableOfStrings:
+        commands = self._commands_for_version(version, arguments)
+
+        # commands are rendered lazily, so stopping early also stops traversing the tree
+        if arguments.limit is not None:
+            commands = itertools.islice(commands, arguments.limit)
+
+        return commands
+
+    def commands_for_leaves(
+            self, arguments: QueryArguments, leaves: typing.Iterable[typing.Tuple[DataNode, str]]) -> IterableOfStrings:
+        # render the commands below nodes that a query reached some other way than `query_tree_for_version`, each
+        # along with its own command, such as batches walking the tree once for queries that share a prefix
+        commands = (
+            command
+            for node, node_command in leaves
+            for command in self._commands_recursives(arguments, node, node_command))
+
+        if arguments.limit is not None:
+            commands = itertools.islice(commands, arguments.limit)
+
+        return commands
+
+    def cached_commands_for_version(self, version: str, arguments: QueryArguments) -> TupleOfStrings:
+        if self.result_cache is None:
+            return tuple(self.commands_for_version(version, arguments))
+
+        commands = self.result_cache.get(version, arguments)
+        if commands is None:
+            # loading a version invalidates it, so make sure it's loaded before noting which generation rendering starts
+            # from; if the version is invalidated again while rendering, the results aren't cached
+            self.database.get(version)
+            generation = self.result_cache.generation(version)
+            commands = tuple(self.commands_for_version(version, arguments))
+            self.result_cache.put(version, arguments, commands, generation)
+
+        return commands
+
+    def stream_commands_for_version(self, version: str, arguments: QueryArguments) -> IterableOfStrings:
+        if self.result_cache is None:
+            yield from self.commands_for_version(version, arguments)
+            return
+
+        commands = self.result_cache.get(version, arguments)
+        if commands is not None:
+            yield from commands
+            return
+
+        # only cache the commands once they've all been rendered, in case the consumer stops early
+        self.database.get(version)
+        generation = self.result_cache.generation(version)
+        rendered = []
+        for command in self.commands_for_version(version, arguments):
+            rendered.append(command)
+            yield command
+        self.result_cache.put(version, arguments, tuple(rendered), generation)
+
+    def _submit(self, function: typing.Callable, *args) -> concurrent.futures.Future:
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix='mccq-query')
+            return self._executor.submit(function, *args)
+
+    def _commands_for_versions(
+            self, versions: TupleOfStrings, arguments: QueryArguments) -> typing.Iterable[typing.Callable[[], tuple]]:
+        # yield a callable per version that either returns its commands or raises its error, in the original order
+        if self.max_workers and self.max_workers > 1 and len(versions) > 1:
+            # start loading and querying every version at once
+            futures = [
+                self._submit(self.cached_commands_for_version, version, arguments)
+                for version in versions]
+            for future in futures:
+                yield future.result
+        else:
+            for version in versions:
+                yield lambda version=version: self.cached_commands_for_version(version, arguments)
 
     def results_from_versions(self, versions: IterableOfStrings, arguments: QueryArguments) -> QueryResults:
         # ignore errors when multiple versions are specified
         # (not sure how else to handle this gracefully)
+        versions = tuple(versions)
         results = {}
-        for version in versions:
+        for version, get_commands in zip(versions, self._commands_for_versions(versions, arguments)):
             try:
-                commands = tuple(self.commands_for_version(version, arguments))
+                commands = get_commands()
 
             # ignore errors because we may have other results
             except:
@@ -179,7 +396,7 @@ class QueryManager:
 
     def results_from_version(self, version: str, arguments: QueryArguments) -> QueryResults:
         # handle single version requests differently by allowing errors to propagate
-        commands = tuple(self.commands_for_version(version, arguments))
+        commands = self.cached_commands_for_version(version, arguments)
         return {version: commands} if commands else {}
 
     def results_from_arguments(self, arguments: QueryArguments) -> QueryResults:
@@ -190,8 +407,117 @@ class QueryManager:
             results = self.results_from_version(filtered_versions[0], arguments)
         return results
 
+    def _load_in_background(self, versions: TupleOfStrings) -> typing.Dict[str, concurrent.futures.Future]:
+        # load the other versions in the background while the first one is being rendered
+        if self.max_workers and self.max_workers > 1 and len(versions) > 1:
+            return {version: self._submit(self.database.get, version) for version in versions}
+        return {}
+
+    def stream_results_from_arguments(self, arguments: QueryArguments) -> QueryResultStream:
+        filtered_versions = self.filter_versions(arguments)
+
+        # like with results, only let errors propagate when a single version is requested
+        ignore_errors = len(filtered_versions) > 1
+
+        loading = self._load_in_background(filtered_versions)
+
+        for version in filtered_versions:
+            # wait for the background load rather than starting another one; any error is raised again below
+            if version in loading:
+                concurrent.futures.wait((loading[version],))
+
+            try:
+                for command in self.stream_commands_for_version(version, arguments):
+                    yield version, command
+
+            # ignore errors because we may have other results
+            except Exception:
+                if not ignore_errors:
+                    raise
+
+    def _renderer(self, arguments: QueryArguments) -> Renderer:
+        return lambda node, command: self._commands_recursives(arguments, node, command)
+
+    def _stream_group(self, versions: typing.List[str], arguments: QueryArguments) -> GroupedQueryResultStream:
+        # every version in the group has the same results, so only the first one is rendered
+        versions = tuple(versions)
+        for command in self.stream_commands_for_version(versions[0], arguments):
+            yield versions, command
+
+    def stream_grouped_results_from_arguments(self, arguments: QueryArguments) -> GroupedQueryResultStream:
+        filtered_versions = self.filter_versions(arguments)
+        ignore_errors = len(filtered_versions) > 1
+        loading = self._load_in_background(filtered_versions)
+
+        group: typing.List[str] = []
+        group_tree: typing.Union[QueryNode, None] = None
+
+        for version in filtered_versions:
+            if version in loading:
+                concurrent.futures.wait((loading[version],))
+
+            try:
+                query_tree = self.query_tree_for_version(version, arguments)
+                if group and same_results(group_tree, query_tree, arguments, self._renderer(arguments)):
+                    group.append(version)
+                    continue
+
+            except Exception:
+                if not ignore_errors:
+                    raise
+                # a failed version breaks the group up, so that versions on either side of it aren't shown as a range
+                if group:
+                    yield from self._stream_group(group, arguments)
+                group, group_tree = [], None
+                continue
+
+            # this version is different, so everything before it can be rendered
+            if group:
+                yield from self._stream_group(group, arguments)
+            group, group_tree = [version], query_tree
+
+        if group:
+            yield from self._stream_group(group, arguments)
+
+    def diff_versions(
+            self, old_version: str, new_version: str, arguments: QueryArguments,
+            include_unchanged: bool = True) -> CommandDiff:
+        old_tree = self.query_tree_for_version(old_version, arguments)
+        new_tree = self.query_tree_for_version(new_version, arguments)
+        return diff_query_trees(
+            old_version, new_version, old_tree, new_tree, arguments, self._renderer(arguments), include_unchanged)
+
+    def diffs_from_arguments(
+            self, arguments: QueryArguments, include_unchanged: bool = True) -> typing.List[CommandDiff]:
+        # compare each version with the next one, in the order they were requested
+        filtered_versions = self.filter_versions(arguments)
+        if len(filtered_versions) < 2:
+            raise errors.NotEnoughVersions(filtered_versions)
+
+        self._load_in_background(filtered_versions)
+
+        return [
+            self.diff_versions(old_version, new_version, arguments, include_unchanged)
+            for old_version, new_version in zip(filtered_versions, filtered_versions[1:])]
+
+    def stream_results(self, command: str) -> QueryResultStream:
+        return self.stream_results_from_arguments(self.parse_query_arguments(command))
+
     def results(self, command: str) -> QueryResults:
         return self.results_from_arguments(self.parse_query_arguments(command))
 
-    def reload(self):
-        self.database.reload()
+    def stream_grouped_results(self, command: str) -> GroupedQueryResultStream:
+        return self.stream_grouped_results_from_arguments(self.parse_query_arguments(command))
+
+    def diffs(self, command: str, include_unchanged: bool = True) -> typing.List[CommandDiff]:
+        return self.diffs_from_arguments(self.parse_query_arguments(command), include_unchanged)
+
+    def reload(self, full: bool = False) -> ReloadReport:
+        return self.database.reload(full=full)
+
+    def close(self):
+        with self._executor_lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False)
+        self.database.close()
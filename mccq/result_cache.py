@@ -0,0 +1,95 @@
+import collections
+import threading
+import time
+import typing
+
+from mccq.instrumentation import METRICS
+from mccq.query_arguments import QueryArguments
+from mccq.typedefs import TupleOfStrings
+
+# a normalized version + query arguments pair
+ResultCacheKey = typing.Tuple[str, tuple]
+
+# how many times everything, and then a particular version, had been invalidated at some point
+Generation = typing.Tuple[int, int]
+
+
+class ResultCache:
+    def __init__(self, max_size: int = 256, ttl: float = None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits: int = 0
+        self.misses: int = 0
+        self._entries: typing.MutableMapping[ResultCacheKey, typing.Tuple[float, TupleOfStrings]] = \
+            collections.OrderedDict()
+        self._lock = threading.Lock()
+
+        # bumped on every invalidation, so that results rendered from a tree that has since been replaced aren't kept
+        self._cleared: int = 0
+        self._invalidated: typing.Dict[str, int] = {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def make_key(version: str, arguments: QueryArguments) -> ResultCacheKey:
+        return version, arguments.normalized()
+
+    def get(self, version: str, arguments: QueryArguments) -> typing.Union[TupleOfStrings, None]:
+        key = self.make_key(version, arguments)
+        with self._lock:
+            entry = self._entries.get(key)
+
+            # treat expired entries as missing
+            if entry and entry[0] is not None and entry[0] < time.monotonic():
+                del self._entries[key]
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                if METRICS.enabled:
+                    METRICS.count('result_cache.misses')
+                return None
+
+            # mark as most recently used
+            self._entries.move_to_end(key)
+            self.hits += 1
+            if METRICS.enabled:
+                METRICS.count('result_cache.hits')
+            return entry[1]
+
+    def generation(self, version: str) -> Generation:
+        # taken before rendering results to put, so that `put` can tell whether they might be stale
+        with self._lock:
+            return self._cleared, self._invalidated.get(version, 0)
+
+    def put(self, version: str, arguments: QueryArguments, commands: TupleOfStrings, generation: Generation = None):
+        key = self.make_key(version, arguments)
+        expires = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            # the version was invalidated while these were being rendered, so they may come from the old tree
+            if generation is not None and generation != (self._cleared, self._invalidated.get(version, 0)):
+                if METRICS.enabled:
+                    METRICS.count('result_cache.stale_puts')
+                return
+
+            self._entries[key] = (expires, commands)
+            self._entries.move_to_end(key)
+
+            # evict least recently used entries
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, version: str = None):
+        with self._lock:
+            # no version means everything is stale
+            if version is None:
+                self._cleared += 1
+                self._entries.clear()
+            else:
+                self._invalidated[version] = self._invalidated.get(version, 0) + 1
+                for key in [key for key in self._entries if key[0] == version]:
+                    del self._entries[key]
+
+    def stats(self) -> typing.Dict[str, int]:
+        return {'size': len(self._entries), 'hits': self.hits, 'misses': self.misses}
@@ -0,0 +1,164 @@
+import http.server
+import json
+import logging
+import socketserver
+import threading
+import typing
+import urllib.parse
+
+from mccq import errors
+from mccq.instrumentation import METRICS, PrometheusSink
+from mccq.query_manager import QueryManager
+
+log = logging.getLogger(__name__)
+
+# a status code and a json-serializable body
+Response = typing.Tuple[int, dict]
+
+
+class QueryService:
+    def __init__(self, query_manager: QueryManager):
+        self.query_manager = query_manager
+
+        # queries keep running during a reload, but only one reload happens at a time
+        self._reload_lock = threading.Lock()
+
+    def warm(self):
+        # load the default versions up front so that the first queries don't pay for it
+        for version in self.query_manager.show_versions:
+            try:
+                self.query_manager.database.get(version)
+            except Exception:
+                log.warning(f'Failed to load version {version}', exc_info=True)
+
+    def query(self, command: str) -> Response:
+        try:
+            arguments = self.query_manager.parse_query_arguments(command)
+            if arguments.diff:
+                # the unchanged commands are usually most of them, and whoever asks for a diff wants the changes
+                diffs = self.query_manager.diffs_from_arguments(arguments, include_unchanged=False)
+                return 200, {'diffs': [diff.as_dict() for diff in diffs]}
+            results = self.query_manager.results_from_arguments(arguments)
+
+        except errors.MCCQError as ex:
+            return 400, {'error': str(ex)}
+
+        except Exception as ex:
+            log.exception(f'Failed to query: {command}')
+            return 500, {'error': str(ex)}
+
+        return 200, {'results': {version: list(commands) for version, commands in results.items()}}
+
+    def reload(self, full: bool = False) -> Response:
+        with self._reload_lock:
+            report = self.query_manager.reload(full=full)
+            self.warm()
+        return 200, {'reloaded': report.as_dict()}
+
+    def handle(self, request: dict) -> Response:
+        # requests look like `{"command": "execute"}` or `{"reload": true}`, with `"full": true` to reload everything
+        if not isinstance(request, dict):
+            return 400, {'error': 'Expected a json object'}
+
+        if request.get('reload'):
+            return self.reload(full=bool(request.get('full')))
+
+        command = request.get('command')
+        if not isinstance(command, str):
+            return 400, {'error': 'Expected a command string'}
+
+        return self.query(command)
+
+
+class QueryHTTPRequestHandler(http.server.BaseHTTPRequestHandler):
+    # keep connections open between requests, and don't let small responses sit in the send buffer
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    server: 'QueryHTTPServer'
+
+    def _send(self, status: int, content_type: str, data: bytes):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _respond(self, status: int, body: dict):
+        self._send(status, 'application/json', json.dumps(body).encode())
+
+    def do_GET(self):
+        # `GET /query?q=execute` and `GET /metrics`
+        url = urllib.parse.urlsplit(self.path)
+        if url.path == '/query':
+            commands = urllib.parse.parse_qs(url.query).get('q')
+            if not commands:
+                self._respond(400, {'error': 'Expected a q parameter'})
+            else:
+                self._respond(*self.server.service.query(commands[0]))
+        elif url.path == '/metrics' and METRICS.find_sink(PrometheusSink):
+            self._send(200, 'text/plain; version=0.0.4', METRICS.find_sink(PrometheusSink).render().encode())
+        else:
+            self._respond(404, {'error': 'Not found'})
+
+    def do_POST(self):
+        # `POST /query {"command": "execute"}` and `POST /reload` (`POST /reload?full=1` to reload everything)
+        url = urllib.parse.urlsplit(self.path)
+        length = int(self.headers.get('Content-Length') or 0)
+        data = self.rfile.read(length) if length else b''
+
+        if url.path == '/reload':
+            full = urllib.parse.parse_qs(url.query).get('full', ['0'])[0] not in ('', '0', 'false')
+            self._respond(*self.server.service.reload(full=full))
+
+        elif url.path == '/query':
+            try:
+                request = json.loads(data.decode('utf8'))
+            except ValueError:
+                self._respond(400, {'error': 'Invalid json'})
+            else:
+                self._respond(*self.server.service.handle(request))
+
+        else:
+            self._respond(404, {'error': 'Not found'})
+
+    def log_message(self, format: str, *args):
+        log.debug(f'{self.address_string()} {format % args}')
+
+
+class QueryHTTPServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: typing.Tuple[str, int], service: QueryService):
+        self.service = service
+        super().__init__(address, QueryHTTPRequestHandler)
+
+
+class QuerySocketRequestHandler(socketserver.StreamRequestHandler):
+    server: 'QuerySocketServer'
+
+    def handle(self):
+        # one json request per line, answered by one json response per line
+        for line in self.rfile:
+            if not line.strip():
+                continue
+
+            try:
+                request = json.loads(line.decode('utf8'))
+            except ValueError:
+                status, body = 400, {'error': 'Invalid json'}
+            else:
+                status, body = self.server.service.handle(request)
+
+            body['status'] = status
+            self.wfile.write(json.dumps(body).encode() + b'\n')
+            self.wfile.flush()
+
+
+if hasattr(socketserver, 'UnixStreamServer'):
+    class QuerySocketServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+        daemon_threads = True
+
+        def __init__(self, path: str, service: QueryService):
+            self.service = service
+            super().__init__(path, QuerySocketRequestHandler)
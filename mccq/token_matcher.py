@@ -0,0 +1,141 @@
+import functools
+import re
+import typing
+
+from mccq.instrumentation import METRICS
+from mccq.node.data_node import DataNode
+
+# maximum number of distinct (token, flags) pairs to keep compiled
+TOKEN_MATCHER_CACHE_SIZE = 1024
+
+# characters that carry special meaning in a regex pattern
+REGEX_METACHARACTERS = frozenset('.^$*+?{}[]\\|()')
+
+# tokens that match every child, regardless of key
+MATCH_ALL_TOKENS = frozenset(('.', '*'))
+
+
+class TokenMatcher:
+    def __init__(self, token: str, flags: int = re.IGNORECASE):
+        self.token = token
+        self.flags = flags
+        self.ignorecase = bool(flags & re.IGNORECASE)
+        self.pattern: typing.Pattern = None
+        self.error: re.error = None
+
+        # how keys are normalized before being compared to the literal
+        self._fold = str.lower if self.ignorecase else str
+
+        # whether the token matches every key
+        self.match_all = False
+
+        # the literal part of the token, if it can be matched without the regex engine
+        self.literal: str = None
+
+        # whether the literal must appear at the start and/or end of the key
+        self.anchored_start = False
+        self.anchored_end = False
+
+        # special case: dot (or star) matches all
+        if token in MATCH_ALL_TOKENS:
+            self.match_all = True
+            self.matches = self._matches_all
+            return
+
+        literal = token
+
+        # a trailing `.*` never changes whether a search succeeds, so ignore it
+        if literal.endswith('.*'):
+            literal = literal[:-2]
+
+        if literal.startswith('^'):
+            literal = literal[1:]
+            self.anchored_start = True
+
+        if literal.endswith('$'):
+            literal = literal[:-1]
+            self.anchored_end = True
+
+        # only plain ascii tokens are safe to match by lowercase comparison
+        if not REGEX_METACHARACTERS.intersection(literal):
+            try:
+                literal.encode('ascii')
+            except UnicodeEncodeError:
+                literal = None
+        else:
+            literal = None
+
+        if literal is not None:
+            self.literal = literal.lower() if self.ignorecase else literal
+            if self.anchored_start and self.anchored_end:
+                self.matches = self._matches_exact
+            elif self.anchored_start:
+                self.matches = self._matches_prefix
+            elif self.anchored_end:
+                self.matches = self._matches_suffix
+            else:
+                self.matches = self._matches_substring
+
+        # everything else goes through the (compiled) regex engine
+        else:
+            self.anchored_start = self.anchored_end = False
+            try:
+                self.pattern = re.compile(token, flags)
+                self.matches = self._matches_pattern
+            # defer invalid patterns until they are actually used, in case the query never gets that deep
+            except re.error as ex:
+                self.error = ex
+                self.matches = self._matches_invalid
+
+    @property
+    def matches_every_key(self) -> bool:
+        # not just `.` and `*`, but also tokens like `.*` and `^` whose literal part is empty
+        return self.match_all or (self.literal == '' and not (self.anchored_start and self.anchored_end))
+
+    def _matches_all(self, key: str) -> bool:
+        return True
+
+    def _matches_exact(self, key: str) -> bool:
+        return self._fold(key) == self.literal
+
+    def _matches_prefix(self, key: str) -> bool:
+        return self._fold(key).startswith(self.literal)
+
+    def _matches_suffix(self, key: str) -> bool:
+        return self._fold(key).endswith(self.literal)
+
+    def _matches_substring(self, key: str) -> bool:
+        return self.literal in self._fold(key)
+
+    def _matches_pattern(self, key: str) -> bool:
+        return self.pattern.search(key) is not None
+
+    def _matches_invalid(self, key: str) -> bool:
+        raise self.error
+
+    def select(self, node: DataNode) -> typing.Tuple[DataNode, ...]:
+        # anchored literals can be resolved through the child index with a bisect rather than a scan
+        if node.child_index and self.anchored_start and self.ignorecase:
+            if METRICS.enabled:
+                METRICS.count('query.index_lookups')
+            if self.anchored_end:
+                return node.child_index.with_key(self.literal)
+            return node.child_index.with_prefix(self.literal)
+        return self.filter(node.children)
+
+    def filter(self, nodes: typing.Iterable[DataNode]) -> typing.Tuple[DataNode, ...]:
+        if self.match_all:
+            return tuple(nodes)
+        if METRICS.enabled:
+            nodes = tuple(nodes)
+            METRICS.count('query.regex_evaluations' if self.pattern else 'query.literal_comparisons', len(nodes))
+        matches = self.matches
+        selected = tuple(node for node in nodes if matches(node.key))
+        if METRICS.enabled:
+            METRICS.count('query.matches', len(selected))
+        return selected
+
+
+@functools.lru_cache(maxsize=TOKEN_MATCHER_CACHE_SIZE)
+def get_token_matcher(token: str, flags: int = re.IGNORECASE) -> TokenMatcher:
+    return TokenMatcher(token, flags)
@@ -0,0 +1,228 @@
+import array
+import hashlib
+import logging
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import typing
+
+from mccq import errors
+from mccq.node.data_node import DataNode
+from mccq.node.node_pool import DIGEST_SIZE, NodePool, tree_digests
+
+log = logging.getLogger(__name__)
+
+# bump whenever the layout below changes, so that old files are ignored rather than misread
+TREE_CACHE_FORMAT_VERSION = 1
+
+TREE_CACHE_MAGIC = b'MCCQTREE'
+
+# magic, format version, node count, string count, string blob size, payload digest
+HEADER = struct.Struct(f'<8sIIII{DIGEST_SIZE}s')
+
+# one record per node, in pre-order: key, type, parser, redirect (string indices), flags, child count
+NODE_FIELDS = 6
+
+# string index used for missing values
+NO_STRING = 0xFFFFFFFF
+
+FLAG_RELEVANT = 1
+
+# the first few strings identify what the file was built from
+META_STRINGS = 3
+
+
+def _as_uint32_array(buffer: memoryview) -> typing.Sequence[int]:
+    # map little-endian data directly where possible, otherwise copy and swap
+    if sys.byteorder == 'little':
+        return buffer.cast('I')
+    values = array.array('I')
+    values.frombytes(buffer)
+    values.byteswap()
+    return values
+
+
+def _uint32_bytes(values: typing.List[int]) -> bytes:
+    data = array.array('I', values)
+    if sys.byteorder != 'little':
+        data.byteswap()
+    return data.tobytes()
+
+
+class TreeCache:
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def path_for(self, version: str, uri: str) -> str:
+        name = hashlib.sha1(f'{uri}\0{version}'.encode()).hexdigest()
+        return os.path.join(self.directory, f'{name}.bin')
+
+    def store(self, version: str, uri: str, fingerprint: str, root: DataNode):
+        digests = {id(node): digest for node, digest in tree_digests(root)}
+
+        strings: typing.Dict[str, int] = {}
+
+        def string_index(value: typing.Union[str, None]) -> int:
+            if value is None:
+                return NO_STRING
+            index = strings.get(value)
+            if index is None:
+                index = strings[value] = len(strings)
+            return index
+
+        for meta in (uri, version, fingerprint):
+            strings[meta] = len(strings)
+
+        records = []
+        node_digests = []
+
+        def write_node(node: DataNode):
+            records.extend((
+                string_index(node.key),
+                string_index(node.type),
+                string_index(node.parser),
+                string_index('|'.join(node.redirect) if node.redirect else None),
+                FLAG_RELEVANT if node.relevant else 0,
+                len(node.children),
+            ))
+            node_digests.append(digests[id(node)])
+            for child in node.children:
+                write_node(child)
+
+        write_node(root)
+
+        encoded = [value.encode() for value in strings]
+        offsets = [0]
+        for value in encoded:
+            offsets.append(offsets[-1] + len(value))
+        blob = b''.join(encoded)
+
+        # keep the node records aligned
+        blob += b'\0' * (-len(blob) % 4)
+
+        payload = b''.join((_uint32_bytes(offsets), blob, _uint32_bytes(records), b''.join(node_digests)))
+        header = HEADER.pack(
+            TREE_CACHE_MAGIC, TREE_CACHE_FORMAT_VERSION, len(node_digests), len(strings), len(blob),
+            hashlib.blake2b(payload, digest_size=DIGEST_SIZE).digest())
+
+        # write to a temporary file first so that readers never see a partial file
+        os.makedirs(self.directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as fp:
+                fp.write(header)
+                fp.write(payload)
+            os.replace(temp_path, self.path_for(version, uri))
+        except:
+            os.unlink(temp_path)
+            raise
+
+    def _read(self, data: memoryview, version: str, uri: str, fingerprint: str, node_pool: NodePool) -> DataNode:
+        if len(data) < HEADER.size:
+            raise errors.InvalidTreeCache(version, 'truncated header')
+
+        magic, format_version, node_count, string_count, blob_size, payload_digest = HEADER.unpack_from(data)
+
+        if magic != TREE_CACHE_MAGIC:
+            raise errors.InvalidTreeCache(version, 'bad magic')
+
+        if format_version != TREE_CACHE_FORMAT_VERSION:
+            raise errors.InvalidTreeCache(version, f'unsupported format version {format_version}')
+
+        offsets_size = (string_count + 1) * 4
+        records_size = node_count * NODE_FIELDS * 4
+        digests_size = node_count * DIGEST_SIZE
+
+        if len(data) != HEADER.size + offsets_size + blob_size + records_size + digests_size:
+            raise errors.InvalidTreeCache(version, 'unexpected size')
+
+        if hashlib.blake2b(data[HEADER.size:], digest_size=DIGEST_SIZE).digest() != payload_digest:
+            raise errors.InvalidTreeCache(version, 'corrupt payload')
+
+        start = HEADER.size
+        offsets = _as_uint32_array(data[start:start + offsets_size])
+        start += offsets_size
+        blob = data[start:start + blob_size]
+        start += blob_size
+        records = _as_uint32_array(data[start:start + records_size])
+        start += records_size
+        digests = data[start:start + digests_size]
+
+        # views into the mapped file must all be released before it can be closed
+        views = tuple(view for view in (offsets, blob, records, digests) if isinstance(view, memoryview))
+
+        try:
+            strings = tuple(
+                sys.intern(str(blob[offsets[index]:offsets[index + 1]], 'utf8')) for index in range(string_count))
+
+            # make sure the file was built from the same source
+            if strings[:META_STRINGS] != (uri, version, fingerprint):
+                raise errors.InvalidTreeCache(version, 'stale')
+
+            def get_string(index: int) -> typing.Union[str, None]:
+                return None if index == NO_STRING else strings[index]
+
+            def link(fields: tuple, children: typing.List[DataNode]) -> DataNode:
+                key, type_, parser, redirect, flags, _ = fields
+                redirect = get_string(redirect)
+                redirect = tuple(sys.intern(target) for target in redirect.split('|')) if redirect else None
+                return DataNode.link(
+                    get_string(key), get_string(type_), get_string(parser), redirect, bool(flags & FLAG_RELEVANT),
+                    tuple(children))
+
+            # records are in pre-order, so build each node as soon as all of its children have been built
+            root = None
+            pending: typing.List[typing.Tuple[int, tuple, typing.List[DataNode]]] = []
+
+            for index in range(node_count):
+                if root is not None:
+                    raise errors.InvalidTreeCache(version, 'unexpected node count')
+
+                fields = tuple(records[index * NODE_FIELDS:(index + 1) * NODE_FIELDS])
+                pending.append((index, fields, []))
+
+                while pending and len(pending[-1][2]) == pending[-1][1][-1]:
+                    node_index, node_fields, children = pending.pop()
+
+                    if node_pool is None:
+                        node = link(node_fields, children)
+                    else:
+                        digest = bytes(digests[node_index * DIGEST_SIZE:(node_index + 1) * DIGEST_SIZE])
+                        node = node_pool.intern(digest, lambda: link(node_fields, children))
+
+                    if pending:
+                        pending[-1][2].append(node)
+                    else:
+                        root = node
+
+            if root is None:
+                raise errors.InvalidTreeCache(version, 'unexpected node count')
+
+            return root
+
+        finally:
+            for view in views:
+                view.release()
+
+    def load(
+            self, version: str, uri: str, fingerprint: str,
+            node_pool: NodePool = None) -> typing.Union[DataNode, None]:
+        path = self.path_for(version, uri)
+
+        try:
+            with open(path, 'rb') as fp:
+                with mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                    data = memoryview(mapped)
+                    try:
+                        return self._read(data, version, uri, fingerprint, node_pool)
+                    finally:
+                        data.release()
+
+        except FileNotFoundError:
+            return None
+
+        except Exception:
+            log.info(f'Ignoring unusable tree cache for version {version}: {path}', exc_info=True)
+            return None
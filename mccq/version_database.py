@@ -1,4 +1,7 @@
+import concurrent.futures
+import itertools
 import logging
+import threading
 import typing
 import urllib.parse
 
@@ -8,7 +11,9 @@ from mccq.data_loader.filesystem_data_loader import FilesystemDataLoader
 from mccq.data_loader.internet_data_loader import InternetDataLoader
 from mccq.data_parser.abc.data_parser import DataParser
 from mccq.data_parser.v1_data_parser import V1DataParser
+from mccq.instrumentation import METRICS
 from mccq.node.data_node import DataNode
+from mccq.tree_cache import TreeCache
 from mccq.typedefs import IterableOfStrings, TupleOfStrings
 
 log = logging.getLogger(__name__)
@@ -16,6 +21,9 @@ log = logging.getLogger(__name__)
 LoaderGeneric = typing.Union[str, DataLoader]
 ParserGeneric = typing.Union[str, DataParser]
 
+# called with the version whose root node was replaced, or `None` if every version was
+InvalidationListener = typing.Callable[[typing.Optional[str]], None]
+
 LOADER_MAP = {
     'file': FilesystemDataLoader,
     'http': InternetDataLoader,
@@ -28,16 +36,56 @@ PARSER_MAP = {
 
 DATA_FILE_TAIL = ('generated', 'reports', 'commands.json')
 
+# rough size of a data node along with its share of strings, child tuples and indices, used to estimate tree sizes
+ESTIMATED_BYTES_PER_NODE = 200
+
+
+def estimate_tree_bytes(root_node: DataNode) -> int:
+    # subtrees shared with other versions are counted in full, since they stay alive as long as any version uses them
+    count = 0
+    pending = [root_node]
+    while pending:
+        node = pending.pop()
+        count += 1
+        pending.extend(node.children)
+    return count * ESTIMATED_BYTES_PER_NODE
+
+
+class ReloadReport:
+    def __init__(
+            self, changed: TupleOfStrings = (), unchanged: TupleOfStrings = (), failed: TupleOfStrings = (),
+            full: bool = False):
+        # versions that were thrown away to be rebuilt from source the next time they're used
+        self.changed = changed
+        # versions whose source is the same as when they were loaded, which were kept as they are
+        self.unchanged = unchanged
+        # versions whose source couldn't be checked, which were also kept as they are
+        self.failed = failed
+        # whether everything was thrown away regardless of whether it changed
+        self.full = full
 
-def find_loader(obj, uri) -> DataLoader:
+    def as_dict(self) -> dict:
+        return dict(vars(self))
+
+    def __str__(self) -> str:
+        if self.full:
+            return f'Reloaded everything ({len(self.changed)} versions)'
+        parts = [f'{name}: {", ".join(versions)}' for name, versions in (
+            ('changed', self.changed), ('unchanged', self.unchanged), ('failed', self.failed)) if versions]
+        return '\n'.join(parts) or 'Nothing to reload'
+
+
+def find_loader(obj, uri, options: dict = None) -> DataLoader:
+    # options are passed along to loaders that are instantiated here, like timeouts for internet loaders
+    options = options or {}
     try:
         if obj is None:
             # auto-detect database source to instantiate an appropriate loader
             uri_scheme = urllib.parse.urlparse(uri).scheme
-            return LOADER_MAP.get(uri_scheme, LOADER_MAP['file'])()
+            return LOADER_MAP.get(uri_scheme, LOADER_MAP['file'])(**options)
 
         elif isinstance(obj, str):
-            return LOADER_MAP[obj]()
+            return LOADER_MAP[obj](**options)
 
         elif isinstance(obj, DataLoader):
             return obj
@@ -65,60 +113,393 @@ def find_parser(obj) -> DataParser:
 class VersionDatabase:
     def __init__(
             self, uri: str, loader: LoaderGeneric = None, parser: ParserGeneric = None, version_file: str = None,
-            whitelist: IterableOfStrings = ()):
+            whitelist: IterableOfStrings = (), tree_cache: TreeCache = None, streaming: bool = False,
+            max_versions: int = None, max_bytes: int = None, pinned: IterableOfStrings = (),
+            loader_options: dict = None):
         self.uri = uri
         self.version_file = version_file
         self.whitelist = set(whitelist)
-        self.loader: DataLoader = find_loader(loader, uri)
+        self.loader_options = loader_options
+        self.loader: DataLoader = find_loader(loader, uri, loader_options)
         self.parser: DataParser = find_parser(parser)
+        self.tree_cache = tree_cache
+        self.streaming = streaming
+        self._invalidation_listeners: typing.List[InvalidationListener] = []
+
+        # these are never modified in place, only replaced while holding the lock, so readers always see a consistent
+        # snapshot without having to lock anything themselves
         self._node_cache: typing.Dict[str, DataNode] = {}
         self._version_cache: typing.Dict[str, str] = {}
+        self._lock = threading.RLock()
+
+        # bumped on every reload, so that loads that started before it can't bring back what it threw away
+        self._generation = 0
+
+        # memory budget: the least recently used versions are evicted to stay within it, except for pinned ones
+        self.max_versions = max_versions
+        self.max_bytes = max_bytes
+        self.pinned: typing.Set[str] = set(pinned)
+        self.evictions: int = 0
+        # how many evicted versions had to be loaded again
+        self.reloads: int = 0
+        self._tree_bytes: typing.Dict[str, int] = {}
+        self._last_used: typing.Dict[str, int] = {}
+        self._clock = itertools.count()
+        self._evicted: typing.Set[str] = set()
+
+        # what the source of each loaded version looked like when it was loaded, so reloads can skip unchanged ones
+        self._source_fingerprints: typing.Dict[str, str] = {}
+
+        # versions that are being loaded right now, so that anything else asking for them waits for the same load
+        self._loading: typing.Dict[typing.Tuple[int, str], concurrent.futures.Future] = {}
+        self._prefetch_executor: concurrent.futures.ThreadPoolExecutor = None
+
+        # after a reload, trees on disk are not trusted again until they've been rebuilt from source
+        self._bypass_tree_cache = False
+        self._rebuilt_versions: typing.Set[str] = set()
+
+    def add_invalidation_listener(self, listener: InvalidationListener):
+        self._invalidation_listeners.append(listener)
+
+    def _invalidate(self, version: str = None):
+        for listener in self._invalidation_listeners:
+            listener(version)
 
     def _load_actual_version(self, version: str) -> str:
         return self.loader.load_version((self.uri, version, self.version_file))
 
-    def _load(self, version: str):
+    def _fingerprint(self, version: str, components: TupleOfStrings) -> typing.Union[str, None]:
+        try:
+            return self.loader.fingerprint(components)
+        except Exception:
+            log.info(f'Failed to fingerprint version {version}', exc_info=True)
+
+    def _loaded_fingerprint(self, components: TupleOfStrings) -> typing.Union[str, None]:
+        try:
+            return self.loader.loaded_fingerprint(components)
+        except Exception:
+            log.info(f'Failed to get fingerprint of loaded data: {components}', exc_info=True)
+
+    def _version_fingerprint(self, actual_version: typing.Union[str, None]) -> typing.Union[str, None]:
+        # the next best thing when the loader can't tell whether the data changed, such as servers without an etag
+        if self.version_file and actual_version:
+            return f'version:{actual_version}'
+
+    def _check_source(self, version: str) -> typing.Union[str, None]:
+        # unlike `_fingerprint` this lets errors through, so that reloads can tell them apart from unknown fingerprints
         components = (self.uri, version, *DATA_FILE_TAIL)
+        fingerprint = self.loader.fingerprint(components)
+        if fingerprint is None and self.version_file:
+            fingerprint = self._version_fingerprint(self._load_actual_version(version))
+        return fingerprint
+
+    def _load_from_tree_cache(self, version: str, fingerprint: str) -> typing.Union[DataNode, None]:
+        if self._bypass_tree_cache and version not in self._rebuilt_versions:
+            return None
+
+        # share subtrees with versions that were parsed normally, if the parser supports it
+        node_pool = getattr(self.parser, 'node_pool', None)
+
+        cached = self.tree_cache.load(version, self.uri, fingerprint, node_pool)
+
+        # cached trees get the same treatment as parsed ones, such as redirects being resolved up front
+        return self.parser.index(cached) if cached is not None else None
 
+    def _store_in_tree_cache(self, version: str, fingerprint: str, root_node: DataNode, generation: int):
         try:
-            actual_version = self._load_actual_version(version)
-            self._version_cache[version] = actual_version
-            log.info(f'Loading commands for version {version} (actual {actual_version}) with components: {components}')
-        except:
-            log.info(f'Loading commands for version {version} with components: {components}')
+            self.tree_cache.store(version, self.uri, fingerprint, root_node)
+            with self._lock:
+                if generation == self._generation:
+                    self._rebuilt_versions.add(version)
+        except Exception:
+            log.warning(f'Failed to write tree cache for version {version}', exc_info=True)
 
+    def _load_raw(self, version: str, components: TupleOfStrings) -> DataNode:
         # load data from source
         try:
-            raw = self.loader.load(components)
+            if METRICS.enabled:
+                with METRICS.timer('database.load'):
+                    raw = self.loader.load(components)
+            else:
+                raw = self.loader.load(components)
+        except Exception as ex:
+            raise errors.LoaderFailure(version) from ex
+
+        # parse data
+        try:
+            if METRICS.enabled:
+                with METRICS.timer('database.parse'):
+                    return self.parser.parse(raw)
+            return self.parser.parse(raw)
+        except Exception as ex:
+            raise errors.ParserFailure(version) from ex
+
+    def _load_streamed(self, version: str, components: TupleOfStrings) -> DataNode:
+        # open a stream from source
+        try:
+            stream = self.loader.open(components)
         except Exception as ex:
             raise errors.LoaderFailure(version) from ex
 
-        # parse and insert data
+        # parse data as it arrives, which includes most of the time spent loading it
         try:
-            parsed = self.parser.parse(raw)
+            with stream:
+                if METRICS.enabled:
+                    with METRICS.timer('database.parse'):
+                        return self.parser.parse_stream(stream)
+                return self.parser.parse_stream(stream)
         except Exception as ex:
             raise errors.ParserFailure(version) from ex
 
-        self.put(version, parsed)
+    def _load(self, version: str, generation: int) -> DataNode:
+        components = (self.uri, version, *DATA_FILE_TAIL)
+
+        actual_version = None
+        try:
+            actual_version = self._load_actual_version(version)
+            with self._lock:
+                if generation == self._generation:
+                    self._version_cache = {**self._version_cache, version: actual_version}
+            log.info(f'Loading commands for version {version} (actual {actual_version}) with components: {components}')
+        except:
+            log.info(f'Loading commands for version {version} with components: {components}')
+
+        # the tree cache needs a fingerprint before loading, taken up front so that if the source changes in the
+        # meantime the next reload picks it up again; otherwise it's whatever loading revealed along the way
+        fingerprint = self._fingerprint(version, components) if self.tree_cache is not None else None
+
+        # skip loading and parsing altogether if there's an up-to-date tree on disk
+        if fingerprint:
+            cached = self._load_from_tree_cache(version, fingerprint)
+            if cached is not None:
+                log.info(f'Loaded commands for version {version} from tree cache')
+                if METRICS.enabled:
+                    METRICS.count('tree_cache.hits')
+                self._put(version, cached, generation, fingerprint)
+                return cached
+            if METRICS.enabled:
+                METRICS.count('tree_cache.misses')
+
+        parsed = self._load_streamed(version, components) if self.streaming else self._load_raw(version, components)
+
+        if fingerprint:
+            self._store_in_tree_cache(version, fingerprint, parsed, generation)
+
+        source_fingerprint = fingerprint or self._loaded_fingerprint(components) \
+            or self._version_fingerprint(actual_version)
+        self._put(version, parsed, generation, source_fingerprint)
+        return parsed
+
+    def _load_once(self, version: str) -> DataNode:
+        with self._lock:
+            # another thread may have finished loading it in the meantime
+            root_node = self._node_cache.get(version)
+            if root_node is not None:
+                return root_node
+
+            generation = self._generation
+            key = (generation, version)
+            future = self._loading.get(key)
+            loading_here = future is None
+            if loading_here:
+                future = self._loading[key] = concurrent.futures.Future()
+
+        if not loading_here:
+            log.debug(f'Waiting for version {version} to finish loading')
+            return future.result()
+
+        try:
+            log.info(f'Loading version {version} into cache')
+            root_node = self._load(version, generation)
+            future.set_result(root_node)
+            return root_node
+
+        except BaseException as ex:
+            future.set_exception(ex)
+            raise
+
+        finally:
+            with self._lock:
+                del self._loading[key]
+
+    def _prefetch(self, version: str) -> DataNode:
+        try:
+            return self.get(version)
+        except Exception as ex:
+            log.warning(f'Failed to prefetch version {version}: {ex}')
+            raise
+
+    def prefetch(self, versions: IterableOfStrings, max_workers: int = None) \
+            -> typing.Dict[str, concurrent.futures.Future]:
+        # load versions in the background; anything that asks for one of them in the meantime waits for the same load
+        versions = tuple(dict.fromkeys(self.filter_versions(tuple(versions))))
+        # the executor is created, used and shut down under the lock, so that concurrent prefetches share one and none
+        # of them submits to one that `close` just shut down
+        with self._lock:
+            if self._prefetch_executor is None:
+                self._prefetch_executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=max_workers, thread_name_prefix='mccq-prefetch')
+            return {version: self._prefetch_executor.submit(self._prefetch, version) for version in versions}
+
+    def is_loaded(self, version: str) -> bool:
+        return version in self._node_cache
 
     def get_actual_version(self, version: str) -> str:
         return self._version_cache.get(version)
 
-    def reload(self):
-        self._node_cache = {}
-        self._version_cache = {}
+    def _reload_everything(self) -> ReloadReport:
+        # swap everything out at once; queries that are already running keep the trees they started with
+        with self._lock:
+            changed = tuple(self._node_cache)
+            self._generation += 1
+            self._node_cache = {}
+            self._version_cache = {}
+            self._bypass_tree_cache = True
+            self._rebuilt_versions = set()
+            self._tree_bytes = {}
+            self._last_used = {}
+            self._evicted = set()
+            self._source_fingerprints = {}
+        self._invalidate()
+        return ReloadReport(changed=changed, full=True)
+
+    def reload(self, full: bool = False) -> ReloadReport:
+        # only throw away versions whose source changed since they were loaded, unless asked to throw away everything
+        if full:
+            return self._reload_everything()
+
+        snapshot = self.snapshot()
+        loaded_fingerprints = self._source_fingerprints
+
+        changed, unchanged, failed = [], [], []
+        for version in snapshot:
+            try:
+                fingerprint = self._check_source(version)
+            except Exception:
+                log.warning(f'Failed to check version {version} for changes, keeping it as it is', exc_info=True)
+                failed.append(version)
+                continue
+            # a version that couldn't be fingerprinted when it was loaded can't be shown to be unchanged
+            if fingerprint is not None and fingerprint == loaded_fingerprints.get(version):
+                unchanged.append(version)
+            else:
+                changed.append(version)
+
+        with self._lock:
+            # anything loaded or evicted while sources were being checked is left alone or dropped, respectively
+            kept = {
+                version: root_node for version, root_node in self._node_cache.items()
+                if version not in changed and root_node is snapshot.get(version, root_node)}
+            dropped = [version for version in self._node_cache if version not in kept]
+            # loads that started before this can't be trusted to have seen the changes
+            self._generation += 1
+            self._node_cache = kept
+            self._version_cache = {v: a for v, a in self._version_cache.items() if v in kept}
+            self._source_fingerprints = {v: f for v, f in self._source_fingerprints.items() if v in kept}
+            for version in dropped:
+                self._tree_bytes.pop(version, None)
+                self._last_used.pop(version, None)
+
+        for version in dropped:
+            self._invalidate(version)
+
+        log.info(f'Reloaded {len(dropped)} changed version(s), kept {len(unchanged)} unchanged')
+        return ReloadReport(changed=tuple(changed), unchanged=tuple(unchanged), failed=tuple(failed))
 
     def get(self, version: str) -> DataNode:
         log.debug(f'Getting root node for version {version}')
-        if version not in self._node_cache:
-            log.info(f'Loading version {version} into cache')
-            self._load(version)
-        return self._node_cache[version]
+        root_node = self._node_cache.get(version)
+        if root_node is None:
+            root_node = self._load_once(version)
+        # only keep track of recency when there's a budget that needs it
+        if self.max_versions is not None or self.max_bytes is not None:
+            self._last_used[version] = next(self._clock)
+        return root_node
 
-    def put(self, version: str, root_node: DataNode):
+    def _put(self, version: str, root_node: DataNode, generation: int, source_fingerprint: str = None):
         if self.whitelist and version not in self.whitelist:
             raise errors.VersionNotWhitelisted(version)
-        self._node_cache[version] = root_node
+        with self._lock:
+            # the database was reloaded while this was loading, so hand it to whoever asked but don't keep it
+            if generation != self._generation:
+                log.info(f'Discarding version {version} loaded before a reload')
+                return
+            self._node_cache = {**self._node_cache, version: root_node}
+            self._source_fingerprints = {**self._source_fingerprints, version: source_fingerprint}
+            self._last_used[version] = next(self._clock)
+            if self.max_bytes is not None:
+                self._tree_bytes[version] = estimate_tree_bytes(root_node)
+            if version in self._evicted:
+                self._evicted.discard(version)
+                self.reloads += 1
+                if METRICS.enabled:
+                    METRICS.count('database.reloads')
+            evicted = self._evict(keep=version)
+        self._invalidate(version)
+        for evicted_version in evicted:
+            self._invalidate(evicted_version)
+
+    def _over_budget(self, node_cache: typing.Dict[str, DataNode]) -> bool:
+        if self.max_versions is not None and len(node_cache) > self.max_versions:
+            return True
+        if self.max_bytes is not None and sum(self._tree_bytes.get(v, 0) for v in node_cache) > self.max_bytes:
+            return True
+        return False
+
+    def _evict(self, keep: str) -> typing.List[str]:
+        # drop the least recently used versions until everything fits, never touching pinned ones
+        # (or the one that was just loaded, which is about to be used)
+        node_cache = dict(self._node_cache)
+        evicted = []
+        while self._over_budget(node_cache):
+            candidates = [v for v in node_cache if v != keep and v not in self.pinned]
+            if not candidates:
+                break
+            version = min(candidates, key=lambda v: self._last_used.get(v, -1))
+            log.info(f'Evicting version {version} to stay within the memory budget')
+            del node_cache[version]
+            self._tree_bytes.pop(version, None)
+            self._last_used.pop(version, None)
+            self._evicted.add(version)
+            evicted.append(version)
+        if evicted:
+            self._node_cache = node_cache
+            self.evictions += len(evicted)
+            if METRICS.enabled:
+                METRICS.count('database.evictions', len(evicted))
+        return evicted
+
+    def put(self, version: str, root_node: DataNode):
+        self._put(version, root_node, self._generation)
+
+    def cache_stats(self) -> typing.Dict[str, int]:
+        snapshot = self.snapshot()
+        return {
+            'loaded': len(snapshot),
+            'pinned': len(self.pinned.intersection(snapshot)),
+            'estimated_bytes': sum(estimate_tree_bytes(root) for root in snapshot.values()),
+            'evictions': self.evictions,
+            'reloads': self.reloads,
+        }
+
+    def snapshot(self) -> typing.Mapping[str, DataNode]:
+        # every version loaded at this moment, unaffected by later loads and reloads
+        return self._node_cache
+
+    def node_stats(self) -> typing.Dict[str, int]:
+        # count every node reference across all loaded trees, and how many distinct nodes they actually point to
+        subtree_sizes: typing.Dict[int, int] = {}
+
+        def count(node: DataNode) -> int:
+            size = subtree_sizes.get(id(node))
+            if size is None:
+                size = subtree_sizes[id(node)] = 1 + sum(count(child) for child in node.children)
+            return size
+
+        snapshot = self.snapshot()
+        total = sum(count(root) for root in snapshot.values())
+        unique = len(subtree_sizes)
+        return {'versions': len(snapshot), 'total': total, 'unique': unique, 'shared': total - unique}
 
     def filter_versions(self, requested_versions: IterableOfStrings) -> TupleOfStrings:
         # if no whitelist, everything is valid
@@ -128,3 +509,10 @@ class VersionDatabase:
         available_versions = set(requested_versions).intersection(self.whitelist)
         # make sure to preserve order
         return tuple(version for version in requested_versions if version in available_versions)
+
+    def close(self):
+        with self._lock:
+            if self._prefetch_executor is not None:
+                self._prefetch_executor.shutdown(wait=False)
+                self._prefetch_executor = None
+        self.loader.close()
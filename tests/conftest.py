@@ -0,0 +1,18 @@
+import pytest
+
+from benchmarks.synthetic_tree import TreeShape, write_database
+from mccq.query_manager import QueryManager
+from mccq.version_database import VersionDatabase
+
+
+@pytest.fixture(scope='session')
+def synthetic_database(tmp_path_factory) -> str:
+    # a few small generated versions, each a mutation of the one before
+    directory = str(tmp_path_factory.mktemp('database'))
+    write_database(directory, versions=3, shape=TreeShape(width=30, depth=5), seed=1)
+    return directory
+
+
+@pytest.fixture
+def query_manager(synthetic_database) -> QueryManager:
+    return QueryManager(database=VersionDatabase(uri=synthetic_database), show_versions=['synthetic1'])
@@ -0,0 +1,75 @@
+import random
+import typing
+
+import pytest
+
+from mccq.argument_parser import ArgumentParserError, ArgumentParserExit
+from mccq.fast_argument_parser import FastArgumentParser, FastPathUnavailable
+from mccq.query_manager import QueryManager
+
+ARGUMENT_PARSER = QueryManager.ARGUMENT_PARSER
+
+# pieces of command strings, covering flags, options (valid and not) in every form and plain tokens
+FLAGS = ('-t', '--showtypes', '-e', '--explode', '-d', '--diff', '--profile', '-te', '-ted', '-et')
+OPTIONS = (
+    ('-c', '5'), ('-c', 'x'), ('--capacity', '0'), ('-v', '1.13'), ('--version', '18w01a'), ('-l', '3'),
+    ('--limit', '-1'), ('--type', 'block_pos'), ('--arg', 'targets'), ('--literal', 'add'), ('--literal', ''))
+TOKENS = (
+    'say', 'tag', 'targets', '.', '.*', '^a', 'execute', '-', '--', '-x', '--unknown', '--show', '-c', '-tc', "'a b'")
+
+
+def random_option(rng: random.Random) -> typing.List[str]:
+    option, value = rng.choice(OPTIONS)
+    form = rng.randrange(3)
+    if form == 0:
+        return [option, value]
+    if option.startswith('--'):
+        return [f'{option}={value}']
+    return [f'{option}{value}'] if form == 1 else [f'-t{option[1:]}{value}']
+
+
+def random_command(rng: random.Random) -> str:
+    parts = []
+    for _ in range(rng.randrange(6)):
+        kind = rng.randrange(3)
+        if kind == 0:
+            parts.append(rng.choice(FLAGS))
+        elif kind == 1:
+            parts.extend(random_option(rng))
+        else:
+            parts.append(rng.choice(TOKENS))
+    if rng.random() < 0.7:
+        parts.extend(rng.choice(TOKENS[:7]) for _ in range(rng.randrange(1, 4)))
+    return ' '.join(parts)
+
+
+def parse_slow(command: str) -> typing.Union[dict, None]:
+    # the real parser, or `None` if it refuses the command
+    try:
+        return vars(ARGUMENT_PARSER.parse_args(FastArgumentParser.split(command)))
+    except (ArgumentParserError, ArgumentParserExit):
+        return None
+
+
+@pytest.mark.parametrize('command', (
+        'say', '-t tag targets add', '-tc5 execute', '-c 5 -v a -v b --type=block_pos', '--arg targets',
+        '--literal= tag', '-e -l 3 .', "-v 'a b' say", '-d -v a -v b .', '--profile execute . .'))
+def test_common_commands_take_the_fast_path(command):
+    fast = FastArgumentParser(ARGUMENT_PARSER)
+    assert vars(fast._parse_fast(fast.split(command))) == parse_slow(command)
+
+
+def test_fast_path_matches_real_parser():
+    rng = random.Random(0)
+    fast = FastArgumentParser(ARGUMENT_PARSER)
+    taken = 0
+    for _ in range(5000):
+        command = random_command(rng)
+        try:
+            namespace = fast._parse_fast(fast.split(command))
+        except FastPathUnavailable:
+            continue
+        taken += 1
+        assert vars(namespace) == parse_slow(command), command
+    # make sure the comparison actually covers a good share of the cases
+    assert taken > 1000
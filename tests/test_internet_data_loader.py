@@ -0,0 +1,156 @@
+import contextlib
+import gzip
+import http.server
+import json
+import threading
+import typing
+import urllib.error
+
+import pytest
+
+from mccq.data_loader.internet_data_loader import GzipStream, InternetDataLoader
+from mccq.version_database import DATA_FILE_TAIL, VersionDatabase
+
+COMMANDS = {'type': 'root', 'children': {'say': {'type': 'literal', 'children': {
+    'message': {'type': 'argument', 'parser': 'minecraft:message', 'executable': True}}}}}
+
+
+class Site:
+    # what the server serves, and what it was asked for
+    def __init__(self):
+        self.files: typing.Dict[str, bytes] = {}
+        self.failures: typing.Dict[str, int] = {}
+        self.compress = True
+        self.requests: typing.List[typing.Tuple[str, str, typing.Dict[str, str]]] = []
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    site: Site = None
+
+    def log_message(self, *args):
+        pass
+
+    def _respond(self, status: int, headers: typing.Dict[str, str] = None, body: bytes = b'', send_body: bool = True):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if send_body:
+            self.wfile.write(body)
+
+    def _serve(self, send_body: bool):
+        site = self.site
+        site.requests.append((self.command, self.path, dict(self.headers)))
+        if site.failures.get(self.path):
+            site.failures[self.path] -= 1
+            self._respond(503, send_body=send_body)
+            return
+        content = site.files.get(self.path)
+        if content is None:
+            self._respond(404, send_body=send_body)
+            return
+        etag = f'"{hash(content)}"'
+        if self.headers.get('If-None-Match') == etag:
+            self._respond(304, {'ETag': etag}, send_body=False)
+            return
+        headers = {'ETag': etag}
+        if site.compress and 'gzip' in self.headers.get('Accept-Encoding', ''):
+            content = gzip.compress(content)
+            headers['Content-Encoding'] = 'gzip'
+        self._respond(200, headers, content, send_body=send_body)
+
+    def do_GET(self):
+        self._serve(send_body=True)
+
+    def do_HEAD(self):
+        self._serve(send_body=False)
+
+
+@pytest.fixture
+def site() -> Site:
+    site = Site()
+    site.files['/v1/version.txt'] = b'1.0\n'
+    site.files['/v1/' + '/'.join(DATA_FILE_TAIL)] = json.dumps(COMMANDS).encode('utf8')
+    handler = type('SiteHandler', (Handler,), {'site': site})
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    site.uri = f'http://127.0.0.1:{server.server_address[1]}'
+    thread = threading.Thread(target=server.serve_forever, kwargs={'poll_interval': 0.05}, daemon=True)
+    thread.start()
+    yield site
+    server.shutdown()
+    server.server_close()
+
+
+def test_load_uses_gzip_and_conditional_requests(site):
+    components = (site.uri, 'v1', *DATA_FILE_TAIL)
+    with contextlib.closing(InternetDataLoader()) as loader:
+        assert loader.load(components) == COMMANDS
+        assert loader.load(components) == COMMANDS
+    (_, _, first), (_, _, second) = site.requests
+    assert first['Accept-Encoding'] == 'gzip'
+    assert 'If-None-Match' not in first
+    assert second['If-None-Match']
+
+
+def test_cached_bodies_are_bounded(site):
+    components = (site.uri, 'v1', *DATA_FILE_TAIL)
+    with contextlib.closing(InternetDataLoader(max_cached_bytes=0)) as loader:
+        assert loader.load(components) == COMMANDS
+        assert loader.load(components) == COMMANDS
+    assert not any('If-None-Match' in headers for _, _, headers in site.requests)
+
+
+def test_server_errors_are_retried(site):
+    components = (site.uri, 'v1', 'version.txt')
+    site.failures['/v1/version.txt'] = 2
+    with contextlib.closing(InternetDataLoader(retries=2, backoff=0)) as loader:
+        assert loader.load_version(components) == '1.0'
+    site.failures['/v1/version.txt'] = 2
+    with contextlib.closing(InternetDataLoader(retries=1, backoff=0)) as loader:
+        with pytest.raises(urllib.error.HTTPError):
+            loader.load_version(components)
+
+
+def test_fingerprint_follows_etag(site):
+    components = (site.uri, 'v1', *DATA_FILE_TAIL)
+    with contextlib.closing(InternetDataLoader()) as loader:
+        fingerprint = loader.fingerprint(components)
+        assert fingerprint == loader.fingerprint(components)
+        site.files['/v1/' + '/'.join(DATA_FILE_TAIL)] = b'{}'
+        assert fingerprint != loader.fingerprint(components)
+
+
+def test_database_passes_loader_options(site):
+    database = VersionDatabase(uri=site.uri, version_file='version.txt', loader_options={'timeout': 5.0, 'retries': 0})
+    with contextlib.closing(database):
+        assert database.loader.timeout == 5.0
+        assert database.loader.retries == 0
+        assert [child.key for child in database.get('v1').children] == ['say']
+        assert database.get_actual_version('v1') == '1.0'
+
+
+@pytest.mark.parametrize('compress', (True, False))
+def test_open_streams_the_response(site, compress):
+    site.compress = compress
+    with contextlib.closing(InternetDataLoader()) as loader:
+        with loader.open((site.uri, 'v1', *DATA_FILE_TAIL)) as stream:
+            assert isinstance(stream, GzipStream) == compress
+            assert json.loads(stream.read().decode('utf8')) == COMMANDS
+    assert stream.closed
+
+
+def test_database_streams_versions(site):
+    with contextlib.closing(VersionDatabase(uri=site.uri, streaming=True)) as database:
+        assert [child.key for child in database.get('v1').children] == ['say']
+
+
+@pytest.mark.parametrize('streaming', (False, True))
+def test_loads_fingerprint_from_the_response(site, streaming):
+    with contextlib.closing(VersionDatabase(uri=site.uri, streaming=streaming)) as database:
+        database.get('v1')
+        assert not any(method == 'HEAD' for method, _, _ in site.requests)
+        assert database.loader.loaded_fingerprint((site.uri, 'v1', *DATA_FILE_TAIL)) \
+            == database.loader.fingerprint((site.uri, 'v1', *DATA_FILE_TAIL))
+        assert database.reload().unchanged == ('v1',)
@@ -0,0 +1,73 @@
+import gc
+import typing
+import weakref
+
+import pytest
+
+from mccq.node.data_node import DataNode
+from mccq.node.node_index import ARGUMENTS, LITERALS, NodeIndex
+from mccq.token_matcher import get_token_matcher
+
+LOOKUPS = ('--arg .', '--literal .', '--type .', '--arg ^a', '-c 3 --arg ^a', '-e --literal ^b', '--literal ^a .')
+
+
+def found_commands(node: DataNode, matches: typing.Callable[[DataNode], bool], command: str = '') -> typing.List[str]:
+    # commands of matching nodes in the order they're walked, leaving out any below another matching node
+    commands = []
+    for child in node.children:
+        child_command = child.extend_command(command)
+        if matches(child):
+            commands.append(child_command)
+        else:
+            commands.extend(found_commands(child, matches, child_command))
+    return commands
+
+
+@pytest.mark.parametrize('kind, type_, token', (
+        (ARGUMENTS, 'argument', 'a'),
+        (ARGUMENTS, 'argument', '^b'),
+        (LITERALS, 'literal', '.'),
+        (LITERALS, 'literal', 'o$'),
+))
+def test_query_tree_matches_walk(query_manager, kind, type_, token):
+    root = query_manager.database.get('synthetic1')
+    matcher = get_token_matcher(token)
+    positions = NodeIndex.for_root(root).find(((kind, matcher),))
+    query_tree = NodeIndex.query_tree(root, positions)
+
+    expected = found_commands(root, lambda node: node.type == type_ and matcher.matches(node.key.lower()))
+    assert expected
+    assert [command for _, command in query_tree.leaves_with_commands()] == expected
+
+
+def test_index_does_not_keep_root_alive(query_manager):
+    root = query_manager.database.get('synthetic1')
+    NodeIndex.for_root(root)
+    root_ref = weakref.ref(root)
+    del root
+    query_manager.database.reload(full=True)
+    gc.collect()
+    assert root_ref() is None
+
+
+@pytest.mark.parametrize('query', LOOKUPS)
+def test_diff_matches_set_difference(query_manager, query):
+    diff, = query_manager.diffs(f'-d -v synthetic1 -v synthetic2 {query}')
+    old = query_manager.results(f'-v synthetic1 {query}')['synthetic1']
+    new = query_manager.results(f'-v synthetic2 {query}')['synthetic2']
+    assert set(diff.removed) == set(old) - set(new)
+    assert set(diff.added) == set(new) - set(old)
+    assert set(diff.unchanged) == set(old) & set(new)
+
+
+@pytest.mark.parametrize('query', LOOKUPS)
+def test_grouping_matches_results(query_manager, query):
+    versions = '-v synthetic1 -v synthetic2 -v synthetic3'
+    results = query_manager.results(f'{versions} {query}')
+    groups = {}
+    for group, line in query_manager.stream_grouped_results(f'{versions} {query}'):
+        groups.setdefault(group, []).append(line)
+    assert [version for group in groups for version in group] == list(results)
+    for group, lines in groups.items():
+        for version in group:
+            assert list(results[version]) == lines
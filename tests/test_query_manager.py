@@ -0,0 +1,50 @@
+import os
+import shutil
+
+import pytest
+
+from mccq.batch import QueryBatch
+from mccq.query_manager import QueryManager
+from mccq.version_database import VersionDatabase
+
+
+def test_failed_versions_break_up_groups(synthetic_database, tmp_path):
+    # `b` can't be loaded, and `a` and `c` are the same
+    for version in ('a', 'c'):
+        shutil.copytree(os.path.join(synthetic_database, 'synthetic1'), str(tmp_path / version))
+    (tmp_path / 'b').mkdir()
+    query_manager = QueryManager(VersionDatabase(uri=str(tmp_path)), show_versions=['a', 'b', 'c'])
+
+    groups = [versions for versions, _ in query_manager.stream_grouped_results('.')]
+    assert groups and set(groups) == {('a',), ('c',)}
+    assert groups.index(('c',)) > groups.index(('a',))
+
+
+def rendered_nodes(root) -> int:
+    # how many nodes hold on to what they render as
+    count, pending = 0, [root]
+    while pending:
+        node = pending.pop()
+        count += node._rendered is not None
+        pending.extend(node.children)
+    return count
+
+
+def test_only_default_renderings_are_cached(query_manager):
+    root = query_manager.database.get('synthetic1')
+    query_manager.results('. .')
+    cached = rendered_nodes(root)
+    assert cached
+    for capacity in (0, 3, 40, 64):
+        for showtypes in ('', '-t'):
+            query_manager.results(f'{showtypes} -c {capacity} . .')
+    assert rendered_nodes(root) == cached
+
+
+@pytest.mark.parametrize(
+    'query', ('.', '-l 5 .', '-t . .', '-c 0 -l 3 . .', 'execute . .', '--arg ^t', '-l 2 --arg ^t'))
+def test_batches_match_regular_queries(query_manager, query):
+    expected = query_manager.results(query)
+    batched = {
+        result['version']: tuple(result['commands']) for result in QueryBatch(query_manager, [query]).results()}
+    assert batched == expected
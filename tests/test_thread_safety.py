@@ -0,0 +1,185 @@
+import concurrent.futures
+import threading
+import time
+import typing
+from unittest import mock
+
+from mccq.data_loader.filesystem_data_loader import FilesystemDataLoader
+from mccq.query_manager import QueryManager
+from mccq.result_cache import ResultCache
+from mccq.typedefs import TupleOfStrings
+from mccq.version_database import DATA_FILE_TAIL, VersionDatabase
+
+QUERIES = ('.', '-c 3 . .', 'execute . .', '-t --arg ^a', '-l 5 -e .')
+VERSIONS = '-v synthetic1 -v synthetic2'
+
+
+class CountingLoader(FilesystemDataLoader):
+    # counts loads, and takes its time over them so that they overlap
+    def __init__(self, delay: float = 0.0):
+        super().__init__()
+        self.delay = delay
+        self.loads: typing.Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def load(self, components: TupleOfStrings) -> dict:
+        with self._lock:
+            self.loads[components[1]] = self.loads.get(components[1], 0) + 1
+        time.sleep(self.delay)
+        return super().load(components)
+
+
+def run_threads(count: int, target: typing.Callable[[], None]):
+    errors = []
+
+    def run():
+        try:
+            target()
+        except Exception as ex:
+            errors.append(ex)
+
+    threads = [threading.Thread(target=run) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors, errors
+
+
+def test_concurrent_gets_load_once(synthetic_database):
+    loader = CountingLoader(delay=0.05)
+    database = VersionDatabase(uri=synthetic_database, loader=loader)
+    barrier = threading.Barrier(16)
+    roots = []
+
+    def get():
+        barrier.wait()
+        roots.append(database.get('synthetic1'))
+
+    run_threads(16, get)
+    assert loader.loads == {'synthetic1': 1}
+    assert all(root is roots[0] for root in roots)
+
+
+def test_queries_during_reloads(synthetic_database):
+    expected = {
+        query: QueryManager(VersionDatabase(uri=synthetic_database), show_versions=()).results(f'{VERSIONS} {query}')
+        for query in QUERIES}
+
+    loader = CountingLoader()
+    query_manager = QueryManager(
+        VersionDatabase(uri=synthetic_database, loader=loader), show_versions=(),
+        result_cache=ResultCache(max_size=64), max_workers=4)
+    done = threading.Event()
+    reloads = []
+
+    def query():
+        while not done.is_set():
+            for query in QUERIES:
+                assert query_manager.results(f'{VERSIONS} {query}') == expected[query]
+                streamed = {}
+                for version, command in query_manager.stream_results(f'{VERSIONS} {query}'):
+                    streamed.setdefault(version, []).append(command)
+                assert {version: tuple(commands) for version, commands in streamed.items()} == expected[query]
+
+    def reload():
+        # alternate between throwing everything away and only what changed, which means fingerprinting every version
+        deadline = time.monotonic() + 1.0
+        while time.monotonic() < deadline:
+            reloads.append(query_manager.reload(full=len(reloads) % 2 == 0))
+            time.sleep(0.01)
+        done.set()
+
+    reloader = threading.Thread(target=reload)
+    reloader.start()
+    try:
+        try:
+            run_threads(8, query)
+        finally:
+            done.set()
+            reloader.join()
+
+        # once the versions are loaded again, a reload that only throws away what changed keeps them both
+        query_manager.results(f'{VERSIONS} .')
+        report = query_manager.reload()
+    finally:
+        query_manager.close()
+
+    assert set(report.unchanged) == {'synthetic1', 'synthetic2'}
+    assert loader.fingerprint((synthetic_database, 'synthetic1', *DATA_FILE_TAIL)) is not None
+
+    # nothing changed on disk, so no reload found a changed version or failed to check one
+    assert len(reloads) > 10
+    assert not any(report.changed or report.failed for report in reloads if not report.full)
+
+    # every version is loaded at most once per reload, plus once before the first
+    assert all(loads <= len(reloads) + 1 for loads in loader.loads.values())
+
+
+def test_concurrent_queries_share_one_executor(synthetic_database):
+    query_manager = QueryManager(VersionDatabase(uri=synthetic_database), show_versions=(), max_workers=4)
+    barrier = threading.Barrier(16)
+
+    def query():
+        barrier.wait()
+        query_manager.results(f'{VERSIONS} .')
+
+    executor_class = concurrent.futures.ThreadPoolExecutor
+
+    def create_executor(*args, **kwargs):
+        # take long enough that every thread gets a chance to create its own, if nothing stops them
+        time.sleep(0.05)
+        return executor_class(*args, **kwargs)
+
+    with mock.patch('concurrent.futures.ThreadPoolExecutor', side_effect=create_executor) as created:
+        try:
+            run_threads(16, query)
+        finally:
+            query_manager.close()
+    assert created.call_count == 1
+
+def test_concurrent_prefetches_share_one_executor(synthetic_database):
+    database = VersionDatabase(uri=synthetic_database)
+    barrier = threading.Barrier(16)
+    futures = []
+
+    def prefetch():
+        barrier.wait()
+        futures.extend(database.prefetch(('synthetic1', 'synthetic2'), max_workers=2).values())
+
+    executor_class = concurrent.futures.ThreadPoolExecutor
+
+    def create_executor(*args, **kwargs):
+        time.sleep(0.05)
+        return executor_class(*args, **kwargs)
+
+    with mock.patch('concurrent.futures.ThreadPoolExecutor', side_effect=create_executor) as created:
+        try:
+            run_threads(16, prefetch)
+            concurrent.futures.wait(futures)
+        finally:
+            database.close()
+    assert created.call_count == 1
+    assert all(future.exception() is None for future in futures)
+
+
+def test_results_rendered_across_a_reload_are_not_cached(synthetic_database):
+    query_manager = QueryManager(
+        VersionDatabase(uri=synthetic_database), show_versions=['synthetic1'], result_cache=ResultCache())
+    commands_for_version = query_manager.commands_for_version
+
+    def reload_midway(version, arguments):
+        # the tree is replaced after rendering has started from the old one
+        commands = iter(commands_for_version(version, arguments))
+        yield next(commands)
+        query_manager.reload(full=True)
+        yield from commands
+
+    query_manager.commands_for_version = reload_midway
+    query_manager.results('.')
+    list(query_manager.stream_results('. .'))
+    assert len(query_manager.result_cache) == 0
+
+    query_manager.commands_for_version = commands_for_version
+    query_manager.results('.')
+    assert len(query_manager.result_cache) == 1
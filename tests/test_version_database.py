@@ -0,0 +1,59 @@
+import os
+import shutil
+import typing
+from unittest import mock
+
+import pytest
+
+from mccq.data_loader.filesystem_data_loader import FilesystemDataLoader
+from mccq.node.redirect_graph import RedirectGraph
+from mccq.tree_cache import TreeCache
+from mccq.typedefs import TupleOfStrings
+from mccq.version_database import DATA_FILE_TAIL, VersionDatabase
+
+
+class FingerprintCountingLoader(FilesystemDataLoader):
+    # counts how often the whole file is fingerprinted, rather than hashed as it's loaded
+    def __init__(self):
+        super().__init__()
+        self.fingerprints: typing.List[TupleOfStrings] = []
+
+    def fingerprint(self, components: TupleOfStrings) -> str:
+        self.fingerprints.append(components)
+        return super().fingerprint(components)
+
+
+@pytest.mark.parametrize('streaming', (False, True))
+def test_loads_fingerprint_what_they_read(synthetic_database, tmp_path, streaming):
+    shutil.copytree(os.path.join(synthetic_database, 'synthetic1'), str(tmp_path / 'synthetic1'))
+    components = (str(tmp_path), 'synthetic1', *DATA_FILE_TAIL)
+    loader = FingerprintCountingLoader()
+    database = VersionDatabase(uri=str(tmp_path), loader=loader, streaming=streaming)
+
+    database.get('synthetic1')
+    assert not loader.fingerprints
+    assert loader.loaded_fingerprint(components) == FilesystemDataLoader().fingerprint(components)
+
+    # reloads compare against what was read, which is still up to date
+    assert database.reload().unchanged == ('synthetic1',)
+
+    with open(os.path.join(*components), 'a') as fp:
+        fp.write('\n')
+    assert loader.loaded_fingerprint(components) is None
+    assert database.reload().changed == ('synthetic1',)
+
+
+def test_cached_trees_are_indexed_like_parsed_ones(synthetic_database, tmp_path):
+    tree_cache = TreeCache(str(tmp_path))
+    parsed = VersionDatabase(uri=synthetic_database, tree_cache=tree_cache).get('synthetic1')
+
+    # a database of its own, so that nothing is shared with the tree that was parsed, which it mustn't parse again
+    database = VersionDatabase(uri=synthetic_database, tree_cache=tree_cache)
+    with mock.patch.object(database.parser, 'parse', side_effect=AssertionError('parsed instead of cached')):
+        cached = database.get('synthetic1')
+    assert cached is not parsed
+
+    # redirects are resolved and commands rendered up front all the same
+    assert RedirectGraph._graphs[cached]._targets.keys() == RedirectGraph._graphs[parsed]._targets.keys()
+    assert RedirectGraph._graphs[cached]._targets
+    assert all(child._rendered is not None for child in cached.children)